@@ -0,0 +1,205 @@
+import numpy as np
+import pandas as pd
+
+
+####################
+# Running Statistics
+####################
+# Kahan compensated running sum, the same summation pandas' groupby sum & mean use
+class RunningSum:
+    __slots__ = ['total', 'compensation']
+
+    def __init__(self, total=0.0):
+        self.total = total
+        self.compensation = 0.0
+
+    def add(self, value):
+        y = value - self.compensation
+        t = self.total + y
+        self.compensation = t - self.total - y
+        self.total = t
+
+    def remove(self, value):
+        self.add(-value)
+
+# Welford co-moments of an (x, y) pair: count, means, sums of squared deviations & the sum of co-deviations.
+# add() takes the exact steps pandas' DataFrame.corr takes per row, so appending rows keeps giving its result
+class Comoments:
+    __slots__ = ['n', 'mean_x', 'mean_y', 'm2_x', 'm2_y', 'c_xy']
+
+    def __init__(self, n=0, mean_x=0.0, mean_y=0.0, m2_x=0.0, m2_y=0.0, c_xy=0.0):
+        self.n = n
+        self.mean_x = mean_x
+        self.mean_y = mean_y
+        self.m2_x = m2_x
+        self.m2_y = m2_y
+        self.c_xy = c_xy
+
+    # Co-moments of whole arrays in two vectorized passes
+    @classmethod
+    def from_arrays(cls, x, y):
+        if len(x) == 0:
+            return cls()
+        mean_x, mean_y = x.mean(), y.mean()
+        dx, dy = x - mean_x, y - mean_y
+
+        return cls(len(x), float(mean_x), float(mean_y), float(dx @ dx), float(dy @ dy), float(dx @ dy))
+
+    # Folds in the co-moments of another, disjoint set of pairs (Chan et al.'s parallel update)
+    def merge(self, other):
+        if other.n == 0:
+            return
+        if self.n == 0:
+            self.__init__(other.n, other.mean_x, other.mean_y, other.m2_x, other.m2_y, other.c_xy)
+            return
+        n = self.n + other.n
+        dx = other.mean_x - self.mean_x
+        dy = other.mean_y - self.mean_y
+        self.mean_x += dx * other.n / n
+        self.mean_y += dy * other.n / n
+        self.m2_x += other.m2_x + dx * dx * self.n * other.n / n
+        self.m2_y += other.m2_y + dy * dy * self.n * other.n / n
+        self.c_xy += other.c_xy + dx * dy * self.n * other.n / n
+        self.n = n
+
+    def add(self, x, y):
+        self.n += 1
+        dx = x - self.mean_x
+        dy = y - self.mean_y
+        self.mean_x += 1 / self.n * dx
+        self.mean_y += 1 / self.n * dy
+        self.m2_x += (x - self.mean_x) * dx
+        self.m2_y += (y - self.mean_y) * dy
+        self.c_xy += (x - self.mean_x) * dy
+
+    # Undoes add(x, y) for a pair that was added before (in any order)
+    def remove(self, x, y):
+        if self.n <= 1:
+            self.__init__()
+            return
+        mean_x = self.mean_x - (x - self.mean_x) / (self.n - 1)
+        mean_y = self.mean_y - (y - self.mean_y) / (self.n - 1)
+        self.m2_x -= (x - self.mean_x) * (x - mean_x)
+        self.m2_y -= (y - self.mean_y) * (y - mean_y)
+        self.c_xy -= (x - self.mean_x) * (y - mean_y)
+        self.mean_x, self.mean_y = mean_x, mean_y
+        self.n -= 1
+
+    # Pearson correlation, NaN with fewer than two pairs or no variance like pandas
+    def correlation(self):
+        divisor = np.sqrt(self.m2_x * self.m2_y)
+        if self.n < 2 or divisor == 0:
+            return np.nan
+
+        return self.c_xy / divisor
+
+####################
+# Aggregate Engine
+####################
+# Keeps running aggregates over keyed rows (airlines): the row count, a sum of every column & the co-moments
+# of column pairs. Appending, correcting or removing a row updates them in O(1), independent of the number of
+# rows, so ingest doesn't need a full recompute. Rows' last values are kept so corrections can be undone.
+# Rows folded in with add_frame alone (e.g. streamed) have no keys: such an engine is only updated through
+# replace, with the row's previous values coming from the caller
+class AggregateEngine:
+    def __init__(self, columns, pairs=()):
+        self.columns = list(columns)
+        self.pairs = list(pairs)
+        self.n = 0
+        self.sums = {col: RunningSum() for col in self.columns}
+        self.comoments = {pair: Comoments() for pair in self.pairs}
+        self._base_keys = None
+        self._base_position = None
+        self._base_values = None
+        self._rows = {}
+        self.keyed = True
+
+    # Loads a whole frame at once, keyed by its key column. The sums are pandas' own groupby sums (of a
+    # single group), so means & totals come out exactly as groupby computes them over the same rows
+    @classmethod
+    def from_frame(cls, df, key, columns, pairs=()):
+        engine = cls(columns, pairs)
+        engine._base_values = engine.add_frame(df)
+        engine._base_keys = df[key].to_numpy()
+        engine.keyed = True
+
+        return engine
+
+    # Folds a frame of new rows (e.g. one chunk of a table streamed through) into the aggregates in vectorized
+    # steps & returns its values. Rows added this way aren't kept, so they can only be corrected or removed later
+    # through replace
+    def add_frame(self, df):
+        values = df[self.columns].to_numpy(dtype=float)
+        if len(values) == 0:
+            return values
+        self.keyed = False
+        sums = pd.DataFrame(values, columns=self.columns).groupby(np.zeros(len(values), dtype=int)).sum().iloc[0]
+        for col in self.columns:
+            self.sums[col].add(float(sums[col]))
+        for (x, y), comoments in self.comoments.items():
+            comoments.merge(Comoments.from_arrays(values[:, self.columns.index(x)], values[:, self.columns.index(y)]))
+        self.n += len(values)
+
+        return values
+
+    # Returns the values the engine holds for a key (None if it isn't part of the aggregates).
+    # The loaded frame's keys are only indexed once the first row is upserted or removed
+    def _values(self, key):
+        if key in self._rows:
+            return self._rows[key]
+        if self._base_keys is None:
+            return None
+        if self._base_position is None:
+            self._base_position = {k: i for i, k in enumerate(self._base_keys)}
+        if key in self._base_position:
+            return dict(zip(self.columns, self._base_values[self._base_position[key]].tolist()))
+
+        return None
+
+    def _apply(self, values, sign):
+        for col in self.columns:
+            if sign > 0:
+                self.sums[col].add(values[col])
+            else:
+                self.sums[col].remove(values[col])
+        for (x, y), comoments in self.comoments.items():
+            if sign > 0:
+                comoments.add(values[x], values[y])
+            else:
+                comoments.remove(values[x], values[y])
+        self.n += sign
+
+    # Adds a row, or replaces its values if the key is already included. values maps every column to a number
+    def upsert(self, key, values):
+        self.remove(key)
+        values = {col: float(values[col]) for col in self.columns}
+        self._apply(values, 1)
+        self._rows[key] = values
+
+    def remove(self, key):
+        if not self.keyed:
+            raise ValueError('rows added with add_frame have no keys, update them through replace')
+        values = self._values(key)
+        if values is None:
+            return
+        self._apply(values, -1)
+        self._rows[key] = None
+
+    # Replaces a row's previous values with values, either None for a row being added or removed. For an engine
+    # without keys, where the caller knows what the row held (e.g. from the table); keyed engines use upsert
+    def replace(self, previous, values):
+        if self.keyed:
+            raise ValueError('keyed rows are updated through upsert & remove')
+        if previous is not None:
+            self._apply({col: float(previous[col]) for col in self.columns}, -1)
+        if values is not None:
+            self._apply({col: float(values[col]) for col in self.columns}, 1)
+
+    def mean(self, col):
+        return self.sums[col].total / self.n if self.n else np.nan
+
+    def total(self, col):
+        return self.sums[col].total
+
+    def correlation(self, x, y):
+        return self.comoments[(x, y)].correlation()
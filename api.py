@@ -0,0 +1,107 @@
+import os
+from typing import List
+
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.middleware.wsgi import WSGIMiddleware
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, Field
+
+import app as dashboard
+import data_processing as dp
+
+
+# Most airlines one batch request may look up
+API_BATCH_LIMIT = int(os.environ.get('API_BATCH_LIMIT', 1000))
+# Most rows one ranking request may return
+API_PAGE_LIMIT = int(os.environ.get('API_PAGE_LIMIT', 1000))
+
+
+####################
+# Lookups
+####################
+# Every endpoint reads the same cached data_processing results the dashboard does. The first call may have to
+# build them, so they're read on the thread pool rather than on the event loop
+
+# Returns an airline's rates & counts as a dict of plain values (None for an unknown airline)
+def airline_stats(airline):
+    record = dp.get_airline_record(airline)
+
+    return None if record is None else {col: value.item() if hasattr(value, 'item') else value for col, value in record.items()}
+
+# Returns {'stats', 'competitors'} for each known airline & the unknown ones under 'missing'
+def batch_stats(airlines, k):
+    found, missing = {}, []
+    for airline in airlines:
+        stats = airline_stats(airline)
+        if stats is None:
+            missing.append(airline)
+        else:
+            found[airline] = {'stats': stats, 'competitors': dp.get_comp_airline(airline, k)}
+
+    return {'airlines': found, 'missing': missing}
+
+def period_stats():
+    return {
+        'means': dp.get_period_mean_data().to_dict('records'),
+        'totals': dp.get_period_total_perc_data().to_dict('records')
+    }
+
+####################
+# API
+####################
+class BatchRequest(BaseModel):
+    airlines: List[str]
+    k: int = Field(3, ge=1, le=100)
+
+api = FastAPI(title='Airline Safety API', default_response_class=ORJSONResponse)
+
+@api.get('/api/airlines/{airline}')
+async def get_airline(airline: str):
+    stats = await run_in_threadpool(airline_stats, airline)
+    if stats is None:
+        raise HTTPException(status_code=404, detail='Unknown airline')
+
+    return ORJSONResponse(stats)
+
+# The k airlines closest to the airline by ASK, closest first
+@api.get('/api/airlines/{airline}/competitors')
+async def get_competitors(airline: str, k: int = Query(3, ge=1, le=100)):
+    if await run_in_threadpool(dp.get_airline_record, airline) is None:
+        raise HTTPException(status_code=404, detail='Unknown airline')
+
+    return ORJSONResponse({'airline': airline, 'competitors': await run_in_threadpool(dp.get_comp_airline, airline, k)})
+
+# The k airlines with the most similar safety profile (ASK & every period's rates), most similar first
+@api.get('/api/airlines/{airline}/similar')
+async def get_similar(airline: str, k: int = Query(3, ge=1, le=100)):
+    if await run_in_threadpool(dp.get_airline_record, airline) is None:
+        raise HTTPException(status_code=404, detail='Unknown airline')
+
+    return ORJSONResponse({'airline': airline, 'similar': await run_in_threadpool(dp.get_similar_airlines, airline, k)})
+
+# Stats & competitors of many airlines in one request, e.g. instead of one callback request per airline
+@api.post('/api/airlines/batch')
+async def post_airline_batch(request: BatchRequest):
+    if len(request.airlines) > API_BATCH_LIMIT:
+        raise HTTPException(status_code=413, detail='At most {} airlines per batch'.format(API_BATCH_LIMIT))
+
+    return ORJSONResponse(await run_in_threadpool(batch_stats, request.airlines, request.k))
+
+# Mean rates & totals (with % of total) by period
+@api.get('/api/periods')
+async def get_periods():
+    return ORJSONResponse(await run_in_threadpool(period_stats))
+
+# Airlines ranked by the % change of a rate between the first & last period
+@api.get('/api/rankings/{metric}')
+async def get_ranking(metric: str, offset: int = Query(0, ge=0), limit: int = Query(100, ge=1), ascending: bool = False):
+    if metric not in dp.PERC_CHANGE_COLUMNS:
+        raise HTTPException(status_code=404, detail='Rankings are by {}'.format(' or '.join(dp.PERC_CHANGE_COLUMNS)))
+    table = await run_in_threadpool(dp.get_perc_change_table, metric)
+    rows = await run_in_threadpool(table.ranking, offset, min(limit, API_PAGE_LIMIT), ascending)
+
+    return ORJSONResponse({'metric': metric, 'total': len(table), 'rows': rows})
+
+# Everything else is the dashboard, served from its WSGI app on the thread pool
+api.mount('/', WSGIMiddleware(dashboard.server))
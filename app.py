@@ -1,19 +1,27 @@
 
 import dash
+import flask
 # import dash_core_components as dcc
 from dash import dcc
 # import dash_html_components as html
 from dash import html
+from dash import dash_table
 import dash_bootstrap_components as dbc
-from dash.dependencies import Input, Output, State
+from dash.dependencies import Input, Output, State, ClientsideFunction
+from dash.exceptions import PreventUpdate
 import data_processing as dp
+import snapshot
+from figure_cache import FigureCache
+from http_cache import PayloadCache
+import instrumentation
+import profiling
 import plotly.graph_objs as go
-
-
-####################
-# Dash App
-####################
-app = dash.Dash(external_stylesheets=[dbc.themes.BOOTSTRAP])
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import math
+import os
+import threading
+import time
 
 ####################
 # Navbar Component
@@ -45,22 +53,41 @@ def multiple_string_lines(title, threshold):
     else:
         return title
 
+# Short label of a period used in titles & headers, e.g. 85-99
+def period_short(period):
+    return period.code.replace('_', '-')
+
 ####################
 # Get Data
 ####################
-df = dp.get_data()
-df_long = dp.get_long_data()
-period_mean = dp.get_period_mean_data()
-period_total_perc = dp.get_period_total_perc_data()
-df_incidents = dp.get_formatted_incident_rate_perc_changed_by_airline_data()
-df_fatal = dp.get_formatted_fatal_rate_perc_changed_by_airline_data()
+# Data functions run in order before any figure is built, later ones reuse the frames memoized by earlier ones
+# Starts from the precomputed snapshot (see snapshot.py) when it was built from the current SQLite file
+DATA_FUNCTIONS = [
+    ('load_snapshot', lambda: snapshot.load_snapshot(dp.dataset)),
+    ('get_data', dp.get_data),
+    ('get_long_data', dp.get_long_data),
+    ('get_display_data', dp.get_display_data),
+    ('get_aggregates', lambda: dp.dataset.get_aggregates()),
+    ('get_correlations', lambda: dp.dataset.get_correlations()),
+    ('get_period_mean_data', dp.get_period_mean_data),
+    ('get_period_total_perc_data', dp.get_period_total_perc_data),
+    ('get_incident_rate_perc_change_table', lambda: dp.get_perc_change_table('incident_rate')),
+    ('get_fatal_accidents_rate_perc_change_table', lambda: dp.get_perc_change_table('fatal_accidents_rate')),
+    ('get_competitor_index', lambda: dp.dataset.get_competitor_index()),
+    ('get_airline_records', lambda: dp.dataset.get_airline_records())
+]
+# Data functions that hold the whole table in memory, skipped when the dataset streams it (the layout doesn't need them)
+FULL_TABLE_DATA_FUNCTIONS = {'load_snapshot', 'get_data', 'get_long_data', 'get_competitor_index', 'get_airline_records'}
+
+# The dashboard compares the first & last periods of the metric registry
+first_period, last_period = dp.PERIODS[0], dp.PERIODS[-1]
 
 ####################
 # Color Theme for Graphs
 ####################
 period_colors = {
-    '1985-1999': '#33626C',
-    '2000-2014': '#C1D6E2'
+    first_period.label: '#33626C',
+    last_period.label: '#C1D6E2'
 }
 
 other_colors = ['#5F5B6E', '#312932', '#458CA5', '#F6A941']
@@ -70,298 +97,437 @@ other_colors = ['#5F5B6E', '#312932', '#458CA5', '#F6A941']
 # Static Graphs
 ####################
 # Create indicator graph for incident rate with percent change from 85-99 to 00-14
-incident_rate_perc_change_indicator = dcc.Graph(
-    id = 'incident_rate_perc_change_indicator',
-    figure = {
-        'data': [
-            go.Indicator(
-                mode = "number+delta",
-                value = period_mean.loc[period_mean.period == '2000-2014', 'incident_rate'].max(),
-                delta = {
-                    'position': 'bottom',
-                    'relative': True,
-                    'reference': period_mean.loc[period_mean.period == '1985-1999', 'incident_rate'].max()
-                }
+def build_incident_rate_perc_change_indicator():
+    period_mean = dp.get_period_mean_data()
+
+    return dcc.Graph(
+        id = 'incident_rate_perc_change_indicator',
+        figure = {
+            'data': [
+                go.Indicator(
+                    mode = "number+delta",
+                    value = period_mean.loc[period_mean.period == last_period.label, 'incident_rate'].max(),
+                    delta = {
+                        'position': 'bottom',
+                        'relative': True,
+                        'reference': period_mean.loc[period_mean.period == first_period.label, 'incident_rate'].max()
+                    }
+                )
+            ],
+            'layout': go.Layout(
+                title = multiple_string_lines('{} Incidents Rate and % Change from {}'.format(last_period.label, first_period.label), 10),
+                height = 250
             )
-        ],
-        'layout': go.Layout(
-            title = multiple_string_lines('2000-2014 Incidents Rate and % Change from 1985-1999', 10),
-            height = 250
-        )
-    }
-)
+        }
+    )
 
 # Create indicator graph for fatal accidents rate with percent change from 85-99 to 00-14
-fatal_accidents_rate_perc_change_indicator = dcc.Graph(
-    id = 'fatal_accidents_rate_perc_change_indicator',
-    figure = {
-        'data': [
-            go.Indicator(
-                mode = "number+delta",
-                value = period_mean.loc[period_mean.period == '2000-2014', 'fatal_accidents_rate'].max(),
-                delta = {
-                    'position': 'bottom',
-                    'relative': True,
-                    'reference': period_mean.loc[period_mean.period == '1985-1999', 'fatal_accidents_rate'].max()
-                }
+def build_fatal_accidents_rate_perc_change_indicator():
+    period_mean = dp.get_period_mean_data()
+
+    return dcc.Graph(
+        id = 'fatal_accidents_rate_perc_change_indicator',
+        figure = {
+            'data': [
+                go.Indicator(
+                    mode = "number+delta",
+                    value = period_mean.loc[period_mean.period == last_period.label, 'fatal_accidents_rate'].max(),
+                    delta = {
+                        'position': 'bottom',
+                        'relative': True,
+                        'reference': period_mean.loc[period_mean.period == first_period.label, 'fatal_accidents_rate'].max()
+                    }
+                )
+            ],
+            'layout': go.Layout(
+                title = multiple_string_lines('{} Fatal Accidents Rate and % Change from {}'.format(last_period.label, first_period.label), 10),
+                height = 250
             )
-        ],
-        'layout': go.Layout(
-            title = multiple_string_lines('2000-2014 Fatal Accidents Rate and % Change from 1985-1999', 10),
-            height = 250
-        )
-    }
-)
+        }
+    )
 
 # Shows % of total stacked bar graph for two different accident types (incident & fatal)
-period_total_perc_stacked_bar_graph = dcc.Graph( \
-    id = 'period_total_perc',
-    figure = {
-        'data': [
-            go.Bar(
-                x = period_total_perc['period']
-                , y = period_total_perc['incidents']
-                , text = period_total_perc['display_incidents']
-                , textposition = 'auto'
-                , name = 'Non-fatal Accidents'
-                , marker_color = other_colors[2]
-            ),
-            go.Bar(
-                x = period_total_perc['period']
-                , y = period_total_perc['fatal_accidents']
-                , text = period_total_perc['display_fatal_accidents']
-                , textposition = 'auto'
-                , name = 'Fatal Accidents'
-                , marker_color = other_colors[3]
+def build_period_total_perc_stacked_bar_graph():
+    period_total_perc = dp.get_period_total_perc_data()
+
+    return dcc.Graph(
+        id = 'period_total_perc',
+        figure = {
+            'data': [
+                go.Bar(
+                    x = period_total_perc['period']
+                    , y = period_total_perc['incidents']
+                    , text = period_total_perc['display_incidents']
+                    , textposition = 'auto'
+                    , name = 'Non-fatal Accidents'
+                    , marker_color = other_colors[2]
+                ),
+                go.Bar(
+                    x = period_total_perc['period']
+                    , y = period_total_perc['fatal_accidents']
+                    , text = period_total_perc['display_fatal_accidents']
+                    , textposition = 'auto'
+                    , name = 'Fatal Accidents'
+                    , marker_color = other_colors[3]
+                )
+            ],
+            'layout': go.Layout (
+                title = multiple_string_lines('Number of Fatal Accidents vs Non-Fatal Incidents Between Two Periods', 15),
+                xaxis = dict (
+                    title = "Time Periods"
+                ),
+                yaxis = dict(
+                    title = "Incidents Rate (per trillion ASK)"
+                ),
+                hovermode = 'closest',
+                barmode = 'stack'
             )
-        ],
-        'layout': go.Layout (
-            title = multiple_string_lines('Number of Fatal Accidents vs Non-Fatal Incidents Between Two Periods', 15),
-            xaxis = dict (
-                title = "Time Periods"
-            ),
-            yaxis = dict(
-                title = "Incidents Rate (per trillion ASK)"
-            ),
-            hovermode = 'closest',
-            barmode = 'stack'
-        )
-    }
-)
+        }
+    )
 
 # Bar graph comparing the mean accident rate between 85-99 and 00-14
-period_accident_rate_bar_graph = dcc.Graph( \
-    id = 'period_incident_rate',
-    figure = {
-        'data': [
-            go.Bar(
-                x = period_mean.loc[period_mean.period == '1985-1999', 'period'],
-                y = period_mean.loc[period_mean.period == '1985-1999', 'incident_rate'],
-                text= "{:.2f}".format(period_mean.loc[period_mean.period == '1985-1999', 'incident_rate'].max()),
-                textposition='auto',
-                name = '1985-1999',
-                marker_color = period_colors['1985-1999'],
-                showlegend = False
-            ),
-            go.Bar(
-                x = period_mean.loc[period_mean.period == '2000-2014', 'period'],
-                y = period_mean.loc[period_mean.period == '2000-2014', 'incident_rate'],
-                text= "{:.2f}".format(period_mean.loc[period_mean.period == '2000-2014', 'incident_rate'].max()),
-                textposition='auto',
-                name = '2000-2014',
-                marker_color = period_colors['2000-2014'],
-                showlegend = False
+def build_period_accident_rate_bar_graph():
+    period_mean = dp.get_period_mean_data()
+
+    return dcc.Graph(
+        id = 'period_incident_rate',
+        figure = {
+            'data': [
+                go.Bar(
+                    x = period_mean.loc[period_mean.period == first_period.label, 'period'],
+                    y = period_mean.loc[period_mean.period == first_period.label, 'incident_rate'],
+                    text= "{:.2f}".format(period_mean.loc[period_mean.period == first_period.label, 'incident_rate'].max()),
+                    textposition='auto',
+                    name = first_period.label,
+                    marker_color = period_colors[first_period.label],
+                    showlegend = False
+                ),
+                go.Bar(
+                    x = period_mean.loc[period_mean.period == last_period.label, 'period'],
+                    y = period_mean.loc[period_mean.period == last_period.label, 'incident_rate'],
+                    text= "{:.2f}".format(period_mean.loc[period_mean.period == last_period.label, 'incident_rate'].max()),
+                    textposition='auto',
+                    name = last_period.label,
+                    marker_color = period_colors[last_period.label],
+                    showlegend = False
+                )
+            ],
+            'layout': go.Layout (
+                title = 'Incidents Rate {} vs {}'.format(first_period.label, last_period.label),
+                xaxis = dict (
+                    title = "Time Periods"
+                ),
+                yaxis = dict(
+                    title = "Incidents Rate (per trillion ASK)"
+                ),
+                hovermode = 'closest'
             )
-        ],
-        'layout': go.Layout (
-            title = 'Incidents Rate 1985-1999 vs 2000-2014',
-            xaxis = dict (
-                title = "Time Periods"
-            ),
-            yaxis = dict(
-                title = "Incidents Rate (per trillion ASK)"
-            ),
-            hovermode = 'closest'
-        )
-    }
-)
+        }
+    )
 
 # Bar graph comparing the mean fatal accidents rate between 85-99 and 00-14
-period_fatal_accidents_rate_bar_graph =   dcc.Graph( \
-      id = 'period_fatal_accidents_rate',
-      figure = {
-        'data': [
-            go.Bar(
-                x = period_mean.loc[period_mean.period == '1985-1999', 'period'],
-                y = period_mean.loc[period_mean.period == '1985-1999', 'fatal_accidents_rate'],
-                text= "{:.2f}".format(period_mean.loc[period_mean.period == '1985-1999', 'fatal_accidents_rate'].max()),
-                textposition='auto',
-                name = '1985-1999',
-                marker_color = period_colors['1985-1999'],
-                showlegend = False
-            ),
-            go.Bar(
-                x = period_mean.loc[period_mean.period == '2000-2014', 'period'],
-                y = period_mean.loc[period_mean.period == '2000-2014', 'fatal_accidents_rate'],
-                text= "{:.2f}".format(period_mean.loc[period_mean.period == '2000-2014', 'fatal_accidents_rate'].max()),
-                textposition='auto',
-                name = '2000-2014',
-                marker_color = period_colors['2000-2014'],
-                showlegend = False
-            )
-        ],
-        'layout': go.Layout(
-            title = 'Fatal Accidents Rate 1985-1999 vs 2000-2014',
-            xaxis = dict (
-                title = "Time Periods"
-            ),
-            yaxis = dict(
-                title = "Fatal Accidents Rate (per trillion ASK)"
-            ),
-            hovermode = 'closest'
-        )
-    }
-)
-
-# Tabular data showing a list of airlines & the corresponding percent change in its incident rate from 85-99 to 00-14 (sorted desc)
-airline_incident_perc_change_table = dcc.Graph(
-    id = 'airline_incident_perc_change_table',
-    figure = {
-        'data': [
-            go.Table(
-                header = dict(
-                    values = ['Airline', 'Incident Rate (85-99)', 'Incident Rate (00-14)', 'Incident Rate % Change'],
-                    line = dict(color='rgb(50,50,50)'),
-                    align = ['left'] * 2,
-                    font = dict( color = 'white', size=14),
-                    fill_color = 'royalblue'
+def build_period_fatal_accidents_rate_bar_graph():
+    period_mean = dp.get_period_mean_data()
+
+    return dcc.Graph(
+          id = 'period_fatal_accidents_rate',
+          figure = {
+            'data': [
+                go.Bar(
+                    x = period_mean.loc[period_mean.period == first_period.label, 'period'],
+                    y = period_mean.loc[period_mean.period == first_period.label, 'fatal_accidents_rate'],
+                    text= "{:.2f}".format(period_mean.loc[period_mean.period == first_period.label, 'fatal_accidents_rate'].max()),
+                    textposition='auto',
+                    name = first_period.label,
+                    marker_color = period_colors[first_period.label],
+                    showlegend = False
                 ),
-                cells = dict(
-                    values = [df_incidents.airline, df_incidents.incident_rate_85_99.round(2)
-                    , df_incidents.incident_rate_00_14.round(2), df_incidents['Incident Rate % Change']],
-                    align = ['left'] * 5,
-                    fill = dict(color='rgb(245,245,245)')
+                go.Bar(
+                    x = period_mean.loc[period_mean.period == last_period.label, 'period'],
+                    y = period_mean.loc[period_mean.period == last_period.label, 'fatal_accidents_rate'],
+                    text= "{:.2f}".format(period_mean.loc[period_mean.period == last_period.label, 'fatal_accidents_rate'].max()),
+                    textposition='auto',
+                    name = last_period.label,
+                    marker_color = period_colors[last_period.label],
+                    showlegend = False
                 )
+            ],
+            'layout': go.Layout(
+                title = 'Fatal Accidents Rate {} vs {}'.format(first_period.label, last_period.label),
+                xaxis = dict (
+                    title = "Time Periods"
+                ),
+                yaxis = dict(
+                    title = "Fatal Accidents Rate (per trillion ASK)"
+                ),
+                hovermode = 'closest'
             )
-        ],
-        'layout': go.Layout(
-            title = 'Airline Incident Rate % Change Between Time Periods'
-        )
-    }
-)
+        }
+    )
 
-# Tabular data showing a list of airlines & the corresponding percent change in its fatal accident rate from 85-99 to 00-14 (sorted desc)
-airline_fatal_perc_change_table = dcc.Graph(
-    id = 'airline_fatal_perc_change_table',
-    figure = {
-        'data': [
-            go.Table(
-                header = dict(
-                    values = ['Airline', 'Fatal Accidents Rate (85-99)', 'Fatal Accidents Rate (00-14)', 'Fatal Accidents Rate % Change'],
-                    line = dict(color='rgb(50,50,50)'),
-                    align = ['left'] * 2,
-                    font = dict( color = 'white', size=14),
-                    fill_color = 'royalblue'
-                ),
-                cells = dict(
-                    values = [df_fatal .airline, df_fatal .fatal_accidents_rate_85_99.round(2)
-                    , df_fatal .fatal_accidents_rate_00_14.round(2), df_fatal ['Fatal Accidents Rate % Change']],
-                    align = ['left'] * 5,
-                    fill = dict(color='rgb(245,245,245)')
-                )
+####################
+# Airline % Change Tables
+####################
+# Rows per page of the airline % change tables
+TABLE_PAGE_SIZE = int(os.environ.get('TABLE_PAGE_SIZE', 20))
+
+# Paged table of airlines & their % change in a rate between the periods (largest first). Paging, sorting & filtering
+# run on the server (see update_airline_perc_change_table), so the layout only carries the first page
+def build_airline_perc_change_table(table_id, metric, name):
+    data, page_count = dp.get_perc_change_table(metric).page(0, TABLE_PAGE_SIZE)
+
+    return html.Div(
+        [
+            html.H5('Airline {} % Change Between Time Periods'.format(name), className = "table-title"),
+            dash_table.DataTable(
+                id = table_id,
+                columns = [
+                    {'name': 'Airline', 'id': 'airline'},
+                    {'name': '{} ({})'.format(name, period_short(first_period)), 'id': dp.column_name(metric, first_period), 'type': 'numeric'},
+                    {'name': '{} ({})'.format(name, period_short(last_period)), 'id': dp.column_name(metric, last_period), 'type': 'numeric'},
+                    {'name': '{} % Change'.format(name), 'id': 'perc_change', 'type': 'numeric'}
+                ],
+                data = data,
+                page_current = 0,
+                page_size = TABLE_PAGE_SIZE,
+                page_count = page_count,
+                page_action = 'custom',
+                sort_action = 'custom',
+                sort_mode = 'single',
+                sort_by = [],
+                filter_action = 'custom',
+                filter_query = '',
+                style_header = dict(backgroundColor = 'royalblue', color = 'white', fontSize = 14, border = '1px solid rgb(50,50,50)'),
+                style_cell = dict(textAlign = 'left'),
+                style_data = dict(backgroundColor = 'rgb(245,245,245)')
             )
         ],
-        'layout': go.Layout(
-            title = 'Airline Fatal Accidents Rate % Change Between Time Periods'
+        className = "perc-change-table"
+    )
+
+# Tabular data showing a list of airlines & the corresponding percent change in its incident rate from 85-99 to 00-14 (sorted desc)
+def build_airline_incident_perc_change_table():
+    return build_airline_perc_change_table('airline_incident_perc_change_table', 'incident_rate', 'Incident Rate')
+
+# Tabular data showing a list of airlines & the corresponding percent change in its fatal accident rate from 85-99 to 00-14 (sorted desc)
+def build_airline_fatal_perc_change_table():
+    return build_airline_perc_change_table('airline_fatal_perc_change_table', 'fatal_accidents_rate', 'Fatal Accidents Rate')
+
+# Returns the requested page of a % change table & the page count
+def update_airline_perc_change_table(metric, page_current, page_size, sort_by, filter_query):
+    return dp.get_perc_change_table(metric).page(page_current, page_size, sort_by, filter_query)
+
+def update_airline_incident_perc_change_table(page_current, page_size, sort_by, filter_query):
+    return update_airline_perc_change_table('incident_rate', page_current, page_size, sort_by, filter_query)
+
+def update_airline_fatal_perc_change_table(page_current, page_size, sort_by, filter_query):
+    return update_airline_perc_change_table('fatal_accidents_rate', page_current, page_size, sort_by, filter_query)
+
+def register_table_callbacks(app):
+    for table_id, update in [
+        ('airline_incident_perc_change_table', update_airline_incident_perc_change_table),
+        ('airline_fatal_perc_change_table', update_airline_fatal_perc_change_table)
+    ]:
+        app.callback(
+            [Output(table_id, 'data'), Output(table_id, 'page_count')],
+            [Input(table_id, 'page_current'), Input(table_id, 'page_size'), Input(table_id, 'sort_by'), Input(table_id, 'filter_query')],
+            prevent_initial_call = True
+        )(instrumentation.timed_callback(update))
+
+####################
+# Correlation Graphs
+####################
+# How the rate scatterplots are drawn: 'auto' picks by the number of airlines plotted, or force 'svg' (go.Scatter),
+# 'gl' (WebGL go.Scattergl) or 'density' (a heatmap of airlines binned on the server, re-binned on zoom)
+SCATTER_RENDER = os.environ.get('SCATTER_RENDER', 'auto')
+SCATTER_GL_POINTS = int(os.environ.get('SCATTER_GL_POINTS', 1000))
+SCATTER_DENSITY_POINTS = int(os.environ.get('SCATTER_DENSITY_POINTS', 100000))
+SCATTER_BINS = int(os.environ.get('SCATTER_BINS', 100))
+
+def scatter_render_mode(points):
+    if SCATTER_RENDER != 'auto':
+        return SCATTER_RENDER
+    if points > SCATTER_DENSITY_POINTS:
+        return 'density'
+    if points > SCATTER_GL_POINTS:
+        return 'gl'
+
+    return 'svg'
+
+# Scatterplot of a rate in the first period (x) vs the last period (y), one marker per airline. Too many markers
+# for the browser are drawn with WebGL & beyond that as a density heatmap binned over x_range & y_range (the whole
+# data when not given)
+def rate_scatter_figure(metric, color, title, xaxis_title, yaxis_title, x_range=None, y_range=None):
+    df = dp.get_display_data()
+    x = df[dp.column_name(metric, first_period)]
+    y = df[dp.column_name(metric, last_period)]
+    xaxis, yaxis = dict(title = xaxis_title), dict(title = yaxis_title)
+
+    mode = scatter_render_mode(len(df))
+    if mode == 'density':
+        grid = dp.make_density_grid(x, y, SCATTER_BINS, x_range, y_range)
+        trace = go.Heatmap(
+            x = grid.x,
+            y = grid.y,
+            z = grid.counts,
+            colorscale = [[0, '#FFFFFF'], [1, color]],
+            colorbar = dict(title = 'Airlines'),
+            hoverongaps = False,
+            hovertemplate = 'x: %{x:.2f}<br>y: %{y:.2f}<br>airlines: %{z}<extra></extra>'
+        )
+        xaxis['range'], yaxis['range'] = grid.x_range, grid.y_range
+    else:
+        trace = (go.Scattergl if mode == 'gl' else go.Scatter)(
+            x = x,
+            y = y,
+            text = df['airline'],
+            mode = 'markers',
+            marker_color = color
         )
-    }
-)
 
-# Scatterplot to capture if 85-99's fatal accident rates has a strong linear relationship with 00-14's fatal accident rates
-fatal_rate_scatterplot = dcc.Graph(
-    id = 'fatal_rate_scatterplot',
-    figure = {
-        'data': [
-            go.Scatter(
-                x = df['fatal_accidents_rate_85_99'],
-                y = df['fatal_accidents_rate_00_14'],
-                text = df['airline'],
-                mode = 'markers',
-                marker_color = '#458CA5'
-            )
-        ],
+    return {
+        'data': [trace],
         'layout': go.Layout(
-            title = 'Fatal Accidents Rate Scatterplot 85-99 vs 00-14',
-            xaxis = dict (
-                title = "Fatal Accidents Rate 85-99 (per trillion ASK)"
-            ),
-            yaxis = dict(
-                title = "Fatal Accidents Rate Rate 00-14 (per trillion ASK)"
-            ),
+            title = title,
+            xaxis = xaxis,
+            yaxis = yaxis,
             hovermode = 'closest'
         )
     }
-)
+
+# Returns an axis' range from a graph's relayoutData: [low, high] after a zoom or pan, None after an autorange
+# (the whole data again). Returns False when the axis didn't change
+def relayout_range(relayout_data, axis):
+    if '{}.range[0]'.format(axis) in relayout_data:
+        return [relayout_data['{}.range[0]'.format(axis)], relayout_data['{}.range[1]'.format(axis)]]
+    if '{}.range'.format(axis) in relayout_data:
+        return relayout_data['{}.range'.format(axis)]
+    if relayout_data.get('{}.autorange'.format(axis)):
+        return None
+
+    return False
+
+# Returns the range an axis of a figure currently shows (None when it has none, e.g. no figure)
+def figure_range(current_figure, axis):
+    return ((current_figure or {}).get('layout') or {}).get(axis, {}).get('range')
+
+# Re-bins a density scatterplot over the axis ranges the user zoomed or panned to. An axis the relayout didn't change
+# keeps the range the current figure shows, so zooming one axis doesn't undo the zoom of the other
+def rebin_rate_scatter_figure(figure, relayout_data, current_figure=None):
+    if not relayout_data or scatter_render_mode(len(dp.get_display_data())) != 'density':
+        raise PreventUpdate
+    x_range, y_range = relayout_range(relayout_data, 'xaxis'), relayout_range(relayout_data, 'yaxis')
+    if x_range is False and y_range is False:
+        raise PreventUpdate
+    if x_range is False:
+        x_range = figure_range(current_figure, 'xaxis')
+    if y_range is False:
+        y_range = figure_range(current_figure, 'yaxis')
+
+    return figure(x_range = x_range, y_range = y_range)
+
+# Scatterplot to capture if 85-99's fatal accident rates has a strong linear relationship with 00-14's fatal accident rates
+def fatal_rate_scatter_figure(x_range=None, y_range=None):
+    return rate_scatter_figure(
+        'fatal_accidents_rate',
+        '#458CA5',
+        'Fatal Accidents Rate Scatterplot {} vs {}'.format(period_short(first_period), period_short(last_period)),
+        "Fatal Accidents Rate {} (per trillion ASK)".format(period_short(first_period)),
+        "Fatal Accidents Rate Rate {} (per trillion ASK)".format(period_short(last_period)),
+        x_range,
+        y_range
+    )
+
+def build_fatal_rate_scatterplot():
+    return dcc.Graph(
+        id = 'fatal_rate_scatterplot',
+        figure = fatal_rate_scatter_figure()
+    )
+
+def update_fatal_rate_scatterplot(relayout_data, current_figure=None):
+    return rebin_rate_scatter_figure(fatal_rate_scatter_figure, relayout_data, current_figure)
+
+# Indicator subtitle with the bootstrap confidence interval of a rate's correlation (none without resamples)
+def correlation_interval_title(metric):
+    lower, upper = dp.get_rate_correlation_interval(metric)
+    if math.isnan(lower) or math.isnan(upper):
+        return None
+
+    return dict(
+        text = '{:.0%} CI {:.2f} to {:.2f}'.format(dp.dataset.get_correlations().confidence, lower, upper),
+        font = dict(size = 14)
+    )
 
 # Pearson correlation between 85-99 fatal accident rate & 00-14 fatal accident rate
-fatal_rate_corr_indicator =  dcc.Graph(
-    id = 'fatal_rate_corr_indicator',
-    figure = {
-        'data': [
-            go.Indicator(
-                mode = "number",
-                value = df.loc[:, ['fatal_accidents_rate_00_14', 'fatal_accidents_rate_85_99']].corr()['fatal_accidents_rate_00_14']['fatal_accidents_rate_85_99']
+def build_fatal_rate_corr_indicator():
+    return dcc.Graph(
+        id = 'fatal_rate_corr_indicator',
+        figure = {
+            'data': [
+                go.Indicator(
+                    mode = "number",
+                    value = dp.get_rate_correlation('fatal_accidents_rate'),
+                    title = correlation_interval_title('fatal_accidents_rate')
+                )
+            ],
+            'layout': go.Layout(
+                title = multiple_string_lines('Fatal Accident Rate Pearson Correlation', 10),
+                height = 250
             )
-        ],
-        'layout': go.Layout(
-            title = multiple_string_lines('Fatal Accident Rate Pearson Correlation', 10),
-            height = 250
-        )
-    }
-)
+        }
+    )
 
 # Scatterplot to capture if 85-99's incident rates has a strong linear relationship with 00-14's incident rates
-incident_rate_scatterplot = dcc.Graph(
-    id = 'incident_rate_scatterplot',
-    figure = {
-        'data': [
-            go.Scatter(
-                x = df['incident_rate_85_99'],
-                y = df['incident_rate_00_14'],
-                text = df['airline'],
-                mode = 'markers',
-                marker_color = period_colors['1985-1999']
-            )
-        ],
-        'layout': go.Layout(
-            title = 'Incident Rate Scatterplot 85-99 vs 00-14',
-            xaxis = dict (
-                title = "Incident Rate 85-99 (per trillion ASK)"
-            ),
-            yaxis = dict(
-                title = "Incidents Rate 00-14 (per trillion ASK)"
-            ),
-            hovermode = 'closest'
-        )
-    }
-)
+def incident_rate_scatter_figure(x_range=None, y_range=None):
+    return rate_scatter_figure(
+        'incident_rate',
+        period_colors[first_period.label],
+        'Incident Rate Scatterplot {} vs {}'.format(period_short(first_period), period_short(last_period)),
+        "Incident Rate {} (per trillion ASK)".format(period_short(first_period)),
+        "Incidents Rate {} (per trillion ASK)".format(period_short(last_period)),
+        x_range,
+        y_range
+    )
+
+def build_incident_rate_scatterplot():
+    return dcc.Graph(
+        id = 'incident_rate_scatterplot',
+        figure = incident_rate_scatter_figure()
+    )
+
+def update_incident_rate_scatterplot(relayout_data, current_figure=None):
+    return rebin_rate_scatter_figure(incident_rate_scatter_figure, relayout_data, current_figure)
+
+def register_scatterplot_callbacks(app):
+    for graph_id, update in [
+        ('fatal_rate_scatterplot', update_fatal_rate_scatterplot),
+        ('incident_rate_scatterplot', update_incident_rate_scatterplot)
+    ]:
+        app.callback(
+            Output(graph_id, 'figure'),
+            [Input(graph_id, 'relayoutData')],
+            [State(graph_id, 'figure')],
+            prevent_initial_call = True
+        )(instrumentation.timed_callback(update))
 
 # Pearson correlation between 85-99 incident rate & 00-14 incident rate
-incident_rate_corr_indicator =  dcc.Graph(
-    id = 'incident_rate_corr_indicator',
-    figure = {
-        'data': [
-            go.Indicator(
-                mode = "number",
-                value = df.loc[:, ['incident_rate_00_14', 'incident_rate_85_99']].corr()['incident_rate_00_14']['incident_rate_85_99']
+def build_incident_rate_corr_indicator():
+    return dcc.Graph(
+        id = 'incident_rate_corr_indicator',
+        figure = {
+            'data': [
+                go.Indicator(
+                    mode = "number",
+                    value = dp.get_rate_correlation('incident_rate'),
+                    title = correlation_interval_title('incident_rate')
+                )
+            ],
+            'layout': go.Layout(
+                title = multiple_string_lines('Fatal Accident Rate Pearson Correlation', 10),
+                height = 250
             )
-        ],
-        'layout': go.Layout(
-            title = multiple_string_lines('Fatal Accident Rate Pearson Correlation', 10),
-            height = 250
-        )
-    }
-)
+        }
+    )
 
 ####################
 ## Filterable Graphs
@@ -370,11 +536,33 @@ incident_rate_corr_indicator =  dcc.Graph(
 # These graphs generate bar graphs for user's chosen airlines and three most comparable airlines based on ASK
 # Includes dash callbacks to update graphs based on user's airline choice
 # Defaulted to Southwest Airlines
-@app.callback(
-    Output('airline_incident_rate_bar_graph', 'figure'),
-    [Input('airline_picker', 'value')]
-)
+
+# Rendered figures are kept in a bounded LRU cache keyed by airline & dataset version
+FIGURE_CACHE_SIZE = int(os.environ.get('FIGURE_CACHE_SIZE', 256))
+
+# In clientside mode the browser gets a compact per-airline table once (see comparison_payload)
+# & assets/comparison.js builds both graphs without a round-trip to the server
+CLIENTSIDE_COMPARISON = bool(os.environ.get('CLIENTSIDE_COMPARISON'))
+
+# Returns one bar of an airline's comparison graph: the y metric in the period, labelled with the text metric
+# The airline's row comes from the airline-keyed record index rather than a scan of df
+def comp_bar(airline, y_metric, text_metric, period, offsetgroup, showlegend):
+    record = dp.get_airline_record(airline)
+    return go.Bar(
+        x = [airline] if record else [],
+        y = [record[dp.column_name(y_metric, period)]] if record else [],
+        text = "{:.2f}".format(record[dp.column_name(text_metric, period)] if record else float('nan')),
+        textposition = 'auto',
+        marker_color = period_colors[period.label],
+        offsetgroup = offsetgroup,
+        name = period.label if showlegend else None,
+        showlegend = showlegend
+    )
+
 def update_incident_rate_airline_comp_graphs(airline):
+    return incident_rate_figure_cache.get(airline, dp.dataset.version())
+
+def render_incident_rate_airline_comp_figure(airline):
     fig = {
         'data': generate_incident_rate_airline_comp_graph(airline)
         , 'layout': go.Layout(
@@ -389,83 +577,33 @@ def update_incident_rate_airline_comp_graphs(airline):
 
     return fig
 
+incident_rate_figure_cache = FigureCache(render_incident_rate_airline_comp_figure, FIGURE_CACHE_SIZE)
+
 def generate_incident_rate_airline_comp_graph(airline):
     comp = dp.get_comp_airline(airline)
     traces = []
-    traces.append(
-        go.Bar(
-            x = df.loc[df['airline'] == airline, 'airline'],
-            y = df.loc[df['airline'] == airline, 'incident_rate_85_99'],
-            text= "{:.2f}".format(df.loc[df['airline'] == airline, 'incident_rate_85_99'].max()),
-            textposition='auto',
-            marker_color = period_colors['1985-1999'],
-            offsetgroup = 0,
-            name = '1985-1999',
-            showlegend = True
-        )
-    )
-    # Add 00-14 data
-    traces.append(
-        go.Bar(
-            x = df.loc[df['airline'] == airline, 'airline'],
-            y = df.loc[df['airline'] == airline, 'incident_rate_00_14'],
-            text= "{:.2f}".format(df.loc[df['airline'] == airline, 'incident_rate_00_14'].max()),
-            textposition='auto',
-            marker_color = period_colors['2000-2014'],
-            offsetgroup = 1,
-            name = '2000-2014',
-            showlegend = True
-        )
-    )
+    traces.append(comp_bar(airline, 'incident_rate', 'incident_rate', first_period, 0, True))
+    # Add last period data
+    traces.append(comp_bar(airline, 'incident_rate', 'incident_rate', last_period, 1, True))
 
     for al in comp:
-        # Add 85-99 data
-        traces.append(
-            go.Bar(
-                x = df.loc[df['airline'] == al, 'airline'],
-                y = df.loc[df['airline'] == al, 'incident_rate_85_99'],
-                text= "{:.2f}".format(df.loc[df['airline'] == al, 'incident_rate_85_99'].max()),
-                textposition='auto',
-                marker_color = period_colors['1985-1999'],
-                offsetgroup = 0,
-                showlegend = False
-            )
-        )
-        # Add 00-14 data
-        traces.append(
-            go.Bar(
-                x = df.loc[df['airline'] == al, 'airline'],
-                y = df.loc[df['airline'] == al, 'incident_rate_00_14'],
-                text= "{:.2f}".format(df.loc[df['airline'] == al, 'incident_rate_00_14'].max()),
-                textposition='auto',
-                marker_color = period_colors['2000-2014'],
-                offsetgroup = 1,
-                showlegend = False
-            )
-        )
+        # Add first period data
+        traces.append(comp_bar(al, 'incident_rate', 'incident_rate', first_period, 0, False))
+        # Add last period data
+        traces.append(comp_bar(al, 'incident_rate', 'incident_rate', last_period, 1, False))
 
     return traces
 
-airline_incident_rate_bar_graph = dcc.Graph(
-    id = 'airline_incident_rate_bar_graph',
-    figure = {
-        'data': generate_incident_rate_airline_comp_graph("Southwest Airlines"),
-        'layout': go.Layout(
-            title = 'Airline Comparisons Incident Rate',
-            yaxis = dict(
-                title = "Incidents Rate (per trillion ASK)"
-            ),
-            hovermode = 'closest',
-            barmode='group'
-        )
-    }
-)
+def build_airline_incident_rate_bar_graph():
+    return dcc.Graph(
+        id = 'airline_incident_rate_bar_graph',
+        figure = incident_rate_figure_cache.get("Southwest Airlines", dp.dataset.version())
+    )
 
-@app.callback(
-    Output('airline_fatal_accidents_rate_bar_graph', 'figure'),
-    [Input('airline_picker', 'value')]
-)
 def update_fatal_rate_airline_comp_graphs(airline):
+    return fatal_rate_figure_cache.get(airline, dp.dataset.version())
+
+def render_fatal_rate_airline_comp_figure(airline):
     fig = {
         'data': generate_fatal_rate_airline_comp_graph(airline)
         , 'layout': go.Layout(
@@ -483,157 +621,390 @@ def update_fatal_rate_airline_comp_graphs(airline):
 def generate_fatal_rate_airline_comp_graph(airline):
     comp = dp.get_comp_airline(airline)
     traces = []
-    traces.append(
-        go.Bar(
-            x = df.loc[df['airline'] == airline, 'airline'],
-            y = df.loc[df['airline'] == airline, 'fatal_accidents_rate_85_99'],
-            text= "{:.2f}".format(df.loc[df['airline'] == airline, 'fatal_accidents_85_99'].max()),
-            textposition='auto',
-            marker_color = period_colors['1985-1999'],
-            offsetgroup = 0,
-            name = '1985-1999',
-            showlegend = True
-        )
-    )
-    # Add 00-14 data
-    traces.append(
-        go.Bar(
-            x = df.loc[df['airline'] == airline, 'airline'],
-            y = df.loc[df['airline'] == airline, 'fatal_accidents_00_14'],
-            text= "{:.2f}".format(df.loc[df['airline'] == airline, 'fatal_accidents_00_14'].max()),
-            textposition='auto',
-            marker_color = period_colors['2000-2014'],
-            offsetgroup = 1,
-            name = '2000-2014',
-            showlegend = True
-        )
-    )
+    traces.append(comp_bar(airline, 'fatal_accidents_rate', 'fatal_accidents', first_period, 0, True))
+    # Add last period data
+    traces.append(comp_bar(airline, 'fatal_accidents', 'fatal_accidents', last_period, 1, True))
 
     for al in comp:
-        # Add 85-99 data
-        traces.append(
-            go.Bar(
-                x = df.loc[df['airline'] == al, 'airline'],
-                y = df.loc[df['airline'] == al, 'incident_rate_85_99'],
-                text= "{:.2f}".format(df.loc[df['airline'] == al, 'fatal_accidents_85_99'].max()),
-                textposition='auto',
-                marker_color = period_colors['1985-1999'],
-                offsetgroup = 0,
-                showlegend = False
-            )
-        )
-        # Add 00-14 data
-        traces.append(
-            go.Bar(
-                x = df.loc[df['airline'] == al, 'airline'],
-                y = df.loc[df['airline'] == al, 'incident_rate_00_14'],
-                text= "{:.2f}".format(df.loc[df['airline'] == al, 'fatal_accidents_00_14'].max()),
-                textposition='auto',
-                marker_color = period_colors['2000-2014'],
-                offsetgroup = 1,
-                showlegend = False
-            )
-        )
+        # Add first period data
+        traces.append(comp_bar(al, 'incident_rate', 'fatal_accidents', first_period, 0, False))
+        # Add last period data
+        traces.append(comp_bar(al, 'incident_rate', 'fatal_accidents', last_period, 1, False))
 
     return traces
 
-airline_fatal_accidents_rate_bar_graph = dcc.Graph(
-    id = 'airline_fatal_accidents_rate_bar_graph',
-    figure = {
-        'data': generate_fatal_rate_airline_comp_graph("Southwest Airlines"),
-        'layout': go.Layout(
-            title = 'Airline Comparisons Fatal Accidents Rate',
-            yaxis = dict(
-                title = "Fatal Accidents Rate (per trillion ASK)"
-            ),
-            hovermode = 'closest',
-            barmode='group'
-        )
+fatal_rate_figure_cache = FigureCache(render_fatal_rate_airline_comp_figure, FIGURE_CACHE_SIZE)
+
+def build_airline_fatal_accidents_rate_bar_graph():
+    return dcc.Graph(
+        id = 'airline_fatal_accidents_rate_bar_graph',
+        figure = fatal_rate_figure_cache.get("Southwest Airlines", dp.dataset.version())
+    )
+
+# Returns the per-airline table the clientside graphs are built from: the columns both graphs read
+# & each airline's competitors (closest by ASK or most similar, see get_comp_airline) as positions in the airlines list
+def comparison_payload(k=3):
+    df = dp.get_data()
+    airlines = list(df.airline)
+    position = {airline: i for i, airline in enumerate(airlines)}
+    columns = [
+        dp.column_name(metric, period)
+        for metric in ['incident_rate', 'fatal_accidents_rate', 'fatal_accidents']
+        for period in [first_period, last_period]
+    ]
+
+    return {
+        'airlines': airlines,
+        'columns': {col: df[col].tolist() for col in columns},
+        'competitors': [[position[comp] for comp in dp.get_comp_airline(airline, k)] for airline in airlines],
+        'periods': [
+            {'label': period.label, 'color': period_colors[period.label], 'code': period.code}
+            for period in [first_period, last_period]
+        ]
     }
-)
+
+def prewarm_figure_caches():
+    airlines = list(dp.get_display_data().airline.unique())
+    for figure_cache in [incident_rate_figure_cache, fatal_rate_figure_cache]:
+        figure_cache.prewarm(airlines, dp.dataset.version())
+
+def build_airline_comparison_store():
+    return dcc.Store(id = 'airline_comparison_store', data = comparison_payload())
+
+def register_comparison_callbacks(app):
+    if CLIENTSIDE_COMPARISON:
+        app.clientside_callback(
+            ClientsideFunction(namespace = 'airline_comparison', function_name = 'incident_rate_figure'),
+            Output('airline_incident_rate_bar_graph', 'figure'),
+            [Input('airline_picker', 'value')],
+            [State('airline_comparison_store', 'data')]
+        )
+        app.clientside_callback(
+            ClientsideFunction(namespace = 'airline_comparison', function_name = 'fatal_rate_figure'),
+            Output('airline_fatal_accidents_rate_bar_graph', 'figure'),
+            [Input('airline_picker', 'value')],
+            [State('airline_comparison_store', 'data')]
+        )
+    else:
+        app.callback(
+            Output('airline_incident_rate_bar_graph', 'figure'),
+            [Input('airline_picker', 'value')]
+        )(instrumentation.timed_callback(update_incident_rate_airline_comp_graphs))
+        app.callback(
+            Output('airline_fatal_accidents_rate_bar_graph', 'figure'),
+            [Input('airline_picker', 'value')]
+        )(instrumentation.timed_callback(update_fatal_rate_airline_comp_graphs))
 
 ####################
 ## Dropdown Options
 ####################
-options = []
-for airline in list(df.airline.unique()):
-    mydict = {}
-    mydict['label'] = airline
-    mydict['value'] = airline
-    options.append(mydict)
+def build_airline_picker_options():
+    options = []
+    for airline in list(dp.get_display_data().airline.unique()):
+        mydict = {}
+        mydict['label'] = airline
+        mydict['value'] = airline
+        options.append(mydict)
+
+    return options
 
 ####################
-## Main Layout
+## Startup Profiling
 ####################
-app.layout = html.Div([
-    navbar,
+# Records how long each data function & figure takes while the layout is built
+class StartupProfile:
+    def __init__(self):
+        self.timings = []
+        self._lock = threading.Lock()
 
-    # Overall fatal accidents and incidents trends
-    html.H1("General Trends Between Time Periods", className="section-title"),
-    period_total_perc_stacked_bar_graph,
+    def time(self, kind, name, func):
+        start = time.perf_counter()
+        result = func()
+        with self._lock:
+            self.timings.append((kind, name, time.perf_counter() - start))
 
-    # Incident Rate & Fatal Accident Rate trends
-    html.H1("Incident & Fatal Accident Rate Time Period Trends", className="section-title"),
-    dbc.Row(
-        [
-            dbc.Col(html.Div(incident_rate_perc_change_indicator), lg = 4),
-            dbc.Col(html.Div(fatal_accidents_rate_perc_change_indicator), lg = 4)
-        ],
-        justify = "center"
-    ),
-    dbc.Row(
-        [
-            dbc.Col(period_accident_rate_bar_graph, lg = 6),
-            dbc.Col(period_fatal_accidents_rate_bar_graph, lg = 6)
-        ]
-    ),
-
-    # Airline % change between time periods - cross tab
-    html.H1("Airline Incident & Fatal Accidents Rate % Change Between Time Periods", className="section-title"),
-    airline_incident_perc_change_table,
-    airline_fatal_perc_change_table,
-
-    # Scatterplots & Corr indicator graphs
-    html.H1("Airline Incident & Fatal Accidents Rate Correlation Between Time Periods", className="section-title"),
-    dbc.Container(html.P("There is low positive pearson correlation between fatal accidents rate & incidents rate between two periods (i.e. do airlines with bad fatal accidents rate in 1985-1999 continue to have bad fatal accidents rate in 2000-2014?)")),
-    dbc.Row(
-        [dbc.Col(fatal_rate_corr_indicator , lg = 3)]
-        , justify = "center"
-    ),
-    fatal_rate_scatterplot,
-    dbc.Row(
-        [dbc.Col(incident_rate_corr_indicator , lg = 3)]
-        , justify = "center"
-    ),
-    incident_rate_scatterplot,
-
-    # Airline Comparisons
-    html.H1("Airline Comparisons", className="section-title"),
-    dbc.Container(html.P("Select an airline to compare incident rate and fatal accident rate against the chosen airline's three closest competitors in terms of Available Seats Kilometers (captures the total flight passenger capacity of an ailrine in kilometers). ")),
-    dbc.Row(
-        [
-            dbc.Col(
-                html.Label(
-                    [
-                        "Choose an Airline",
-                        dcc.Dropdown(
-                            id = 'airline_picker',
-                            options = options,
-                            value = 'Southwest Airlines',
-                            multi = False
-                        )
-                    ]
-                    , className = "small-margin-left"
+        return result
+
+    def report(self):
+        lines = ['{:<7} {:<58} {:>9}'.format('kind', 'name', 'seconds')]
+        for kind, name, seconds in self.timings:
+            lines.append('{:<7} {:<58} {:>9.4f}'.format(kind, name, seconds))
+
+        return '\n'.join(lines)
+
+####################
+## Main Layout
+####################
+# Every figure of the layout by name. They don't depend on each other so they're built concurrently
+FIGURE_BUILDERS = {
+    'period_total_perc_stacked_bar_graph': build_period_total_perc_stacked_bar_graph,
+    'incident_rate_perc_change_indicator': build_incident_rate_perc_change_indicator,
+    'fatal_accidents_rate_perc_change_indicator': build_fatal_accidents_rate_perc_change_indicator,
+    'period_accident_rate_bar_graph': build_period_accident_rate_bar_graph,
+    'period_fatal_accidents_rate_bar_graph': build_period_fatal_accidents_rate_bar_graph,
+    'airline_incident_perc_change_table': build_airline_incident_perc_change_table,
+    'airline_fatal_perc_change_table': build_airline_fatal_perc_change_table,
+    'fatal_rate_corr_indicator': build_fatal_rate_corr_indicator,
+    'fatal_rate_scatterplot': build_fatal_rate_scatterplot,
+    'incident_rate_corr_indicator': build_incident_rate_corr_indicator,
+    'incident_rate_scatterplot': build_incident_rate_scatterplot,
+    'airline_picker_options': build_airline_picker_options,
+    'airline_incident_rate_bar_graph': build_airline_incident_rate_bar_graph,
+    'airline_fatal_accidents_rate_bar_graph': build_airline_fatal_accidents_rate_bar_graph
+}
+FIGURE_WORKERS = int(os.environ.get('FIGURE_WORKERS', 4))
+
+def build_layout(profile=None):
+    profile = profile or StartupProfile()
+    for name, func in DATA_FUNCTIONS:
+        if dp.dataset.streaming and name in FULL_TABLE_DATA_FUNCTIONS:
+            continue
+        profile.time('data', name, func)
+
+    with ThreadPoolExecutor(max_workers = FIGURE_WORKERS) as executor:
+        futures = {
+            name: executor.submit(profile.time, 'figure', name, build)
+            for name, build in FIGURE_BUILDERS.items()
+        }
+        figures = {name: future.result() for name, future in futures.items()}
+
+    layout = html.Div([
+        navbar,
+
+        # Overall fatal accidents and incidents trends
+        html.H1("General Trends Between Time Periods", className="section-title"),
+        figures['period_total_perc_stacked_bar_graph'],
+
+        # Incident Rate & Fatal Accident Rate trends
+        html.H1("Incident & Fatal Accident Rate Time Period Trends", className="section-title"),
+        dbc.Row(
+            [
+                dbc.Col(html.Div(figures['incident_rate_perc_change_indicator']), lg = 4),
+                dbc.Col(html.Div(figures['fatal_accidents_rate_perc_change_indicator']), lg = 4)
+            ],
+            justify = "center"
+        ),
+        dbc.Row(
+            [
+                dbc.Col(figures['period_accident_rate_bar_graph'], lg = 6),
+                dbc.Col(figures['period_fatal_accidents_rate_bar_graph'], lg = 6)
+            ]
+        ),
+
+        # Airline % change between time periods - cross tab
+        html.H1("Airline Incident & Fatal Accidents Rate % Change Between Time Periods", className="section-title"),
+        figures['airline_incident_perc_change_table'],
+        figures['airline_fatal_perc_change_table'],
+
+        # Scatterplots & Corr indicator graphs
+        html.H1("Airline Incident & Fatal Accidents Rate Correlation Between Time Periods", className="section-title"),
+        dbc.Container(html.P("There is low positive pearson correlation between fatal accidents rate & incidents rate between two periods (i.e. do airlines with bad fatal accidents rate in {} continue to have bad fatal accidents rate in {}?)".format(first_period.label, last_period.label))),
+        dbc.Row(
+            [dbc.Col(figures['fatal_rate_corr_indicator'] , lg = 3)]
+            , justify = "center"
+        ),
+        figures['fatal_rate_scatterplot'],
+        dbc.Row(
+            [dbc.Col(figures['incident_rate_corr_indicator'] , lg = 3)]
+            , justify = "center"
+        ),
+        figures['incident_rate_scatterplot'],
+
+        # Airline Comparisons
+        html.H1("Airline Comparisons", className="section-title"),
+        dbc.Container(html.P(comparison_description())),
+        dbc.Row(
+            [
+                dbc.Col(
+                    html.Label(
+                        [
+                            "Choose an Airline",
+                            dcc.Dropdown(
+                                id = 'airline_picker',
+                                options = figures['airline_picker_options'],
+                                value = 'Southwest Airlines',
+                                multi = False
+                            )
+                        ]
+                        , className = "small-margin-left"
+                    )
+                    ,
+                    sm = 4
                 )
-                ,
-                sm = 4
-            )
-        ]
-    ),
-    airline_incident_rate_bar_graph,
-    airline_fatal_accidents_rate_bar_graph
-])
+            ]
+        ),
+        figures['airline_incident_rate_bar_graph'],
+        figures['airline_fatal_accidents_rate_bar_graph']
+    ])
+
+    if CLIENTSIDE_COMPARISON:
+        layout.children.append(profile.time('figure', 'airline_comparison_store', build_airline_comparison_store))
+
+    return layout
+
+# Describes who the comparison graphs compare an airline against (see data_processing.COMPETITORS)
+def comparison_description():
+    if dp.dataset.competitors == 'similarity':
+        return "Select an airline to compare incident rate and fatal accident rate against the three airlines with the most similar safety profile: Available Seats Kilometers and both periods' incident and fatal accident rates. "
+
+    return "Select an airline to compare incident rate and fatal accident rate against the chosen airline's three closest competitors in terms of Available Seats Kilometers (captures the total flight passenger capacity of an ailrine in kilometers). "
+
+# Just the components the callbacks use, so Dash can validate callbacks without building the real layout
+def build_validation_layout():
+    return html.Div([
+        dcc.Dropdown(id = 'airline_picker'),
+        dcc.Graph(id = 'airline_incident_rate_bar_graph'),
+        dcc.Graph(id = 'airline_fatal_accidents_rate_bar_graph'),
+        dcc.Store(id = 'airline_comparison_store'),
+        dash_table.DataTable(id = 'airline_incident_perc_change_table'),
+        dash_table.DataTable(id = 'airline_fatal_perc_change_table'),
+        dcc.Graph(id = 'fatal_rate_scatterplot'),
+        dcc.Graph(id = 'incident_rate_scatterplot')
+    ])
+
+# Builds the layout once per dataset version, ahead of time in a background thread or on the first request for it,
+# & again on the first request after the database changed
+class LazyLayout:
+    def __init__(self, build, version=lambda: dp.dataset.version()):
+        self.build = build
+        self.version = version
+        self.layout = None
+        self._built_version = None
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            version = self.version()
+            if self.layout is None or version != self._built_version:
+                self.layout = self.build()
+                self._built_version = version
+
+        return self.layout
+
+    def start(self):
+        threading.Thread(target = self, daemon = True).start()
+
+####################
+# Dash App
+####################
+# Creates the Dash app without doing any data or figure work at import time. layout_build picks when the layout
+# is built: 'background' in a background thread (requests that need it wait for it), 'request' on the first
+# request that needs it, 'startup' before returning
+LAYOUT_BUILD = os.environ.get('LAYOUT_BUILD', 'background')
+# Attach to the snapshot a serving parent published for its workers (see gunicorn.conf.py)
+SHARED_SNAPSHOT = os.environ.get('AIRLINE_SHARED') == '1'
+
+# Attaches the app to a snapshot with a prebuilt layout: the frames are seeded from its memory-mapped files, which
+# every worker maps from the same pages, & the layout is sent straight from its JSON file (see
+# register_http_caching), so the worker neither reads the table nor builds figures. While the snapshot doesn't match
+# the database the worker falls back to building its own layout. Returns the snapshot's manifest with the layout
+# file's path, None when it couldn't be attached
+def attach_shared_snapshot(app, layout, path=snapshot.SNAPSHOT_DIR):
+    manifest = snapshot.read_manifest(path)
+    if not snapshot.matches(manifest, dp.dataset) or 'layout' not in manifest or not snapshot.load_snapshot(dp.dataset, path):
+        return None
+
+    # Dash checks the layout's ids when it starts serving, the validation layout has the same ones
+    app.layout = lambda: build_validation_layout() if snapshot.matches(manifest, dp.dataset) else layout()
+
+    return dict(manifest, layout_path = os.path.abspath(os.path.join(path, manifest['layout'])))
+
+####################
+# HTTP Caching
+####################
+# Seconds browsers (max-age) & shared caches like a CDN (s-maxage) may reuse the layout & callback dependencies
+# before revalidating them with their ETag
+HTTP_MAX_AGE = int(os.environ.get('HTTP_MAX_AGE', 0))
+HTTP_SHARED_MAX_AGE = int(os.environ.get('HTTP_SHARED_MAX_AGE', 300))
+HTTP_CACHE_CONTROL = 'public, max-age={}, s-maxage={}'.format(HTTP_MAX_AGE, HTTP_SHARED_MAX_AGE)
+
+layout_payloads = PayloadCache()
+dependency_payloads = PayloadCache()
+
+def read_bytes(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+# Serves the layout & the callback dependencies, which only change with the dataset, from bodies serialized &
+# compressed once (brotli & gzip) with strong ETags, so repeat visitors get a 304 & a CDN can hold them.
+# shared is the manifest of an attached shared snapshot, whose layout file is served while it matches the database
+def register_http_caching(app, shared=None):
+    layout_route = app.config.routes_pathname_prefix + '_dash-layout'
+    dependencies_route = app.config.routes_pathname_prefix + '_dash-dependencies'
+
+    def layout_payload():
+        if shared is not None and snapshot.matches(shared, dp.dataset):
+            return layout_payloads.get(('shared', shared['created']), lambda: read_bytes(shared['layout_path']))
+        # Rebuilt with the layout whenever the database changes
+        return layout_payloads.get(('layout', dp.dataset.version()), lambda: app.serve_layout().get_data())
+
+    @app.server.before_request
+    def serve_cached_payload():
+        if flask.request.path == layout_route:
+            return layout_payload().response(flask.request, HTTP_CACHE_CONTROL)
+        if flask.request.path == dependencies_route:
+            payload = dependency_payloads.get('dependencies', lambda: app.dependencies().get_data())
+            return payload.response(flask.request, HTTP_CACHE_CONTROL)
+
+####################
+# Metrics
+####################
+# Exposes the callback, SQL & pipeline stage histograms (see instrumentation.py) at /metrics for Prometheus, along
+# with the size of every cache & the memory of every frame built so far
+def register_metrics(app):
+    for name, cache in [('incident_rate_figures', incident_rate_figure_cache), ('fatal_rate_figures', fatal_rate_figure_cache)]:
+        instrumentation.register_cache(name, lambda cache=cache: cache.stats()['size'])
+    instrumentation.register_cache('frames', lambda: len(dp.dataset.cached_frames()))
+    instrumentation.register_frames(lambda: dp.dataset.cached_frames())
+
+    @app.server.route('/metrics')
+    def serve_metrics():
+        body, content_type = instrumentation.exposition()
+        return flask.Response(body, content_type = content_type)
+
+def create_app(layout_build=LAYOUT_BUILD, profile=None):
+    # compress gzips the responses that aren't stored compressed, i.e. the callbacks'
+    app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP], compress=True)
+    app.validation_layout = build_validation_layout()
+    layout = LazyLayout(lambda: build_layout(profile))
+    app.layout = layout
+    register_comparison_callbacks(app)
+    register_table_callbacks(app)
+    register_scatterplot_callbacks(app)
+    # Registered first so profiled requests cover the cached layout & the other handlers too
+    profiling.register(app.server, app.config.requests_pathname_prefix + '_dash-update-component')
+
+    shared = attach_shared_snapshot(app, layout) if SHARED_SNAPSHOT else None
+    register_http_caching(app, shared)
+    register_metrics(app)
+
+    # Workers on a shared snapshot have the layout already built
+    if shared is None and layout_build == 'background':
+        layout.start()
+    elif shared is None and layout_build == 'startup':
+        layout()
+
+    # Optionally render every airline's comparison figures in the background at startup
+    if os.environ.get('PREWARM_FIGURE_CACHE'):
+        threading.Thread(target = prewarm_figure_caches, daemon = True).start()
+
+    return app
 
 # Run the Dash App
 if __name__ == '__main__':
-  app.run_server(debug=True)
+    parser = argparse.ArgumentParser(description='Run the airline safety dashboard')
+    parser.add_argument('--profile-startup', action='store_true', help='build the layout before serving & report the time per data function and per figure')
+    args = parser.parse_args()
+
+    if args.profile_startup:
+        profile = StartupProfile()
+        start = time.perf_counter()
+        app = create_app(layout_build='startup', profile=profile)
+        print(profile.report())
+        print('Startup took {:.4f} seconds'.format(time.perf_counter() - start))
+    else:
+        app = create_app()
+    app.run_server(debug=True)
+else:
+    app = create_app()
+    server = app.server
@@ -0,0 +1,89 @@
+// Clientside versions of the airline comparison graphs (used when app.py runs with CLIENTSIDE_COMPARISON set).
+// They mirror generate_incident_rate_airline_comp_graph & generate_fatal_rate_airline_comp_graph,
+// building the grouped bars from the table comparison_payload() stores in airline_comparison_store.
+(function() {
+    function column(table, metric, period) {
+        return table.columns[metric + '_' + period.code];
+    }
+
+    // Formats a bar's text like comp_bar's "{:.2f}". The payload's JSON turns NaN & infinities into null, so
+    // those (and a missing value) read 'nan' rather than throwing in toFixed
+    function barText(value) {
+        if (typeof value !== 'number' || isNaN(value)) {
+            return 'nan';
+        }
+        if (!isFinite(value)) {
+            return value > 0 ? 'inf' : '-inf';
+        }
+        return value.toFixed(2);
+    }
+
+    // One bar per period for an airline. columns(period) returns the [y, text] metrics of that period's bar
+    function airlineBars(table, i, columns, withLegend) {
+        return table.periods.map(function(period, offset) {
+            var metrics = columns(period);
+            var found = i !== undefined;
+            var bar = {
+                type: 'bar',
+                x: found ? [table.airlines[i]] : [],
+                y: found ? [column(table, metrics[0], period)[i]] : [],
+                text: found ? barText(column(table, metrics[1], period)[i]) : 'nan',
+                textposition: 'auto',
+                marker: {color: period.color},
+                offsetgroup: String(offset),
+                showlegend: withLegend
+            };
+            if (withLegend) {
+                bar.name = period.label;
+            }
+            return bar;
+        });
+    }
+
+    function comparisonTraces(airline, table, airlineColumns, competitorColumns) {
+        var i = table.airlines.indexOf(airline);
+        i = i === -1 ? undefined : i;
+        var traces = airlineBars(table, i, airlineColumns, true);
+        var competitors = i === undefined ? [] : table.competitors[i];
+        competitors.forEach(function(comp) {
+            traces = traces.concat(airlineBars(table, comp, competitorColumns, false));
+        });
+        return traces;
+    }
+
+    function comparisonLayout(title, yTitle) {
+        return {
+            title: {text: title},
+            yaxis: {title: {text: yTitle}},
+            hovermode: 'closest',
+            barmode: 'group'
+        };
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        airline_comparison: {
+            incident_rate_figure: function(airline, table) {
+                var columns = function(period) {
+                    return ['incident_rate', 'incident_rate'];
+                };
+                return {
+                    data: comparisonTraces(airline, table, columns, columns),
+                    layout: comparisonLayout('Airline Comparisons Incident Rate', 'Incidents Rate (per trillion ASK)')
+                };
+            },
+            fatal_rate_figure: function(airline, table) {
+                var first = table.periods[0];
+                var airlineColumns = function(period) {
+                    return [period === first ? 'fatal_accidents_rate' : 'fatal_accidents', 'fatal_accidents'];
+                };
+                var competitorColumns = function(period) {
+                    return ['incident_rate', 'fatal_accidents'];
+                };
+                return {
+                    data: comparisonTraces(airline, table, airlineColumns, competitorColumns),
+                    layout: comparisonLayout('Airline Comparisons Fatal Accidents Rate', 'Fatal Accidents Rate (per trillion ASK)')
+                };
+            }
+        }
+    });
+})();
@@ -0,0 +1,64 @@
+import argparse
+import importlib
+import os
+import random
+import tempfile
+import time
+
+import plotly.graph_objs as go
+
+import data_processing as dp
+from benchmarks.synthetic import write_synthetic_db
+
+
+# Previous trace builder of the incident rate comparison graph: one boolean-mask scan of df per value
+def legacy_incident_rate_traces(app, airline):
+    df = dp.get_data()
+    traces = []
+    for al in [airline] + dp.get_comp_airline(airline):
+        for offsetgroup, period in enumerate([app.first_period, app.last_period]):
+            col = dp.column_name('incident_rate', period)
+            traces.append(
+                go.Bar(
+                    x = df.loc[df['airline'] == al, 'airline'],
+                    y = df.loc[df['airline'] == al, col],
+                    text= "{:.2f}".format(df.loc[df['airline'] == al, col].max()),
+                    textposition='auto',
+                    marker_color = app.period_colors[period.label],
+                    offsetgroup = offsetgroup,
+                    name = period.label if al == airline else None,
+                    showlegend = al == airline
+                )
+            )
+
+    return traces
+
+# Returns the mean seconds per call of func over the airlines
+def time_per_call(func, airlines):
+    start = time.perf_counter()
+    for airline in airlines:
+        func(airline)
+
+    return (time.perf_counter() - start) / len(airlines)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the airline comparison callbacks before & after the airline-keyed row index')
+    parser.add_argument('--airlines', type=int, default=10000, help='number of synthetic airlines')
+    parser.add_argument('--calls', type=int, default=20, help='callback calls to average over')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dp.dataset = dp.AirlineDataset(write_synthetic_db(os.path.join(tmp, 'airline'), args.airlines))
+        # The layout isn't needed for the callbacks, so don't let a background build compete with the timings
+        os.environ['LAYOUT_BUILD'] = 'request'
+        app = importlib.import_module('app')
+
+        airlines = random.Random(0).sample(list(dp.get_data().airline), args.calls)
+        legacy = time_per_call(lambda airline: legacy_incident_rate_traces(app, airline), airlines)
+        indexed = time_per_call(app.generate_incident_rate_airline_comp_graph, airlines)
+        fatal = time_per_call(app.generate_fatal_rate_airline_comp_graph, airlines)
+
+        print('{} airlines, mean of {} calls'.format(args.airlines, args.calls))
+        print('  incident rate traces, boolean masks  {:9.2f} ms'.format(legacy * 1000))
+        print('  incident rate traces, row index      {:9.2f} ms'.format(indexed * 1000))
+        print('  fatal rate traces, row index         {:9.2f} ms'.format(fatal * 1000))
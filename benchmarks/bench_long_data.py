@@ -0,0 +1,57 @@
+import argparse
+import time
+
+import pandas as pd
+
+import data_processing as dp
+from benchmarks.synthetic import synthetic_table
+
+
+# Previous melt + str.extract + merge implementation of get_long_data, kept as the reference output
+def legacy_long_data(df):
+    cols = list(df.columns)
+    cols.remove("airline")
+    cols.remove("avail_seat_km_per_week")
+    cols.remove("avail_seat_km")
+    df_melt = pd.melt(df, id_vars=['airline', 'avail_seat_km'], value_vars=cols)
+
+    df_melt['period'] = df_melt.variable.str.extract(r'_([0-9_]+)')
+    df_melt['period'] = df_melt.period.apply(lambda x : dp.period_map(x))
+    df_melt['variable'] = df_melt.variable.str.extract(r'([a-zA-Z_]+)')
+    df_melt['variable'] = df_melt['variable'].apply(lambda x : x[0:len(x)-1])
+
+    frames = []
+    for period in ['2000-2014', '1985-1999']:
+        df_melt_period = df_melt.loc[df_melt.period == period]
+        df_period = df.loc[:, ['airline', 'avail_seat_km']]
+        df_period['period'] = period
+        for t in df_melt.variable.unique():
+            sub_df = df_melt_period.loc[df_melt_period['variable'] == t, ['airline', 'value']]
+            sub_df.columns = ['airline', t]
+            df_period = df_period.merge(sub_df, how='left', on='airline')
+        frames.append(df_period)
+
+    return pd.concat(frames)
+
+def best_of(func, df, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(df)
+        timings.append(time.perf_counter() - start)
+
+    return min(timings), result
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the wide-to-long reshape behind get_long_data')
+    parser.add_argument('--airlines', type=int, nargs='+', default=[1000, 100000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    for n in args.airlines:
+        df = dp.make_data(synthetic_table(n))
+        legacy_time, expected = best_of(legacy_long_data, df, args.repeat)
+        new_time, result = best_of(dp.make_long_data, df, args.repeat)
+        pd.testing.assert_frame_equal(expected, result)
+        print('{:>9} airlines  legacy {:8.3f}s  vectorized {:8.3f}s  speedup {:6.1f}x'.format(
+            n, legacy_time, new_time, legacy_time / new_time))
@@ -0,0 +1,197 @@
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import data_processing as dp
+
+
+UPDATE_PATH = '/_dash-update-component'
+
+# The two callbacks fired by every airline_picker change: callback name -> output graph id
+CALLBACKS = {
+    'update_incident_rate_airline_comp_graphs': 'airline_incident_rate_bar_graph',
+    'update_fatal_rate_airline_comp_graphs': 'airline_fatal_accidents_rate_bar_graph'
+}
+
+####################
+# Server
+####################
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+# Starts the dashboard on a local port: under gunicorn with the given workers/threads or the Dash dev server
+def start_server(server, workers, threads, port, db_path):
+    env = dict(os.environ, AIRLINE_DB=db_path)
+    if server == 'gunicorn':
+        cmd = [
+            sys.executable, '-m', 'gunicorn', 'app:server',
+            '--bind', '127.0.0.1:{}'.format(port),
+            '--workers', str(workers),
+            '--threads', str(threads),
+            '--log-level', 'warning'
+        ]
+    else:
+        cmd = [sys.executable, '-c', 'import app; app.app.run_server(port={}, debug=False)'.format(port)]
+
+    return subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def wait_until_up(port, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            conn.request('GET', '/')
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('dashboard did not come up on port {} within {}s'.format(port, timeout))
+
+####################
+# Simulated Users
+####################
+def update_body(callback, airline):
+    output = CALLBACKS[callback]
+    return json.dumps({
+        'output': '{}.figure'.format(output),
+        'outputs': {'id': output, 'property': 'figure'},
+        'inputs': [{'id': 'airline_picker', 'property': 'value', 'value': airline}],
+        'changedPropIds': ['airline_picker.value']
+    })
+
+# Returns airlines & pick probabilities where popularity falls off by rank (Zipf), so like real traffic
+# most changes go to a handful of airlines
+def airline_popularity(airlines, zipf, seed):
+    airlines = list(airlines)
+    random.Random(seed).shuffle(airlines)
+    weights = 1 / np.arange(1, len(airlines) + 1) ** zipf
+
+    return airlines, weights / weights.sum()
+
+# One user: changes the dropdown, fires both callbacks in parallel like the browser does, waits for both,
+# thinks for a while & repeats until stop is set. Each sample is (callback, start, latency, ok)
+class SimulatedUser(threading.Thread):
+    def __init__(self, port, airlines, weights, think_time, stop, seed):
+        super().__init__(daemon=True)
+        self.port = port
+        self.airlines = airlines
+        self.weights = weights
+        self.think_time = think_time
+        self.stop = stop
+        self.rng = np.random.default_rng(seed)
+        self.samples = []
+        self._local = threading.local()
+
+    def _connection(self):
+        if not hasattr(self._local, 'conn'):
+            self._local.conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+        return self._local.conn
+
+    def _post(self, callback, airline):
+        start = time.perf_counter()
+        try:
+            conn = self._connection()
+            conn.request('POST', UPDATE_PATH, update_body(callback, airline), {'Content-Type': 'application/json'})
+            response = conn.getresponse()
+            response.read()
+            ok = response.status == 200
+        except (OSError, http.client.HTTPException):
+            del self._local.conn
+            ok = False
+
+        return callback, time.time(), time.perf_counter() - start, ok
+
+    def run(self):
+        with ThreadPoolExecutor(max_workers=len(CALLBACKS)) as executor:
+            while not self.stop.is_set():
+                airline = self.airlines[self.rng.choice(len(self.airlines), p=self.weights)]
+                self.samples.extend(executor.map(lambda callback: self._post(callback, airline), CALLBACKS))
+                if self.think_time > 0:
+                    self.stop.wait(self.rng.exponential(self.think_time))
+
+def percentile_ms(latencies, q):
+    return float(np.percentile(latencies, q) * 1000) if latencies else None
+
+# Runs users against the server for warmup + duration seconds & summarizes the samples after the warmup
+def run_load(port, users, duration, warmup, think_time, airlines, weights, seed):
+    stop = threading.Event()
+    threads = [SimulatedUser(port, airlines, weights, think_time, stop, seed + i) for i in range(users)]
+    for thread in threads:
+        thread.start()
+    time.sleep(warmup)
+    measure_start = time.time()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    measure_end = time.time()
+
+    samples = [s for thread in threads for s in thread.samples if measure_start <= s[1] <= measure_end]
+    summary = {}
+    for callback in CALLBACKS:
+        latencies = [s[2] for s in samples if s[0] == callback and s[3]]
+        errors = sum(1 for s in samples if s[0] == callback and not s[3])
+        summary[callback] = {
+            'requests': len(latencies),
+            'errors': errors,
+            'throughput_rps': len(latencies) / (measure_end - measure_start),
+            'p50_ms': percentile_ms(latencies, 50),
+            'p95_ms': percentile_ms(latencies, 95),
+            'p99_ms': percentile_ms(latencies, 99)
+        }
+
+    return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test the airline_picker callbacks of a locally started dashboard')
+    parser.add_argument('--db', default=dp.DB_PATH, help='SQLite file the dashboard serves, e.g. one from benchmarks.synthetic')
+    parser.add_argument('--server', choices=['gunicorn', 'dev'], default='gunicorn')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help='gunicorn worker counts to test')
+    parser.add_argument('--threads', type=int, default=1, help='gunicorn threads per worker')
+    parser.add_argument('--users', type=int, nargs='+', default=[10, 50], help='concurrent simulated users')
+    parser.add_argument('--duration', type=float, default=30, help='measured seconds per run')
+    parser.add_argument('--warmup', type=float, default=5, help='unmeasured seconds at the start of each run')
+    parser.add_argument('--think-time', type=float, default=0.5, help='mean seconds a user waits between changes')
+    parser.add_argument('--zipf', type=float, default=1.2, help='skew of airline popularity, 0 for uniform')
+    parser.add_argument('--startup-timeout', type=float, default=120)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='loadtest_results.json')
+    args = parser.parse_args()
+
+    if args.server == 'dev':
+        args.workers = [1]
+    airlines, weights = airline_popularity(dp.AirlineDataset(args.db).get_data().airline, args.zipf, args.seed)
+
+    results = []
+    for workers in args.workers:
+        port = free_port()
+        process = start_server(args.server, workers, args.threads, port, args.db)
+        try:
+            wait_until_up(port, args.startup_timeout)
+            for users in args.users:
+                summary = run_load(port, users, args.duration, args.warmup, args.think_time, airlines, weights, args.seed)
+                results.append({'workers': workers, 'threads': args.threads, 'users': users, 'callbacks': summary})
+                for callback, stats in summary.items():
+                    print('{} workers {:>4} users  {:<42} {:>8.1f} req/s  p50 {:>8.1f}ms  p95 {:>8.1f}ms  p99 {:>8.1f}ms  {} errors'.format(
+                        workers, users, callback, stats['throughput_rps'],
+                        stats['p50_ms'] or 0, stats['p95_ms'] or 0, stats['p99_ms'] or 0, stats['errors']))
+        finally:
+            process.terminate()
+            process.wait()
+
+    with open(args.output, 'w') as f:
+        json.dump({'server': args.server, 'db': args.db, 'think_time': args.think_time, 'results': results}, f, indent=2)
+    print('Wrote {} runs to {}'.format(len(results), args.output))
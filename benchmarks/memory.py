@@ -0,0 +1,49 @@
+import argparse
+import json
+
+import data_processing as dp
+from benchmarks.synthetic import synthetic_periods
+
+
+MB = 1024 * 1024
+
+# Returns {frame name: bytes} for every derived frame built with the given dtype settings
+def frame_bytes(db_path, periods, compact, rate_dtype='float64'):
+    dataset = dp.AirlineDataset(db_path, periods=periods, materialized=False, chunksize=0, compact=compact, rate_dtype=rate_dtype)
+    try:
+        return dp.frame_memory(dataset.get_frames())
+    finally:
+        dataset.pool.close()
+
+# Returns the bytes of every frame in the default dtypes & in each compact mode
+def memory_report(db_path, periods, rate_dtypes=('float64', 'float32')):
+    report = {'default': frame_bytes(db_path, periods, False)}
+    for rate_dtype in rate_dtypes:
+        report['compact_{}'.format(rate_dtype)] = frame_bytes(db_path, periods, True, rate_dtype)
+
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Report the bytes every derived frame takes with & without compact dtypes')
+    parser.add_argument('--db', default=dp.DB_PATH, help='SQLite file with the airline_safety table, e.g. one from benchmarks.synthetic')
+    parser.add_argument('--periods', type=int, help='number of synthetic periods the database has (the registry periods by default)')
+    parser.add_argument('--output', help='JSON file to write the report to')
+    args = parser.parse_args()
+
+    report = memory_report(args.db, synthetic_periods(args.periods) if args.periods else dp.PERIODS)
+    modes = list(report)
+    print('{:<24}'.format('frame') + ''.join('{:>20}'.format(mode) for mode in modes))
+    for name in report['default']:
+        print('{:<24}'.format(name) + ''.join(
+            '{:>12.2f}MB {:>5.1f}x'.format(report[mode][name] / MB, report['default'][name] / max(report[mode][name], 1))
+            for mode in modes
+        ))
+    print('{:<24}'.format('total') + ''.join(
+        '{:>12.2f}MB {:>5.1f}x'.format(sum(report[mode].values()) / MB, sum(report['default'].values()) / max(sum(report[mode].values()), 1))
+        for mode in modes
+    ))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'db': args.db, 'frames': report}, f, indent=2)
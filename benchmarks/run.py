@@ -0,0 +1,279 @@
+import argparse
+import importlib
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from collections import namedtuple
+
+import numpy as np
+import psutil
+
+import data_processing as dp
+from correlations import Correlations
+from benchmarks.synthetic import synthetic_periods, write_synthetic_db
+
+
+LOOKUPS = 1000
+CALLBACK_CALLS = 20
+STREAM_CHUNKSIZE = 50000
+TABLE_PAGE_SIZE = 20
+CORRELATION_RESAMPLES = 100
+REFERENCE_CASE = 'reference'
+REFERENCE_ROWS = 1000000
+
+####################
+# Cases
+####################
+# setup() builds whatever the timed function depends on (untimed) & returns state for it, run(state) is the
+# timed work & rows() is how many rows (or calls) that work covers. Everything goes through the module-level
+# data_processing functions, pointed at the synthetic database
+Case = namedtuple('Case', ['setup', 'run', 'rows'])
+
+def airline_count():
+    return len(dp.get_data())
+
+def long_row_count():
+    return len(dp.get_data()) * len(dp.dataset.periods)
+
+def sample_airlines(count):
+    airlines = list(dp.get_data().airline)
+
+    return random.Random(0).sample(airlines, min(count, len(airlines)))
+
+def lookup_case(lookup, prepare):
+    def setup():
+        prepare()
+        return sample_airlines(LOOKUPS)
+
+    return Case(setup, lambda airlines: [lookup(airline) for airline in airlines], lambda: min(LOOKUPS, airline_count()))
+
+# Callbacks are timed on distinct airlines so every call renders (misses the figure cache)
+def callback_case(name):
+    def setup():
+        # The layout isn't needed for the callbacks, so don't build it in the background
+        os.environ['LAYOUT_BUILD'] = 'request'
+        app = importlib.import_module('app')
+        dp.dataset.get_airline_records()
+        dp.dataset.get_competitor_index()
+        return getattr(app, name), sample_airlines(CALLBACK_CALLS)
+
+    def run(state):
+        callback, airlines = state
+        for airline in airlines:
+            callback(airline)
+
+    return Case(setup, run, lambda: min(CALLBACK_CALLS, airline_count()))
+
+# Serves pages of the incident rate % change table sorted by every column in turn (sort orders built untimed)
+def table_page_case():
+    def setup():
+        table = dp.get_perc_change_table('incident_rate')
+        sorts = [[{'column_id': col, 'direction': direction}] for col in table.columns for direction in ('asc', 'desc')]
+        for sort_by in sorts:
+            table.page(0, TABLE_PAGE_SIZE, sort_by)
+        return table, sorts
+
+    def run(state):
+        table, sorts = state
+        for i in range(LOOKUPS):
+            table.page(i % 50, TABLE_PAGE_SIZE, sorts[i % len(sorts)])
+
+    return Case(setup, run, lambda: LOOKUPS)
+
+# Fixed work that doesn't touch the dashboard's code (a NumPy sort & a Python loop over the same seeded values), so
+# its wall time only tracks how fast the machine running the suite is. The other cases are compared to a baseline
+# relative to it (see compare)
+def reference_work(state):
+    values = np.random.default_rng(0).random(REFERENCE_ROWS)
+    np.sort(values)
+    total = 0.0
+    for value in values[:REFERENCE_ROWS // 10].tolist():
+        total += value
+
+    return total
+
+# Streams the table in chunks instead of loading it, folding it into the aggregates & display frames
+def stream_setup():
+    dp.dataset.chunksize = STREAM_CHUNKSIZE
+
+CASES = {
+    REFERENCE_CASE: Case(lambda: None, reference_work, lambda: REFERENCE_ROWS),
+    'get_data': Case(lambda: None, lambda state: dp.get_data(), airline_count),
+    'get_long_data': Case(dp.get_data, lambda state: dp.get_long_data(), long_row_count),
+    'get_aggregates': Case(dp.get_data, lambda state: dp.dataset.get_aggregates(), airline_count),
+    'get_period_mean_data': Case(lambda: dp.dataset.get_aggregates(), lambda state: dp.get_period_mean_data(), long_row_count),
+    'get_period_total_perc_data': Case(lambda: dp.dataset.get_aggregates(), lambda state: dp.get_period_total_perc_data(), long_row_count),
+    'get_rate_correlation': Case(lambda: dp.dataset.get_aggregates(), lambda state: dp.get_rate_correlation('incident_rate'), airline_count),
+    'aggregates_upsert': lookup_case(
+        lambda airline: dp.dataset.get_aggregates().upsert(airline, dp.get_airline_record(airline)),
+        lambda: (dp.dataset.get_aggregates(), dp.dataset.get_airline_records())
+    ),
+    'get_formatted_fatal_rate_perc_changed_by_airline_data': Case(
+        dp.get_data, lambda state: dp.get_formatted_fatal_rate_perc_changed_by_airline_data(), airline_count
+    ),
+    'get_formatted_incident_rate_perc_changed_by_airline_data': Case(
+        dp.get_data, lambda state: dp.get_formatted_incident_rate_perc_changed_by_airline_data(), airline_count
+    ),
+    'get_perc_change_table': Case(dp.get_data, lambda state: dp.get_perc_change_table('incident_rate'), airline_count),
+    'perc_change_table_page': table_page_case(),
+    'get_correlations': Case(
+        lambda: dp.dataset.get_rate_values(),
+        lambda values: Correlations.from_values(values, dp.dataset.rate_columns(), resamples=CORRELATION_RESAMPLES),
+        airline_count
+    ),
+    'make_density_grid': Case(
+        dp.get_data,
+        lambda state: dp.make_density_grid(*(dp.get_data()[dp.column_name('incident_rate', period)] for period in (dp.dataset.periods[0], dp.dataset.periods[-1]))),
+        airline_count
+    ),
+    'stream_table': Case(stream_setup, lambda state: dp.dataset.get_aggregates(), lambda: dp.dataset.get_aggregates().n),
+    'competitor_index': Case(dp.get_data, lambda state: dp.dataset.get_competitor_index(), airline_count),
+    'get_comp_airline': lookup_case(dp.get_comp_airline, lambda: dp.dataset.get_competitor_index()),
+    'similarity_index': Case(dp.get_data, lambda state: dp.dataset.get_similarity_index(), airline_count),
+    'get_similar_airlines': lookup_case(dp.get_similar_airlines, lambda: dp.dataset.get_similarity_index()),
+    'similarity_table': Case(lambda: dp.dataset.get_similarity_index(), lambda state: dp.get_similarity_table(), airline_count),
+    'get_airline_record': lookup_case(dp.get_airline_record, lambda: dp.dataset.get_airline_records()),
+    'query_comp_airline': lookup_case(lambda airline: dp.dataset.query_comp_airline(airline), lambda: None),
+    'query_airline_record': lookup_case(lambda airline: dp.dataset.query_airline_record(airline), lambda: None),
+    'update_incident_rate_airline_comp_graphs': callback_case('update_incident_rate_airline_comp_graphs'),
+    'update_fatal_rate_airline_comp_graphs': callback_case('update_fatal_rate_airline_comp_graphs')
+}
+
+# Returns the process' peak resident set size so far in MB
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS & in kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+# Runs one case in this process against the given database & returns its measurements
+def measure(case_name, db_path, period_count):
+    dp.dataset = dp.AirlineDataset(db_path, periods=synthetic_periods(period_count))
+    case = CASES[case_name]
+
+    state = case.setup()
+    rss_before = psutil.Process().memory_info().rss / (1024 * 1024)
+    start = time.perf_counter()
+    case.run(state)
+    wall = time.perf_counter() - start
+    rows = case.rows()
+
+    return {
+        'wall_s': wall,
+        'rows': rows,
+        'rows_per_s': rows / wall if wall > 0 else None,
+        'rss_before_mb': rss_before,
+        'peak_rss_mb': peak_rss_mb()
+    }
+
+####################
+# Suite
+####################
+# Every case runs in a fresh interpreter so its peak RSS isn't inflated by earlier cases
+def run_case(case_name, db_path, period_count):
+    output = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.run', '--measure', case_name, '--db', db_path, '--periods', str(period_count)],
+        capture_output=True, text=True, check=True
+    )
+
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+def run_suite(sizes, period_counts, case_names, data_dir):
+    results = []
+    for period_count in period_counts:
+        for n in sizes:
+            db_path = os.path.join(data_dir, 'airline_{}_{}p'.format(n, period_count))
+            if not os.path.exists(db_path):
+                write_synthetic_db(db_path, n, synthetic_periods(period_count))
+            for case_name in case_names:
+                result = {'case': case_name, 'airlines': n, 'periods': period_count}
+                result.update(run_case(case_name, db_path, period_count))
+                results.append(result)
+                print('{:<58} {:>9} x{} {:>10.4f}s {:>9.1f}MB {:>14.0f} rows/s'.format(
+                    case_name, n, period_count, result['wall_s'], result['peak_rss_mb'], result['rows_per_s'] or 0))
+
+    return results
+
+# Returns the reference case's wall time by (airlines, periods)
+def reference_walls(results):
+    return {(r['airlines'], r['periods']): r['wall_s'] for r in results if r['case'] == REFERENCE_CASE and r['wall_s'] > 0}
+
+# Adds each result's baseline wall time & ratio, returns the results that got slower than tolerance allows.
+# Absolute wall times only hold on the machine (& load) they were recorded on, so when both runs measured the
+# reference case the baseline's wall time is first scaled by how much faster or slower the reference ran this time.
+# Differences under min_delta seconds are ignored since tiny cases are mostly timer noise
+def compare(results, baseline, tolerance, min_delta):
+    baseline_results = {(r['case'], r['airlines'], r['periods']): r for r in baseline['results']}
+    references, baseline_references = reference_walls(results), reference_walls(baseline['results'])
+    regressions = []
+    for result in results:
+        base = baseline_results.get((result['case'], result['airlines'], result['periods']))
+        if base is None or result['case'] == REFERENCE_CASE:
+            continue
+        size = (result['airlines'], result['periods'])
+        scale = references[size] / baseline_references[size] if size in references and size in baseline_references else 1.0
+        result['baseline_wall_s'] = base['wall_s'] * scale
+        result['ratio'] = result['wall_s'] / result['baseline_wall_s'] if base['wall_s'] > 0 else None
+        if result['ratio'] and result['ratio'] > tolerance and result['wall_s'] - result['baseline_wall_s'] > min_delta:
+            regressions.append(result)
+
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark every data_processing function & the comparison callbacks on synthetic data')
+    parser.add_argument('--airlines', type=int, nargs='+', default=[1000, 100000, 1000000], help='synthetic dataset sizes')
+    parser.add_argument('--periods', type=int, nargs='+', default=[len(dp.PERIODS)], help='numbers of periods per dataset')
+    parser.add_argument('--cases', nargs='+', default=list(CASES), choices=list(CASES))
+    parser.add_argument('--data-dir', help='directory to keep (& reuse) the synthetic databases in, a temporary one by default')
+    parser.add_argument('--output', default='bench_results.json', help='JSON file to write the results to')
+    parser.add_argument('--baseline', help='results JSON to compare against, e.g. benchmarks/baseline.json')
+    parser.add_argument('--tolerance', type=float, default=1.25, help='wall time ratio over the baseline that counts as a regression')
+    parser.add_argument('--min-delta', type=float, default=0.005, help='seconds a case must slow down by to count as a regression')
+    parser.add_argument('--measure', help=argparse.SUPPRESS)
+    parser.add_argument('--db', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.measure, args.db, args.periods[0])))
+        sys.exit(0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = args.data_dir or tmp
+        os.makedirs(data_dir, exist_ok=True)
+        # The reference case runs first at every size, it's what the baseline comparison scales by
+        results = run_suite(args.airlines, args.periods, [REFERENCE_CASE] + [c for c in args.cases if c != REFERENCE_CASE], data_dir)
+
+    report = {
+        'meta': {
+            'created': time.time(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count()
+        },
+        'results': results
+    }
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline_report = json.load(f)
+        regressions = compare(results, baseline_report, args.tolerance, args.min_delta)
+        report['baseline'] = args.baseline
+        if not reference_walls(baseline_report['results']):
+            print('The baseline has no {} case, so its absolute wall times are compared'.format(REFERENCE_CASE))
+        report['regressions'] = [(r['case'], r['airlines'], r['periods'], r['ratio']) for r in regressions]
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print('Wrote {} results to {}'.format(len(results), args.output))
+
+    for r in regressions:
+        print('REGRESSION {} ({} airlines, {} periods): {:.4f}s vs {:.4f}s baseline ({:.2f}x)'.format(
+            r['case'], r['airlines'], r['periods'], r['wall_s'], r['baseline_wall_s'], r['ratio']))
+    sys.exit(1 if regressions else 0)
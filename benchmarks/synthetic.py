@@ -0,0 +1,61 @@
+import argparse
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+import data_processing as dp
+import db
+
+
+# Mean of each metric's counts per period, roughly matching the shipped data
+COUNT_MEANS = {'incidents': 6, 'fatal_accidents': 1, 'fatalities': 50}
+
+
+# Returns count consecutive periods of years each, ending with last_year. Two periods gives dp.PERIODS
+def synthetic_periods(count, last_year=2014, years=15):
+    if count * years > 100:
+        raise ValueError('period codes only keep two digit years, so at most 100 years of periods are supported')
+
+    periods = []
+    for i in range(count):
+        end = last_year - years * (count - 1 - i)
+        start = end - years + 1
+        periods.append(dp.Period('{:02d}_{:02d}'.format(start % 100, end % 100), '{}-{}'.format(start, end), years))
+
+    return periods
+
+# Returns a raw airline_safety table (before get_data's casts & rates) for n synthetic airlines
+def synthetic_table(n, periods=dp.PERIODS, metrics=dp.METRICS, seed=0):
+    rng = np.random.default_rng(seed)
+    raw = pd.DataFrame({'airline': ['Airline {}'.format(i) for i in range(n)]})
+    raw['avail_seat_km_per_week'] = rng.integers(10 ** 8, 10 ** 10, n)
+    for period in periods:
+        for metric in metrics:
+            raw[dp.column_name(metric.count, period)] = rng.poisson(COUNT_MEANS.get(metric.count, 5), n)
+
+    return raw
+
+# Writes a synthetic airline_safety table to a SQLite file, with TEXT columns & indexes like data/airline
+def write_synthetic_db(path, n, periods=dp.PERIODS, metrics=dp.METRICS, seed=0):
+    raw = synthetic_table(n, periods, metrics, seed)
+    conn = sqlite3.connect(path)
+    raw.to_sql('airline_safety', conn, if_exists='replace', index=False, dtype={col: 'TEXT' for col in raw.columns})
+    conn.close()
+    db.ensure_indexes(path)
+
+    return path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write a synthetic airline_safety SQLite database')
+    parser.add_argument('out', help='SQLite file to write')
+    parser.add_argument('--airlines', type=int, default=100000)
+    parser.add_argument('--periods', type=int, default=len(dp.PERIODS))
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    write_synthetic_db(args.out, args.airlines, synthetic_periods(args.periods), seed=args.seed)
+    print('Wrote {} airlines x {} periods to {} in {:.2f}s'.format(args.airlines, args.periods, args.out, time.perf_counter() - start))
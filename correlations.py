@@ -0,0 +1,222 @@
+import argparse
+import multiprocessing
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+
+# Bootstrap resamples per correlation matrix (0 skips the confidence intervals)
+RESAMPLES = int(os.environ.get('CORRELATION_RESAMPLES', 1000))
+# Processes the resamples are spread over (1 runs them in this process)
+WORKERS = int(os.environ.get('CORRELATION_WORKERS', min(4, os.cpu_count() or 1)))
+CONFIDENCE = 0.95
+# Row weights a batch of resamples holds at once (resamples x rows), about BATCH_ROWS x 8 bytes however big the table is
+BATCH_ROWS = 4 * 1024 * 1024
+# Rows whose pairwise column products are formed at once
+BLOCK_ROWS = 64 * 1024
+
+
+####################
+# Correlation Matrices
+####################
+# Pearson correlation matrices from covariance (or co-moment) matrices (... x columns x columns).
+# Columns without variance give NaN like pandas
+def covariance_to_correlation(cov):
+    scale = np.sqrt(np.diagonal(cov, axis1=-2, axis2=-1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.clip(cov / (scale[..., :, None] * scale[..., None, :]), -1, 1)
+
+# Pearson correlation matrix of values' columns (rows x columns) in one matrix product
+def correlation_matrix(values):
+    centered = values - values.mean(axis=0)
+
+    return covariance_to_correlation(centered.T @ centered)
+
+# Correlation matrices of values' rows weighted by each row of weights (weights x rows), e.g. how often a bootstrap
+# resample drew every row. Every pair of columns comes out of one product of the weights with the rows' pairwise
+# products, taken block_rows rows at a time so those products never exist for the whole table at once
+def weighted_correlation_matrices(values, weights, block_rows=BLOCK_ROWS):
+    centered = values - values.mean(axis=0)
+    i, j = np.triu_indices(values.shape[1])
+    products = np.zeros((len(weights), len(i)))
+    for start in range(0, len(values), block_rows):
+        block = centered[start:start + block_rows]
+        products += weights[:, start:start + block_rows] @ (block[:, i] * block[:, j])
+
+    total = weights.sum(axis=1)[:, None]
+    means = weights @ centered / total
+    cov = np.empty((len(weights), values.shape[1], values.shape[1]))
+    cov[:, i, j] = cov[:, j, i] = products / total - means[:, i] * means[:, j]
+
+    return covariance_to_correlation(cov)
+
+# Correlation matrices of resamples bootstrap resamples of values' rows. Each resample is drawn as an array of row
+# indexes & counted into row weights, so no resampled copy of the rows is ever gathered
+def bootstrap_batch(values, seed, resamples):
+    rng = np.random.default_rng(seed)
+    weights = np.empty((resamples, len(values)))
+    for k in range(resamples):
+        weights[k] = np.bincount(rng.integers(0, len(values), size=len(values)), minlength=len(values))
+
+    return weighted_correlation_matrices(values, weights)
+
+# Process pool workers get the values once, when they start, rather than with every batch
+_worker_values = None
+
+def _init_worker(values):
+    global _worker_values
+    _worker_values = values
+
+def _bootstrap_task(seed, resamples):
+    return bootstrap_batch(_worker_values, seed, resamples)
+
+# Returns the correlation matrices of resamples bootstrap resamples of values' rows (resamples x columns x columns).
+# The resamples are split into batches of at most BATCH_ROWS row weights, each with its own seed spawned from
+# seed, so the result only depends on seed, not on how many workers ran the batches
+def bootstrap_correlations(values, resamples=RESAMPLES, seed=0, workers=WORKERS, batch_rows=BATCH_ROWS):
+    if resamples <= 0 or len(values) < 2:
+        return np.empty((0, values.shape[1], values.shape[1]))
+
+    batch = max(1, min(resamples, batch_rows // len(values)))
+    sizes = [min(batch, resamples - start) for start in range(0, resamples, batch)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    if workers > 1 and len(sizes) > 1:
+        # Workers come from a forkserver rather than a fork of this process, which may have other threads (gunicorn's,
+        # the layout's background build) holding locks a forked child would never see released
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(sizes)), mp_context=multiprocessing.get_context('forkserver'),
+            initializer=_init_worker, initargs=(values,)
+        ) as executor:
+            batches = list(executor.map(_bootstrap_task, seeds, sizes))
+    else:
+        batches = [bootstrap_batch(values, s, size) for s, size in zip(seeds, sizes)]
+
+    return np.concatenate(batches)
+
+# Co-moments of every pair of columns folded in chunk by chunk (Chan et al.'s parallel update of the rows' count,
+# column means & co-moment matrix), so the correlation matrix of a streamed table only needs one chunk in memory.
+# Like Correlations.from_values it only counts the rows where every column is finite
+class ComomentMatrix:
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self.n = 0
+        self.mean = np.zeros(len(self.columns))
+        self.m2 = np.zeros((len(self.columns), len(self.columns)))
+
+    def add(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[np.isfinite(values).all(axis=1)]
+        if len(values) == 0:
+            return
+        mean = values.mean(axis=0)
+        centered = values - mean
+        n = self.n + len(values)
+        delta = mean - self.mean
+        self.m2 += centered.T @ centered + np.outer(delta, delta) * self.n * len(values) / n
+        self.mean += delta * len(values) / n
+        self.n = n
+
+    def matrix(self):
+        return covariance_to_correlation(self.m2)
+
+####################
+# Correlations
+####################
+# The correlation matrix of some columns with bootstrap percentile confidence intervals of every coefficient
+class Correlations:
+    def __init__(self, columns, matrix, lower, upper, resamples, confidence, rows):
+        self.columns = list(columns)
+        self.matrix = matrix
+        self.lower = lower
+        self.upper = upper
+        self.resamples = resamples
+        self.confidence = confidence
+        self.rows = rows
+        self._position = {col: i for i, col in enumerate(self.columns)}
+
+    # Computes the correlations of values' columns (rows x columns) over the rows where every column is finite
+    @classmethod
+    def from_values(cls, values, columns, resamples=RESAMPLES, confidence=CONFIDENCE, seed=0, workers=WORKERS):
+        values = np.asarray(values, dtype=float)
+        values = values[np.isfinite(values).all(axis=1)]
+
+        return cls.from_sample(correlation_matrix(values), len(values), values, columns, resamples, confidence, seed, workers)
+
+    # Correlations of a table known by its matrix over rows rows (e.g. from a ComomentMatrix) with the intervals
+    # bootstrapped from a sample of its rows. A smaller sample than the table gives wider intervals than the whole
+    # table would, never narrower ones
+    @classmethod
+    def from_sample(cls, matrix, rows, sample, columns, resamples=RESAMPLES, confidence=CONFIDENCE, seed=0, workers=WORKERS):
+        values = np.asarray(sample, dtype=float)
+        values = values[np.isfinite(values).all(axis=1)]
+
+        samples = bootstrap_correlations(values, resamples, seed, workers)
+        if len(samples):
+            alpha = (1 - confidence) / 2
+            with warnings.catch_warnings():
+                # Pairs without variance in every resample have no interval
+                warnings.simplefilter('ignore', RuntimeWarning)
+                lower, upper = np.nanpercentile(samples, [100 * alpha, 100 * (1 - alpha)], axis=0)
+        else:
+            lower, upper = np.full_like(matrix, np.nan), np.full_like(matrix, np.nan)
+
+        return cls(columns, matrix, lower, upper, len(samples), confidence, rows)
+
+    # Returns the correlations as plain lists & numbers, e.g. to store them in a snapshot's manifest.json
+    def to_dict(self):
+        return {
+            'columns': self.columns,
+            'matrix': self.matrix.tolist(),
+            'lower': self.lower.tolist(),
+            'upper': self.upper.tolist(),
+            'resamples': self.resamples,
+            'confidence': self.confidence,
+            'rows': self.rows
+        }
+
+    @classmethod
+    def from_dict(cls, values):
+        return cls(
+            values['columns'], np.array(values['matrix'], dtype=float), np.array(values['lower'], dtype=float),
+            np.array(values['upper'], dtype=float), values['resamples'], values['confidence'], values['rows']
+        )
+
+    # Returns (correlation, lower, upper) of a pair of columns
+    def get(self, x, y):
+        i, j = self._position[x], self._position[y]
+
+        return self.matrix[i, j], self.lower[i, j], self.upper[i, j]
+
+    # Returns every pair of distinct columns with its correlation & interval, one row per pair
+    def frame(self):
+        i, j = np.triu_indices(len(self.columns), k=1)
+
+        return pd.DataFrame({
+            'x': [self.columns[k] for k in i],
+            'y': [self.columns[k] for k in j],
+            'correlation': self.matrix[i, j],
+            'lower': self.lower[i, j],
+            'upper': self.upper[i, j]
+        })
+
+
+if __name__ == '__main__':
+    import data_processing as dp
+
+    parser = argparse.ArgumentParser(description='Correlate every rate in every period with bootstrap confidence intervals')
+    parser.add_argument('--db', default=dp.DB_PATH, help='SQLite file with the airline_safety table')
+    parser.add_argument('--resamples', type=int, default=RESAMPLES)
+    parser.add_argument('--confidence', type=float, default=CONFIDENCE)
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    dataset = dp.AirlineDataset(args.db)
+    correlations = Correlations.from_values(
+        dataset.get_rate_values(), dataset.rate_columns(), args.resamples, args.confidence, args.seed, args.workers
+    )
+    print('{} airlines, {} resamples, {:.0%} intervals'.format(correlations.rows, correlations.resamples, correlations.confidence))
+    print(correlations.frame().to_string(index=False, float_format='{:.3f}'.format))
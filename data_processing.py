@@ -1,141 +1,725 @@
 import pandas as pd
 import numpy as np
-import sqlite3
+import operator
+import os
+import re
+import threading
+from collections import namedtuple
+from itertools import islice
 
+import db
+import instrumentation
+import profiling
+from aggregates import AggregateEngine
+from correlations import ComomentMatrix, Correlations
+from similarity import SimilarityIndex, feature_columns
 
-# Returns the data from sqlite table & calculates new metrics
-def get_data():
-    conn = sqlite3.connect("data/airline")
-    cur = conn.cursor()
-    df = pd.read_sql_query("SELECT * FROM airline_safety;", conn)
-    conn.close()
 
+DB_PATH = db.DB_PATH
+# Where per-airline lookups (competitors & records) come from: 'memory' serves them from indexes built
+# over the whole table, 'sql' runs a small indexed query per lookup & never loads the table for them
+LOOKUP = os.environ.get("AIRLINE_LOOKUP", "memory")
+# Who an airline's competitors are: 'ask' the airlines closest in ASK, 'similarity' the airlines with the most
+# similar safety profile (ASK & every period's incident & fatal accidents rates, see similarity.py)
+COMPETITORS = os.environ.get("AIRLINE_COMPETITORS", "ask")
+# Read the derived tables materialize.py stores in the database instead of computing them
+MATERIALIZED = bool(os.environ.get("AIRLINE_MATERIALIZED"))
+# Rows per chunk when the table is streamed instead of loaded whole (0 loads it whole, see AirlineDataset._stream)
+CHUNKSIZE = int(os.environ.get("AIRLINE_CHUNKSIZE", 0))
+# Rows of the airline tables & scatterplots kept when streaming
+DISPLAY_ROWS = int(os.environ.get("AIRLINE_DISPLAY_ROWS", 1000))
+# Keep the wide & long frames in compact dtypes (see compact_frame) & the float dtype their rates use then
+COMPACT = bool(os.environ.get("AIRLINE_COMPACT"))
+RATE_DTYPE = os.environ.get("AIRLINE_RATE_DTYPE", "float64")
+PERIOD_COLUMN = re.compile(r'^([a-zA-Z_]+)_([0-9]+_[0-9]+)$')
+# One part of a DataTable filter_query, e.g. {airline} contains "Air" or {perc_change} s>= 10
+FILTER_PART = re.compile(r'^\{(?P<column>[^}]+)\}\s+(?P<case>[si]?)(?P<operator>contains|eq|ne|lt|le|gt|ge|>=|<=|!=|<|>|=)\s+(?P<value>.+)$')
+FILTER_OPERATORS = {
+    '=': operator.eq, 'eq': operator.eq, '!=': operator.ne, 'ne': operator.ne,
+    '<': operator.lt, 'lt': operator.lt, '<=': operator.le, 'le': operator.le,
+    '>': operator.gt, 'gt': operator.gt, '>=': operator.ge, 'ge': operator.ge
+}
+
+####################
+# Metric Registry
+####################
+# A period of the data: column suffix, display label & number of years its counts span
+Period = namedtuple('Period', ['code', 'label', 'years'])
+# A count column & the rate per trillion available seat km (ASK) derived from it
+Metric = namedtuple('Metric', ['count', 'rate'])
+
+PERIODS = [
+    Period('85_99', '1985-1999', 15),
+    Period('00_14', '2000-2014', 15),
+]
+
+METRICS = [
+    Metric('incidents', 'incident_rate'),
+    Metric('fatal_accidents', 'fatal_accidents_rate'),
+    Metric('fatalities', 'fatalities_rate'),
+]
+
+# The rates that make up an airline's safety profile, next to its ASK (see similarity_columns)
+SIMILARITY_RATES = ['incident_rate', 'fatal_accidents_rate']
+
+# The rates the dashboard tabulates by % change & the display name of their % change column
+PERC_CHANGE_COLUMNS = {
+    'incident_rate': 'Incident Rate % Change',
+    'fatal_accidents_rate': 'Fatal Accidents Rate % Change',
+}
+
+RATE_SCALE = 1000000000000
+WEEKS_PER_YEAR = 52
+
+# Returns the wide column name of a metric in a period, e.g. incident_rate_85_99
+def column_name(metric, period):
+    return '{}_{}'.format(metric, period.code)
+
+
+# Reads the airline_safety table once & memoizes every frame derived from it.
+# The cache is only dropped when the SQLite file changes, which is detected through
+# PRAGMA data_version (commits from other connections) and the file's mtime/size (file replaced).
+# Frames are shared between callers so treat them as read-only.
+# All reads go through a pool of read-only connections (see db.py). When materialized, the rates, period
+# aggregates & competitors are read from the tables materialize.py keeps instead of being computed.
+# With a chunksize the table is streamed instead: only aggregates & bounded display frames are kept.
+# When compact, the wide & long frames are kept in compact dtypes (see compact_frame)
+class AirlineDataset:
+    def __init__(self, db_path=DB_PATH, periods=PERIODS, metrics=METRICS, lookup=LOOKUP, materialized=MATERIALIZED,
+                 chunksize=CHUNKSIZE, display_rows=DISPLAY_ROWS, compact=COMPACT, rate_dtype=RATE_DTYPE, competitors=COMPETITORS):
+        self.db_path = db_path
+        self.periods = periods
+        self.metrics = metrics
+        self.lookup = lookup
+        self.competitors = competitors
+        self.materialized = materialized
+        self.chunksize = chunksize
+        self.display_rows = display_rows
+        self.compact = compact
+        self.rate_dtype = rate_dtype
+        self.pool = db.ConnectionPool(db_path)
+        self._lock = threading.RLock()
+        self._stat = None
+        self._version = None
+        self._frames = {}
+
+    # Returns a fingerprint of the SQLite file that changes whenever its contents change
+    def version(self):
+        with self._lock:
+            stat = os.stat(self.db_path)
+            stat = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            if stat != self._stat:
+                self.pool.reset()
+                self._stat = stat
+            data_version = self.pool.data_version()
+
+            return stat + (data_version,)
+
+    # Returns the cached frame for name, building it on first use or after the file changed
+    def _memo(self, name, build):
+        with self._lock:
+            version = self.version()
+            if version != self._version:
+                self._frames = {}
+                self._version = version
+            if name not in self._frames:
+                self._frames[name] = build()
+
+            return self._frames[name]
+
+    def get_data(self):
+        if self.materialized:
+            return self._memo('data', lambda: self._compact(self._load(db.read_rates)))
+
+        return self._memo('data', lambda: self._compact(make_data(self._load(db.read_table), self.periods, self.metrics)))
+
+    def get_long_data(self):
+        return self._memo('long', lambda: self._compact(make_long_data(self.get_data(), self.periods)))
+
+    # The period frames are built from the aggregates on every call (a row per period), so they always show the
+    # airlines written through upsert_airline & remove_airline
+    def get_period_mean_data(self):
+        if self.materialized:
+            return self._memo('period_mean', lambda: make_materialized_period_mean_data(self._read(db.read_period_aggregates)))
+
+        return make_aggregates_period_mean_data(self.get_aggregates(), self.periods)
+
+    def get_period_total_perc_data(self):
+        if self.materialized:
+            return self._memo('period_total_perc', lambda: make_materialized_period_total_perc_data(self._read(db.read_period_aggregates)))
+
+        return make_aggregates_period_total_perc_data(self.get_aggregates(), self.periods)
+
+    # Running sums & co-moments of every count & rate. Airlines this dataset writes through upsert_airline &
+    # remove_airline are applied to it in O(1); any other change to the SQLite file (including those written by
+    # another process's dataset) rebuilds it
+    def get_aggregates(self):
+        if self.streaming:
+            return self._memo('aggregates', lambda: self._stream()['aggregates'])
+
+        return self._memo('aggregates', lambda: make_aggregates(self.get_data(), self.periods, self.metrics))
+
+    # Returns the Pearson correlation of a rate between the first & last period
+    def get_rate_correlation(self, metric):
+        return self.get_aggregates().correlation(column_name(metric, self.periods[0]), column_name(metric, self.periods[-1]))
+
+    # Every rate in every period, the columns get_correlations correlates
+    def rate_columns(self):
+        return [column_name(metric.rate, period) for period in self.periods for metric in self.metrics]
+
+    # Returns the rate columns' values (airlines x rate_columns), read chunk by chunk when streaming. It holds every
+    # airline even then, so the dashboard doesn't use it when streaming (see get_correlations)
+    def get_rate_values(self):
+        columns = self.rate_columns()
+        if self.streaming:
+            return np.concatenate([np.empty((0, len(columns)))] + [chunk[columns].to_numpy(dtype=float) for chunk in self.iter_data()])
+
+        return self.get_data()[columns].to_numpy(dtype=float)
+
+    # Correlation matrix of every rate in every period with bootstrap confidence intervals (see correlations.py).
+    # Resampling is the slow part, so it's only redone when the SQLite file changes & a snapshot keeps it too.
+    # When streaming, the matrix comes from the co-moments folded chunk by chunk & the intervals are bootstrapped
+    # from the display sample, so they're wider than the whole table's
+    def get_correlations(self):
+        if self.streaming:
+            return self._memo('correlations', lambda: Correlations.from_sample(
+                self._stream()['rate_comoments'].matrix(), self._stream()['rate_comoments'].n,
+                self._stream()['display'][self.rate_columns()].to_numpy(dtype=float), self.rate_columns()
+            ))
+
+        return self._memo('correlations', lambda: Correlations.from_values(self.get_rate_values(), self.rate_columns()))
+
+    # Returns the bootstrap confidence interval (lower, upper) of a rate's correlation between the first & last period
+    def get_rate_correlation_interval(self, metric):
+        _, lower, upper = self.get_correlations().get(column_name(metric, self.periods[0]), column_name(metric, self.periods[-1]))
+
+        return lower, upper
+
+    def get_formatted_fatal_rate_perc_changed_by_airline_data(self):
+        if self.streaming:
+            return self._memo('fatal_perc_changed', lambda: format_perc_changed_data(
+                self._stream()['perc_changed']['fatal_accidents_rate'].copy(), PERC_CHANGE_COLUMNS['fatal_accidents_rate']
+            ))
+
+        return self._memo('fatal_perc_changed', lambda: make_formatted_fatal_rate_perc_changed_by_airline_data(self.get_data(), self.periods))
+
+    def get_formatted_incident_rate_perc_changed_by_airline_data(self):
+        if self.streaming:
+            return self._memo('incident_perc_changed', lambda: format_perc_changed_data(
+                self._stream()['perc_changed']['incident_rate'].copy(), PERC_CHANGE_COLUMNS['incident_rate']
+            ))
+
+        return self._memo('incident_perc_changed', lambda: make_formatted_incident_rate_perc_changed_by_airline_data(self.get_data(), self.periods))
+
+    # The % change of a rate (one of PERC_CHANGE_COLUMNS) by airline, paged, sorted & filtered on the server
+    def get_perc_change_table(self, metric):
+        return self._memo('{}_perc_change_table'.format(metric), lambda: PercChangeTable.from_frame(self._perc_changed(metric), metric, self.periods))
+
+    def _perc_changed(self, metric):
+        if self.streaming:
+            return self._stream()['perc_changed'][metric]
+
+        columns = ['airline', column_name(metric, self.periods[0]), column_name(metric, self.periods[-1])]
+
+        return make_perc_changed_by_airline_data(self.get_data().loc[:, columns], metric, PERC_CHANGE_COLUMNS[metric], self.periods)
+
+    # Returns the rows to plot airline by airline: every row, or a sample of display_rows when streaming
+    def get_display_data(self):
+        if self.streaming:
+            return self._memo('display', lambda: self._stream()['display'])
+
+        return self.get_data()
+
+    @property
+    def streaming(self):
+        return self.chunksize > 0
+
+    # Yields get_data() in chunks of chunksize rows (indexed like get_data()) without loading the whole table
+    def iter_data(self, chunksize=None):
+        with self.pool.connection() as conn:
+            start = 0
+            chunks = db.read_table_chunks(conn, chunksize or self.chunksize)
+            for chunk in instrumentation.timed_iter(chunks, instrumentation.STAGE_SECONDS.labels('load')):
+                chunk.index = pd.RangeIndex(start, start + len(chunk))
+                start += len(chunk)
+                yield make_data(chunk, self.periods, self.metrics)
+
+    # Streams the table once & folds every chunk into the aggregates, the top display_rows rows of every % change
+    # table & a seeded uniform sample of display_rows rows (in table order), so memory stays bounded by the
+    # chunk & display sizes however big the table is
+    def _stream(self):
+        return self._memo('stream', lambda: fold_chunks(self.iter_data(), self.display_rows, self.periods, self.metrics))
+
+    def get_competitor_index(self):
+        return self._memo('competitor_index', lambda: CompetitorIndex(self.get_data()))
+
+    def get_comp_airline(self, airline, k=3):
+        if self.competitors == 'similarity':
+            return self.get_similar_airlines(airline, k)
+        if self.materialized:
+            with self.pool.connection() as conn, instrumentation.COMPETITOR_SQL_SECONDS.time():
+                if k <= db.read_competitor_count(conn):
+                    return db.read_competitors(conn, airline, k)
+        if self.lookup == 'sql' or self.streaming:
+            return self.query_comp_airline(airline, k)
+
+        return self.get_competitor_index().get_comp_airline(airline, k)
+
+    # k-d tree over every airline's normalized safety profile (see similarity.py), its features read chunk by chunk
+    # when streaming
+    def get_similarity_index(self):
+        return self._memo('similarity_index', self._build_similarity_index)
+
+    def _build_similarity_index(self):
+        chunks = self.iter_data() if self.streaming else [self.get_data()]
+        airlines, values, columns = [], [], None
+        for chunk in chunks:
+            columns = columns or similarity_columns(chunk, self.periods, self.metrics)
+            airlines.append(chunk.airline.to_numpy(dtype=object))
+            values.append(chunk[columns].to_numpy(dtype=float))
+        if columns is None:
+            columns = similarity_columns(pd.DataFrame(), self.periods, self.metrics)
+
+        return SimilarityIndex.from_values(
+            np.concatenate([np.empty(0, dtype=object)] + airlines), np.concatenate([np.empty((0, len(columns)))] + values), columns
+        )
+
+    # Returns the k airlines with the most similar safety profile, most similar first
+    def get_similar_airlines(self, airline, k=3):
+        return self.get_similarity_index().get_similar_airlines(airline, k)
+
+    # Every airline's k most similar airlines in one batched query, one row per (airline, rank)
+    def get_similarity_table(self, k=3):
+        return self._memo('similarity_table_{}'.format(k), lambda: self.get_similarity_index().knn_table(k))
+
+    def get_airline_records(self):
+        return self._memo('airline_records', lambda: AirlineRecords(self.get_data()))
+
+    def get_airline_record(self, airline):
+        if self.materialized:
+            record = self._read(db.read_rates_record, airline)
+            return None if record is None else {
+                col: np.float64(value) if isinstance(value, float) else value if isinstance(value, str) else np.int64(value)
+                for col, value in record.items()
+            }
+        if self.lookup == 'sql' or self.streaming:
+            return self.query_airline_record(airline)
+
+        return self.get_airline_records().get(airline)
+
+    def query_comp_airline(self, airline, k=3):
+        with self.pool.connection() as conn, instrumentation.COMPETITOR_SQL_SECONDS.time():
+            return query_comp_airline(conn, airline, k, self.periods)
+
+    # Same as get_airline_records().get(airline) but reads & computes only the airline's row
+    def query_airline_record(self, airline):
+        with self.pool.connection() as conn:
+            row = db.read_airline(conn, airline)
+        if row is None:
+            return None
+
+        return make_record(row, self.periods, self.metrics)
+
+
+    ####################
+    # Ingest
+    ####################
+    # Writes an airline's raw airline_safety row (column -> value) over its current one, or appends it for a new
+    # airline, & applies the change to the aggregates instead of rebuilding them. Columns row leaves out keep the
+    # airline's current values
+    def upsert_airline(self, row):
+        self._write(row['airline'], row)
+
+    # Deletes an airline's row & takes it out of the aggregates
+    def remove_airline(self, airline):
+        self._write(airline, None)
+
+    # Writes an airline's row (None to delete it) holding SQLite's write lock. The row's record is computed before
+    # anything is written, so a row that can't be (e.g. a new airline missing a count) raises & rolls back.
+    # Aggregates that were current before the write are carried over to the file's new version with the airline's
+    # row replaced; every other frame is dropped as on any other change, since they hold rows. Aggregates that
+    # weren't built yet (or had already been left behind by another writer) are built from the new table when next
+    # asked for. Streamed aggregates have no keys, so the row the write replaced is taken out by its values instead
+    def _write(self, airline, row):
+        with self._lock:
+            with db.write_transaction(self.db_path) as conn:
+                aggregates = self._frames.get('aggregates') if self.version() == self._version else None
+                previous = db.read_airline(conn, airline)
+                values = None
+                if row is not None:
+                    row = dict(previous or {}, **row)
+                    values = make_record(row, self.periods, self.metrics)
+                    db.write_airline(conn, row)
+                elif previous is not None:
+                    db.delete_airline(conn, airline)
+            self._frames = {}
+            self._version = self.version()
+            if aggregates is None or (previous is None and row is None):
+                return
+            if not aggregates.keyed:
+                aggregates.replace(None if previous is None else make_record(previous, self.periods, self.metrics), values)
+            elif values is None:
+                aggregates.remove(airline)
+            else:
+                aggregates.upsert(airline, values)
+            self._frames['aggregates'] = aggregates
+
+    # Returns the frames built so far by name without building any (the competitor index & % change tables as
+    # their frames), e.g. to report their memory
+    def cached_frames(self):
+        with self._lock:
+            frames = {name: getattr(value, 'frame', value) for name, value in self._frames.items()}
+
+            return {name: frame for name, frame in frames.items() if isinstance(frame, pd.DataFrame)}
+
+    # Returns a fingerprint of the SQLite file that, unlike version(), is comparable across processes
+    def source(self):
+        stat = os.stat(self.db_path)
+
+        return [stat.st_mtime_ns, stat.st_size]
+
+    # Builds every derived frame the dashboard serves & returns them by name (the competitor index & % change
+    # tables as their frames)
+    def get_frames(self):
+        with self._lock:
+            frames = {
+                'data': self.get_data(),
+                'long': self.get_long_data(),
+                'competitor_index': self.get_competitor_index().frame
+            }
+            for metric in PERC_CHANGE_COLUMNS:
+                frames['{}_perc_change_table'.format(metric)] = self.get_perc_change_table(metric).frame
+
+            return frames
+
+    # Seeds the cache with frames from get_frames() (e.g. loaded from a snapshot) & get_correlations() if given,
+    # if they were built from the current SQLite file. Returns whether they were used
+    def seed(self, frames, source, correlations=None):
+        with self._lock:
+            if list(source) != self.source():
+                return False
+            self._version = self.version()
+            self._frames = dict(frames)
+            if correlations is not None:
+                self._frames['correlations'] = correlations
+            self._frames['competitor_index'] = CompetitorIndex(frames['competitor_index'])
+            for metric in PERC_CHANGE_COLUMNS:
+                name = '{}_perc_change_table'.format(metric)
+                if name in frames:
+                    self._frames[name] = PercChangeTable(frames[name])
+
+            return True
+
+    # Returns the settings the frames are built with (their dtypes & whether the table is streamed), so stored frames
+    # can be matched to them
+    def dtypes(self):
+        return {'compact': self.compact, 'rate_dtype': self.rate_dtype if self.compact else 'float64', 'streaming': self.streaming}
+
+    def _compact(self, df):
+        return compact_frame(df, self.rate_dtype) if self.compact else df
+
+    # Runs one of the db.py queries on a pooled connection
+    def _read(self, query, *args):
+        with self.pool.connection() as conn:
+            return query(conn, *args)
+
+    # Reads a whole table, timed as the pipeline's load stage
+    def _load(self, query):
+        with instrumentation.stage('load'):
+            return self._read(query)
+
+
+# Calculates the registry's rates on top of the raw airline_safety table
+# Every rate for every period comes out of one broadcasted (airlines x metrics x periods) NumPy operation
+def make_data(df, periods=PERIODS, metrics=METRICS):
     cols = list(df.columns)
     cols.remove('airline')
-    for col in cols:
-        df[col] = df[col].astype(int)
-
-    # New Metrics
-    df['avail_seat_km'] = (df.avail_seat_km_per_week * 52 * 15)
-    df['incident_rate_85_99'] = 1000000000000 *  df.incidents_85_99 / (df.avail_seat_km)
-    df['fatal_accidents_rate_85_99'] = 1000000000000 *  df.fatal_accidents_85_99 / (df.avail_seat_km)
-    df['fatalities_rate_85_99'] = 1000000000000 *  df.fatalities_85_99 / (df.avail_seat_km)                                  
-    df['incident_rate_00_14'] = 1000000000000 *  df.incidents_00_14 / (df.avail_seat_km)
-    df['fatal_accidents_rate_00_14'] = 1000000000000 *  df.fatal_accidents_00_14 / (df.avail_seat_km)
-    df['fatalities_rate_00_14'] = 1000000000000 *  df.fatalities_00_14 / (df.avail_seat_km)         
+    with instrumentation.stage('type_cast'):
+        df = df.astype({col: int for col in cols})
 
-    return df
+    with instrumentation.stage('rates'):
+        n = len(df)
+        counts = df[[column_name(metric.count, period) for metric in metrics for period in periods]] \
+            .to_numpy() \
+            .reshape(n, len(metrics), len(periods))
+        ask, rates = compute_rates(df.avail_seat_km_per_week.to_numpy(), counts, periods)
+
+        # Rate columns are laid out period by period, e.g. incident_rate_85_99, ..., fatalities_rate_00_14
+        rates = pd.DataFrame(
+            rates.transpose(0, 2, 1).reshape(n, len(periods) * len(metrics)),
+            columns = [column_name(metric.rate, period) for period in periods for metric in metrics],
+            index = df.index
+        )
+        df['avail_seat_km'] = ask[:, 0]
+
+        return pd.concat([df, rates], axis=1)
+
+# Returns the ASK of every period (airlines x periods) & every rate (airlines x metrics x periods)
+# from the weekly ASK & the counts (airlines x metrics x periods)
+def compute_rates(ask_per_week, counts, periods=PERIODS):
+    years = np.array([period.years for period in periods])
+    ask = ask_per_week[:, None] * WEEKS_PER_YEAR * years[None, :]
+
+    return ask, RATE_SCALE * counts / ask[:, None, :]
+
+# Returns one raw airline_safety row (column -> value) as the same dict AirlineRecords.get gives for
+# make_data's row, without building a frame
+def make_record(row, periods=PERIODS, metrics=METRICS):
+    record = {col: value if col == 'airline' else np.int64(value) for col, value in row.items()}
+    counts = np.array([[[record[column_name(metric.count, period)] for period in periods] for metric in metrics]])
+    ask, rates = compute_rates(np.array([record['avail_seat_km_per_week']]), counts, periods)
 
-def period_map(time_period):
-    if time_period == '85_99':
-        return '1985-1999'
+    record['avail_seat_km'] = ask[0, 0]
+    for j, period in enumerate(periods):
+        for i, metric in enumerate(metrics):
+            record[column_name(metric.rate, period)] = rates[0, i, j]
+
+    return record
+
+# Returns the display label of a period code, e.g. 85_99 -> 1985-1999
+def period_map(time_period, periods=PERIODS):
+    for period in periods:
+        if period.code == time_period:
+            return period.label
+
+    return time_period
+
+# Splits the wide column names into (metric, period) pairs, e.g. incident_rate_85_99 -> (incident_rate, 85_99)
+# Metrics & periods keep the order they first appear in the schema
+def parse_period_columns(columns):
+    metrics, periods, period_columns = [], [], {}
+    for col in columns:
+        match = PERIOD_COLUMN.match(col)
+        if match is None:
+            continue
+        metric, period = match.groups()
+        if metric not in metrics:
+            metrics.append(metric)
+        if period not in periods:
+            periods.append(period)
+        period_columns[(metric, period)] = col
+
+    return metrics, periods, period_columns
+
+# Returns long data format where periods get their own rows (latest period first)
+# The (airline, period, metric) values are pulled out of the wide frame in one take & reshaped, no melt or merges
+@instrumentation.stage('melt_merge')
+def make_long_data(df, periods=PERIODS):
+    metrics, codes, period_columns = parse_period_columns(df.columns)
+    codes = codes[::-1]
+    cols = [period_columns[(metric, code)] for code in codes for metric in metrics]
+
+    n = len(df)
+    values = df[cols].to_numpy(dtype=float) \
+        .reshape(n, len(codes), len(metrics)) \
+        .transpose(1, 0, 2) \
+        .reshape(n * len(codes), len(metrics))
+
+    # A categorical airline column (see compact_frame) is tiled by its codes so the names aren't copied per row
+    airline = df.airline.array
+    if isinstance(airline, pd.Categorical):
+        airlines = pd.Categorical.from_codes(np.tile(airline.codes, len(codes)), dtype=airline.dtype)
     else:
-        return '2000-2014'
+        airlines = np.tile(airline.to_numpy(), len(codes))
 
-# Returns long data format where periods get their own rows
-def get_long_data():
-    df = get_data()
+    df_long = pd.DataFrame(values, columns=metrics, index=np.tile(np.arange(n), len(codes)))
+    df_long.insert(0, 'airline', airlines)
+    df_long.insert(1, 'avail_seat_km', np.tile(df.avail_seat_km.to_numpy(), len(codes)))
+    df_long.insert(2, 'period', np.repeat(np.array([period_map(code, periods) for code in codes], dtype=object), n))
 
-    cols = list(df.columns)
-    cols.remove("airline")
-    cols.remove("avail_seat_km_per_week")
-    cols.remove("avail_seat_km")
-    df_melt = pd.melt(df, id_vars=['airline', 'avail_seat_km'], value_vars=cols)
-
-    # Extract period from the variable col
-    df_melt['period'] = df_melt.variable.str.extract(r'_([0-9_]+)')
-
-    # Clean up the variable column
-    df_melt['period'] = df_melt.period.apply(lambda x : period_map(x))
-    df_melt['variable'] = df_melt.variable.str.extract(r'([a-zA-Z_]+)')
-    df_melt['variable'] = df_melt['variable'].apply(lambda x : x[0:len(x)-1])
-
-    # Extract 1985 data
-    df_melt_1985 = df_melt.loc[df_melt.period == '1985-1999']
-    variable_types = df_melt.variable.unique()
-    df1985 = df.loc[:, ['airline', 'avail_seat_km']]
-    df1985['period'] = '1985-1999'
-
-    for t in variable_types:
-        sub_df = df_melt_1985.loc[df_melt_1985['variable'] == t,  ['airline', 'value']]
-        sub_df.columns = ['airline', t]
-        df1985 = df1985.merge(sub_df, how='left', on='airline')
-
-    # Extract 2000 data
-    df_melt_2000 = df_melt.loc[df_melt.period == '2000-2014']
-    variable_types = df_melt.variable.unique()
-    df2000 = df.loc[:, ['airline', 'avail_seat_km']]
-    df2000['period'] = '2000-2014'
-
-    for t in variable_types:
-        sub_df = df_melt_2000.loc[df_melt_2000 ['variable'] == t,  ['airline', 'value']]
-        sub_df.columns = ['airline', t]
-        df2000 = df2000.merge(sub_df, how='left', on='airline')
-
-    # combine 1985 and 2000
-    df_clean = pd.concat([df2000, df1985])
-
-    return df_clean
-
-# Returns the top three closest airlines based on ASK based on the argument
-def get_comp_airline(airline):
-    # Recursive Query
-    query = """
-    SELECT
-        airline 
-        , comp_airline
-    FROM
-    (
-        SELECT
-            a.airline
-            , a.avail_seat_km
-            , a.comp_avail_seat_km
-            , a.comp_airline
-            , a.comp_percentage
-            , ROW_NUMBER() OVER(PARTITION BY a.airline ORDER BY a.comp_percentage ASC) AS comp_rank
-        FROM
-        (
-            SELECT
-                a.airline
-                , (a.avail_seat_km_per_week * 52 * 15) AS avail_seat_km
-                , b.airline AS comp_airline
-                , (b.avail_seat_km_per_week * 52 * 15) AS comp_avail_seat_km
-                , ABS(CAST(((a.avail_seat_km_per_week * 52 * 15) - (b.avail_seat_km_per_week * 52 * 15)) AS float)) / (b.avail_seat_km_per_week * 52 * 15) AS comp_percentage
-            FROM
-                airline_safety AS a
-                LEFT JOIN airline_safety AS b
-                    ON a.airline != b.airline
-        ) AS a
-    )
-    WHERE
-        comp_rank IN (1, 2, 3)
-    ;
-    """
-    conn = sqlite3.connect("data/airline")
-    cur = conn.cursor()
-    airline_comp = pd.read_sql_query(query, conn)
-    conn.close()
-    airline_comparison_list = list(airline_comp.loc[airline_comp['airline'] == airline , 'comp_airline'])
+    return df_long
 
+# Returns the similarity features of a get_data() frame: ASK, the SIMILARITY_RATES of every period & any numeric
+# column that isn't one of the registry's
+def similarity_columns(df, periods=PERIODS, metrics=METRICS):
+    known = {'avail_seat_km_per_week', 'avail_seat_km'} | {
+        column_name(value, period) for period in periods for metric in metrics for value in (metric.count, metric.rate)
+    }
+
+    return feature_columns(df, known, [column_name(metric, period) for period in periods for metric in SIMILARITY_RATES])
+
+# Returns the frame in compact dtypes: the airline & period names as categoricals where they repeat (one copy of
+# each name plus small integer codes per row; unique names gain nothing from it), every integer column downcast
+# to the smallest type holding its values & every float column (the rates) as rate_dtype, e.g. float32 to halve
+# them at ~7 significant digits
+@instrumentation.stage('type_cast')
+def compact_frame(df, rate_dtype=RATE_DTYPE, categorical=('airline', 'period')):
+    columns = {}
+    for col in df.columns:
+        values = df[col]
+        if col in categorical and values.dtype == object and values.nunique() <= len(values) // 2:
+            values = values.astype('category')
+        elif pd.api.types.is_integer_dtype(values.dtype):
+            values = pd.to_numeric(values, downcast='integer')
+        elif pd.api.types.is_float_dtype(values.dtype):
+            values = values.astype(rate_dtype, copy=False)
+        columns[col] = values
+
+    return pd.DataFrame(columns, index=df.index)
+
+# Returns the bytes every frame takes, strings included (memory_usage(deep=True))
+def frame_memory(frames):
+    return {name: int(df.memory_usage(deep=True).sum()) for name, df in frames.items()}
+
+# Airline-keyed rows of the wide frame. Each airline maps to its row position & values are read from
+# per-column NumPy arrays, so a lookup is O(1) instead of a boolean-mask scan over every airline
+class AirlineRecords:
+    def __init__(self, df):
+        self.columns = {col: df[col].to_numpy() for col in df.columns}
+        self.position = {airline: i for i, airline in enumerate(self.columns['airline'])}
+
+    # Returns the airline's row as a dict of column -> value (None for an unknown airline)
+    def get(self, airline):
+        i = self.position.get(airline)
+        if i is None:
+            return None
+
+        return {col: values[i] for col, values in self.columns.items()}
+
+# Airlines sorted by ASK. An airline's closest competitors are found by walking outward from its
+# position, since the relative ASK distance |a - b| / b only grows as b moves away from a in either direction
+class CompetitorIndex:
+    def __init__(self, df):
+        order = np.argsort(df.avail_seat_km.to_numpy(), kind='stable')
+        self.frame = df.loc[:, ['airline', 'avail_seat_km']].iloc[order].reset_index(drop=True)
+        self.airlines = self.frame.airline.to_numpy()
+        self.ask = self.frame.avail_seat_km.to_numpy().astype(float)
+        self.position = {airline: i for i, airline in enumerate(self.airlines)}
+
+    # Returns the k closest airlines based on ASK, closest first
+    def get_comp_airline(self, airline, k=3):
+        if airline not in self.position:
+            return []
+
+        i = self.position[airline]
+        below = zip(self.airlines[:i][::-1], self.ask[:i][::-1])
+        above = zip(self.airlines[i + 1:], self.ask[i + 1:])
+
+        return nearest_by_ask(self.ask[i], self._first(below, airline, k), self._first(above, airline, k), k)
+
+    # Returns the first k (airline, ASK) pairs that aren't the airline itself, without walking further
+    @staticmethod
+    def _first(neighbours, airline, k):
+        return list(islice(((comp, ask) for comp, ask in neighbours if comp != airline), k))
+
+# Same as CompetitorIndex.get_comp_airline but pushed down to SQLite: the airline's ASK is looked up
+# by name & only the k nearest rows on either side of it are read, both through indexes
+def query_comp_airline(conn, airline, k=3, periods=PERIODS):
+    target = db.read_airline_ask(conn, airline)
+    if target is None:
+        return []
+    rowid, ask_per_week = target
+    # Distances are taken on the avail_seat_km get_data() derives, exactly like the in-memory index
+    def ask(per_week):
+        return float(per_week * WEEKS_PER_YEAR * periods[0].years)
+    below = [(comp, ask(comp_ask)) for comp, comp_ask in db.read_ask_neighbours(conn, airline, ask_per_week, rowid, k, below=True)]
+    above = [(comp, ask(comp_ask)) for comp, comp_ask in db.read_ask_neighbours(conn, airline, ask_per_week, rowid, k, below=False)]
+
+    return nearest_by_ask(ask(ask_per_week), below, above, k)
+
+# Merges the (airline, ASK) neighbours below & above an ASK (each nearest first) into the k closest airlines.
+# Distance is relative to the neighbour's ASK, ties go to the airline below
+def nearest_by_ask(ask, below, above, k=3):
+    lower, upper = 0, 0
+    airline_comparison_list = []
+    while len(airline_comparison_list) < k and (lower < len(below) or upper < len(above)):
+        lower_distance = (ask - below[lower][1]) / below[lower][1] if lower < len(below) else np.inf
+        upper_distance = (above[upper][1] - ask) / above[upper][1] if upper < len(above) else np.inf
+        if lower_distance <= upper_distance:
+            airline_comparison_list.append(below[lower][0])
+            lower += 1
+        else:
+            airline_comparison_list.append(above[upper][0])
+            upper += 1
 
     return airline_comparison_list
 
-# Returns the mean incident/fatal accidents rate by the two time periods
-def get_period_mean_data():
-    df_long = get_long_data()
-    
-    return df_long.groupby('period', as_index=False).agg({
-        'incident_rate': 'mean',
-        'fatal_accidents_rate': 'mean'
-    }) 
-
-# Returns an aggregated dataset by the two time periods & contains % of total information by the two major accident types (regular incident, fatal incidents)
-def get_period_total_perc_data():
-    df_long = get_long_data()
-    period_total_perc = df_long.groupby('period', as_index=False).agg({
-        'incidents': 'sum',
-        'fatal_accidents': 'sum'
+# Returns the AggregateEngine of a get_data() frame: a sum of every count & rate column & the co-moments of
+# every rate between the first & last period
+@instrumentation.stage('aggregates')
+def make_aggregates(df, periods=PERIODS, metrics=METRICS):
+    return AggregateEngine.from_frame(df, 'airline', *aggregate_columns(periods, metrics))
+
+# Returns the columns the aggregates sum & the (first period, last period) rate pairs they correlate
+def aggregate_columns(periods=PERIODS, metrics=METRICS):
+    columns = [column_name(value, period) for period in periods for metric in metrics for value in (metric.count, metric.rate)]
+    pairs = [(column_name(metric.rate, periods[0]), column_name(metric.rate, periods[-1])) for metric in metrics]
+
+    return columns, pairs
+
+# Folds get_data() chunks into what the dashboard shows of the whole table: the AggregateEngine, the co-moments of
+# every rate in every period, the first display_rows rows of both % change tables & a uniform sample of display_rows
+# rows in table order. Every row draws a seeded random key & the sample keeps the smallest keys, so it doesn't
+# depend on the chunk size
+def fold_chunks(chunks, display_rows=DISPLAY_ROWS, periods=PERIODS, metrics=METRICS, seed=0):
+    aggregates = AggregateEngine(*aggregate_columns(periods, metrics))
+    rate_columns = [column_name(metric.rate, period) for period in periods for metric in metrics]
+    rate_comoments = ComomentMatrix(rate_columns)
+    perc_changed = {metric: None for metric in PERC_CHANGE_COLUMNS}
+    display, sample_keys = None, None
+    rng = np.random.default_rng(seed)
+    for chunk in chunks:
+        aggregates.add_frame(chunk)
+        rate_comoments.add(chunk[rate_columns].to_numpy(dtype=float))
+        for metric, column in PERC_CHANGE_COLUMNS.items():
+            perc_changed[metric] = top_rows(perc_changed[metric], make_perc_changed_by_airline_data(chunk, metric, column, periods), column, display_rows)
+
+        keys = pd.Series(rng.random(len(chunk)), index=chunk.index)
+        sample_keys = keys.nsmallest(display_rows) if sample_keys is None else pd.concat([sample_keys, keys]).nsmallest(display_rows)
+        display = chunk if display is None else pd.concat([display, chunk])
+        display = display.loc[display.index.isin(sample_keys.index)]
+
+    return {
+        'aggregates': aggregates,
+        'rate_comoments': rate_comoments,
+        'perc_changed': perc_changed,
+        'display': display
+    }
+
+# Returns the first n rows of a sorted % change table over the rows kept so far & a new chunk's rows
+def top_rows(top, chunk_rows, column, n):
+    rows = chunk_rows if top is None else pd.concat([top, chunk_rows])
+
+    return rows.sort_values(by=column, ascending=False, kind='mergesort').head(n)
+
+# Periods in the order groupby('period') gives them (by label), none without airlines
+def aggregated_periods(aggregates, periods=PERIODS):
+    return sorted(periods, key=lambda period: period.label) if aggregates.n else []
+
+# Returns the mean incident/fatal accidents rate by period from an AggregateEngine
+def make_aggregates_period_mean_data(aggregates, periods=PERIODS):
+    periods = aggregated_periods(aggregates, periods)
+
+    return pd.DataFrame({
+        'period': [period.label for period in periods],
+        'incident_rate': [aggregates.mean(column_name('incident_rate', period)) for period in periods],
+        'fatal_accidents_rate': [aggregates.mean(column_name('fatal_accidents_rate', period)) for period in periods]
+    })
+
+# Returns the incidents & fatal accidents totals by period with % of total information from an AggregateEngine
+def make_aggregates_period_total_perc_data(aggregates, periods=PERIODS):
+    periods = aggregated_periods(aggregates, periods)
+
+    return make_period_perc_data(pd.DataFrame({
+        'period': [period.label for period in periods],
+        'incidents': [aggregates.total(column_name('incidents', period)) for period in periods],
+        'fatal_accidents': [aggregates.total(column_name('fatal_accidents', period)) for period in periods]
+    }))
+
+# Same as make_aggregates_period_mean_data from the period sums materialize.py keeps
+def make_materialized_period_mean_data(aggregates):
+    return pd.DataFrame({
+        'period': aggregates.period,
+        'incident_rate': aggregates.incident_rate / aggregates.airlines,
+        'fatal_accidents_rate': aggregates.fatal_accidents_rate / aggregates.airlines
     })
+
+# Same as make_aggregates_period_total_perc_data from the period sums materialize.py keeps
+def make_materialized_period_total_perc_data(aggregates):
+    return make_period_perc_data(aggregates.loc[:, ['period', 'incidents', 'fatal_accidents']].astype({'incidents': float, 'fatal_accidents': float}))
+
+# Adds the % of total columns to per period incidents & fatal_accidents totals
+def make_period_perc_data(period_total_perc):
     period_total_perc['total'] = period_total_perc.incidents + period_total_perc.fatal_accidents
     period_total_perc['perc_of_incidents'] = (period_total_perc.incidents / period_total_perc.total) * 100
     period_total_perc['perc_of_fatal_accidents'] = (period_total_perc.fatal_accidents / period_total_perc.total) * 100
@@ -144,27 +728,258 @@ def get_period_total_perc_data():
 
     return period_total_perc
 
+# Returns the % change of a rate from the first to the last period
+def perc_change(df, metric, periods=PERIODS):
+    first = df[column_name(metric, periods[0])]
+    last = df[column_name(metric, periods[-1])]
+
+    return (last - first) / first * 100
+
+# Returns the airlines with a finite % change of a rate between the first & last period, the change as a number
+# in column & sorted by it numerically (largest first, ties in table order)
+@instrumentation.stage('format')
+def make_perc_changed_by_airline_data(df, metric, column, periods=PERIODS):
+    df_change = df.assign(**{column: perc_change(df, metric, periods)}).replace([np.inf, -np.inf], np.nan)
+    df_change.dropna(subset=[column], how = 'all', inplace = True)
+
+    return df_change.sort_values(by=column, ascending=False, kind='mergesort')
+
+# Formats % changes for display in one vectorized step, e.g. 12.3456 -> 12.35%
+def format_perc_change(values):
+    return np.char.mod('%.2f%%', np.asarray(values, dtype=float)).astype(object)
+
+# Formats the % change column of make_perc_changed_by_airline_data's frame in place
+@instrumentation.stage('format')
+def format_perc_changed_data(df, column):
+    df[column] = format_perc_change(df[column].to_numpy())
+
+    return df
+
 # For each airline get formatted % change data that can be displayed in a nice tabular manner
-def get_formatted_fatal_rate_perc_changed_by_airline_data():
-    df_fatal = get_data()
-    df_fatal['Fatal Accidents Rate % Change'] = ((df_fatal.fatal_accidents_rate_00_14 - df_fatal.fatal_accidents_rate_85_99) \
-                                                / df_fatal.fatal_accidents_rate_85_99 * 100)
+def make_formatted_fatal_rate_perc_changed_by_airline_data(df, periods=PERIODS):
+    column = PERC_CHANGE_COLUMNS['fatal_accidents_rate']
 
-    df_fatal = df_fatal.replace([np.inf, -np.inf], np.nan)    
-    df_fatal.dropna(subset=["Fatal Accidents Rate % Change"], how = 'all', inplace = True)
-    df_fatal['Fatal Accidents Rate % Change'] = df_fatal['Fatal Accidents Rate % Change'].apply(lambda i : "{0:.2f}%".format(i))
-    df_fatal.sort_values(by='Fatal Accidents Rate % Change', ascending = False, inplace = True)
+    return format_perc_changed_data(make_perc_changed_by_airline_data(df, 'fatal_accidents_rate', column, periods), column)
 
-    return df_fatal
+def make_formatted_incident_rate_perc_changed_by_airline_data(df, periods=PERIODS):
+    column = PERC_CHANGE_COLUMNS['incident_rate']
 
-def get_formatted_incident_rate_perc_changed_by_airline_data():
-    df_incidents = get_data()
-    df_incidents['Incident Rate % Change'] = ((df_incidents.incident_rate_00_14 - df_incidents.incident_rate_85_99) \
-                                        / df_incidents.incident_rate_85_99 * 100)
+    return format_perc_changed_data(make_perc_changed_by_airline_data(df, 'incident_rate', column, periods), column)
+
+# Server-side view of a % change table for a DataTable with custom paging, sorting & filtering. Its columns are
+# airline, both periods' rates & perc_change, kept as NumPy arrays in make_perc_changed_by_airline_data's order.
+# Each column's sort order is computed once on first use, so serving a page is a vectorized filter & a slice
+# and only the rows on the page get formatted
+class PercChangeTable:
+    def __init__(self, frame):
+        self.frame = frame
+        self.columns = {col: frame[col].to_numpy() for col in frame.columns}
+        self._orders = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    @instrumentation.stage('format')
+    def from_frame(cls, df, metric, periods=PERIODS):
+        frame = df.loc[:, ['airline', column_name(metric, periods[0]), column_name(metric, periods[-1])]]
+        frame['perc_change'] = df[PERC_CHANGE_COLUMNS[metric]].to_numpy()
+
+        return cls(frame.reset_index(drop=True))
 
-    df_incidents = df_incidents.replace([np.inf, -np.inf], np.nan)    
-    df_incidents.dropna(subset=["Incident Rate % Change"], how = 'all', inplace = True)
-    df_incidents['Incident Rate % Change'] = df_incidents['Incident Rate % Change'].apply(lambda i : "{0:.2f}%".format(i))
-    df_incidents.sort_values(by='Incident Rate % Change', ascending = False, inplace = True)
+    def __len__(self):
+        return len(self.frame)
+
+    # Row positions sorted by a column, ascending with ties in table order
+    def _order(self, col):
+        with self._lock:
+            if col not in self._orders:
+                self._orders[col] = np.argsort(self.columns[col], kind='stable')
+
+            return self._orders[col]
+
+    # Returns limit rows from offset of the airlines ranked by % change (largest first, or smallest with ascending)
+    # as records of plain numbers, e.g. for the JSON API
+    def ranking(self, offset=0, limit=100, ascending=False):
+        positions = self._order('perc_change') if ascending else np.arange(len(self))
+        positions = positions[offset:offset + limit]
+        rows = zip(*(column[positions].tolist() for column in self.columns.values()))
+
+        return [dict(zip(self.columns, row)) for row in rows]
+
+    # Returns the records of one page & the page count after filtering by a DataTable filter_query & sorting by
+    # the first column of its sort_by. Unsorted, the largest % change comes first
+    def page(self, page_current=0, page_size=20, sort_by=None, filter_query=''):
+        positions = np.arange(len(self))
+        if sort_by and sort_by[0]['column_id'] in self.columns:
+            positions = self._order(sort_by[0]['column_id'])
+            if sort_by[0]['direction'] == 'desc':
+                positions = positions[::-1]
+        mask = self.filter_mask(filter_query)
+        if mask is not None:
+            positions = positions[mask[positions]]
+
+        start = (page_current or 0) * page_size
+        return self.records(positions[start:start + page_size]), max(1, -(-len(positions) // page_size))
+
+    # Returns the rows at positions as records: rates rounded to 2 decimals & the % change formatted
+    def records(self, positions):
+        values = {}
+        for col, column in self.columns.items():
+            if col == 'perc_change':
+                values[col] = format_perc_change(column[positions]).tolist()
+            elif col == 'airline':
+                values[col] = column[positions].tolist()
+            else:
+                values[col] = np.round(column[positions].astype(float), 2).tolist()
+
+        return [dict(zip(values, row)) for row in zip(*values.values())]
+
+    # Returns the boolean mask of rows matching every part of a DataTable filter_query (None when nothing filters).
+    # Parts naming an unknown column, an unsupported operator or an unparseable number are ignored
+    def filter_mask(self, filter_query):
+        mask = None
+        for part in (filter_query or '').split(' && '):
+            match = FILTER_PART.match(part.strip())
+            if match is None or match['column'] not in self.columns:
+                continue
+            part_mask = filter_values(self.columns[match['column']], match['operator'], match['case'] == 'i', unquote(match['value']))
+            if part_mask is not None:
+                mask = part_mask if mask is None else mask & part_mask
+
+        return mask
+
+# Strips the quotes a DataTable filter value can come in
+def unquote(value):
+    value = value.strip()
+    if len(value) > 1 and value[0] in '"\'`' and value[-1] == value[0]:
+        return value[1:-1]
+
+    return value
+
+# Compares every value with one filter value. Numeric columns compare as numbers (a trailing % is ignored),
+# others as strings; contains matches substrings. Returns a boolean mask, None if value isn't a number
+def filter_values(values, operator_name, ignore_case, value):
+    numeric = values.dtype.kind in 'iuf'
+    if operator_name != 'contains' and numeric:
+        try:
+            value = float(value.rstrip('%'))
+        except ValueError:
+            return None
+        return FILTER_OPERATORS[operator_name](values, value)
+
+    strings = pd.Series(values).astype(str) if numeric else pd.Series(values)
+    if operator_name == 'contains':
+        return strings.str.contains(value, case=not ignore_case, regex=False).to_numpy(dtype=bool)
+    compare = FILTER_OPERATORS[operator_name]
+    if ignore_case:
+        strings, value = strings.str.lower(), value.lower()
+
+    return compare(strings, value).to_numpy(dtype=bool)
+
+# A 2D histogram: the bin centers along x & y, the point counts as a (y, x) array with empty bins NaN & the
+# (low, high) ranges that were binned
+DensityGrid = namedtuple('DensityGrid', ['x', 'y', 'counts', 'x_range', 'y_range'])
+
+# Bins (x, y) points into a bins x bins grid over x_range & y_range (the finite points' extent when not given), e.g.
+# to draw a heatmap instead of a scatterplot of too many points. Every point is binned in one bincount pass
+def make_density_grid(x, y, bins=100, x_range=None, y_range=None):
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    finite = np.isfinite(x) & np.isfinite(y)
+    x, y = x[finite], y[finite]
+    (x0, x1), (y0, y1) = bin_range(x, x_range), bin_range(y, y_range)
+
+    inside = (x >= x0) & (x <= x1) & (y >= y0) & (y <= y1)
+    ix = np.minimum(((x[inside] - x0) / (x1 - x0) * bins).astype(int), bins - 1)
+    iy = np.minimum(((y[inside] - y0) / (y1 - y0) * bins).astype(int), bins - 1)
+    counts = np.bincount(iy * bins + ix, minlength=bins * bins).reshape(bins, bins).astype(float)
+    counts[counts == 0] = np.nan
+
+    x_edges, y_edges = np.linspace(x0, x1, bins + 1), np.linspace(y0, y1, bins + 1)
+    return DensityGrid((x_edges[:-1] + x_edges[1:]) / 2, (y_edges[:-1] + y_edges[1:]) / 2, counts, [x0, x1], [y0, y1])
+
+# Returns the (low, high) range to bin values over: the given one or the values' extent, never empty
+def bin_range(values, value_range=None):
+    if value_range is not None:
+        low, high = sorted(float(v) for v in value_range)
+    elif len(values):
+        low, high = float(values.min()), float(values.max())
+    else:
+        low, high = 0.0, 1.0
+    if high <= low:
+        low, high = low - 0.5, high + 0.5
+
+    return low, high
+
+
+####################
+# Shared Dataset
+####################
+# The app calls these entry points on one shared dataset, each call profiled on demand (see profiling.py)
+dataset = AirlineDataset()
+
+# Returns the data from sqlite table & calculates new metrics
+@profiling.profiled
+def get_data():
+    return dataset.get_data()
+
+# Returns long data format where periods get their own rows
+@profiling.profiled
+def get_long_data():
+    return dataset.get_long_data()
+
+# Returns the mean incident/fatal accidents rate by the two time periods
+@profiling.profiled
+def get_period_mean_data():
+    return dataset.get_period_mean_data()
+
+# Returns the aggregated dataset by the two time periods with % of total information
+@profiling.profiled
+def get_period_total_perc_data():
+    return dataset.get_period_total_perc_data()
+
+# Returns the rows to plot airline by airline (a bounded sample when the table is streamed)
+@profiling.profiled
+def get_display_data():
+    return dataset.get_display_data()
+
+# Returns the top k (three by default) closest airlines based on ASK to the argument
+@profiling.profiled
+def get_comp_airline(airline, k=3):
+    return dataset.get_comp_airline(airline, k)
+
+# Returns the top k airlines with the safety profile most similar to the argument's
+@profiling.profiled
+def get_similar_airlines(airline, k=3):
+    return dataset.get_similar_airlines(airline, k)
+
+# Returns every airline's k most similar airlines, one row per (airline, rank)
+@profiling.profiled
+def get_similarity_table(k=3):
+    return dataset.get_similarity_table(k)
+
+# Returns an airline's row of the get_data() frame as a dict (None for an unknown airline)
+@profiling.profiled
+def get_airline_record(airline):
+    return dataset.get_airline_record(airline)
+
+# Returns the Pearson correlation of a rate (e.g. incident_rate) between the first & last period
+@profiling.profiled
+def get_rate_correlation(metric):
+    return dataset.get_rate_correlation(metric)
+
+# Returns the bootstrap confidence interval (lower, upper) of get_rate_correlation(metric)
+@profiling.profiled
+def get_rate_correlation_interval(metric):
+    return dataset.get_rate_correlation_interval(metric)
+
+@profiling.profiled
+def get_formatted_fatal_rate_perc_changed_by_airline_data():
+    return dataset.get_formatted_fatal_rate_perc_changed_by_airline_data()
+
+@profiling.profiled
+def get_formatted_incident_rate_perc_changed_by_airline_data():
+    return dataset.get_formatted_incident_rate_perc_changed_by_airline_data()
 
-    return df_incidents    
\ No newline at end of file
+# Returns the server-side paged % change table of a rate (incident_rate or fatal_accidents_rate)
+@profiling.profiled
+def get_perc_change_table(metric):
+    return dataset.get_perc_change_table(metric)
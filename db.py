@@ -0,0 +1,248 @@
+import argparse
+import os
+import pathlib
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+
+import instrumentation
+
+
+DB_PATH = os.environ.get('AIRLINE_DB', 'data/airline')
+POOL_SIZE = int(os.environ.get('AIRLINE_DB_POOL_SIZE', 8))
+MMAP_SIZE = 256 * 1024 * 1024
+CACHE_SIZE_KB = 16 * 1024
+
+# The column is stored as TEXT, so ASK ordering goes through this expression (& its index)
+ASK_EXPR = 'CAST(avail_seat_km_per_week AS INTEGER)'
+
+INDEXES = [
+    'CREATE INDEX IF NOT EXISTS airline_safety_airline ON airline_safety (airline);',
+    'CREATE INDEX IF NOT EXISTS airline_safety_ask ON airline_safety ({});'.format(ASK_EXPR),
+]
+
+
+####################
+# Connections
+####################
+# Returns the URI that opens the SQLite file read-only
+def read_only_uri(db_path):
+    return pathlib.Path(db_path).resolve().as_uri() + '?mode=ro'
+
+def connect_read_only(db_path):
+    conn = sqlite3.connect(read_only_uri(db_path), uri=True, check_same_thread=False)
+    conn.execute('PRAGMA mmap_size = {:d};'.format(MMAP_SIZE))
+    # Negative cache_size is in KiB rather than pages
+    conn.execute('PRAGMA cache_size = {:d};'.format(-CACHE_SIZE_KB))
+
+    return conn
+
+# Thread-safe pool of up to size read-only connections, opened on first use & reused afterwards.
+# reset() retires every connection (e.g. after the file was replaced): idle ones are closed right away &
+# checked-out ones are closed when they're handed back, so callers never get a connection to the old file
+class ConnectionPool:
+    def __init__(self, db_path, size=POOL_SIZE):
+        self.db_path = db_path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._watcher = None
+
+    @contextmanager
+    def connection(self):
+        with self._slots:
+            try:
+                generation, conn = self._idle.get_nowait()
+            except queue.Empty:
+                generation, conn = self._generation, connect_read_only(self.db_path)
+            try:
+                yield conn
+            finally:
+                with self._lock:
+                    if generation == self._generation:
+                        self._idle.put((generation, conn))
+                    else:
+                        conn.close()
+
+    # Returns PRAGMA data_version, which changes when another connection commits. It's only comparable
+    # between reads on the same connection, so it's always read on one dedicated connection
+    def data_version(self):
+        with self._lock:
+            if self._watcher is None:
+                self._watcher = connect_read_only(self.db_path)
+
+            return self._watcher.execute('PRAGMA data_version;').fetchone()[0]
+
+    def reset(self):
+        with self._lock:
+            self._generation += 1
+            if self._watcher is not None:
+                self._watcher.close()
+                self._watcher = None
+            while True:
+                try:
+                    generation, conn = self._idle.get_nowait()
+                except queue.Empty:
+                    break
+                conn.close()
+
+    close = reset
+
+# Creates the indexes the lookup queries use. Needs a writable connection, so it's a one-off step
+# (python db.py) rather than something the read-only dashboard does
+def ensure_indexes(db_path=DB_PATH):
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            for statement in INDEXES:
+                conn.execute(statement)
+    finally:
+        conn.close()
+
+# Opens a writable connection & holds SQLite's write lock for the block, so nobody else commits in between.
+# Commits when the block ends, rolls back if it raises. Like ensure_indexes it's for the ingest, not the dashboard
+@contextmanager
+def write_transaction(db_path=DB_PATH):
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        conn.execute('BEGIN IMMEDIATE;')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK;')
+            raise
+        conn.execute('COMMIT;')
+    finally:
+        conn.close()
+
+####################
+# Queries
+####################
+# Every query is timed in instrumentation.SQL_SECONDS under its function's name
+@instrumentation.timed_query
+def read_table(conn):
+    return pd.read_sql_query("SELECT * FROM airline_safety;", conn)
+
+# Yields the table in frames of chunksize rows
+def read_table_chunks(conn, chunksize):
+    return instrumentation.timed_iter(
+        pd.read_sql_query("SELECT * FROM airline_safety;", conn, chunksize=chunksize), instrumentation.SQL_SECONDS.labels('read_table_chunks')
+    )
+
+# Returns the airline's raw row as a dict of column -> value (None for an unknown airline)
+@instrumentation.timed_query
+def read_airline(conn, airline):
+    cursor = conn.execute("SELECT * FROM airline_safety WHERE airline = ? LIMIT 1;", (airline,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+
+    return dict(zip([col[0] for col in cursor.description], row))
+
+# Returns the airline's (rowid, ASK per week), or None for an unknown airline
+@instrumentation.timed_query
+def read_airline_ask(conn, airline):
+    return conn.execute(
+        "SELECT rowid, {} FROM airline_safety WHERE airline = ? LIMIT 1;".format(ASK_EXPR), (airline,)
+    ).fetchone()
+
+# Returns up to k (airline, ASK per week) pairs on one side of the (ASK, rowid) position, nearest first.
+# Ties on ASK are broken by rowid, the same order a stable sort of the whole table gives. The plain bound on
+# the ASK expression is redundant but lets SQLite seek into the index instead of scanning it
+@instrumentation.timed_query
+def read_ask_neighbours(conn, airline, ask, rowid, k, below):
+    return conn.execute(
+        """
+        SELECT
+            airline
+            , {ask} AS ask
+        FROM
+            airline_safety
+        WHERE
+            {ask} {op}= ?
+            AND ({ask}, rowid) {op} (?, ?)
+            AND airline != ?
+        ORDER BY
+            {ask} {order}
+            , rowid {order}
+        LIMIT ?;
+        """.format(ask=ASK_EXPR, op='<' if below else '>', order='DESC' if below else 'ASC'),
+        (ask, ask, rowid, airline, k)
+    ).fetchall()
+
+# Returns the airline_safety column names in table order
+def read_columns(conn):
+    return [col[1] for col in conn.execute("PRAGMA table_info(airline_safety);")]
+
+# Writes the airline's raw row (column -> value) over its current one, or appends it for a new airline. Keys that
+# aren't airline_safety columns are ignored. Returns the row it replaced (None for a new airline)
+@instrumentation.timed_query
+def write_airline(conn, row):
+    previous = read_airline(conn, row['airline'])
+    columns = [col for col in read_columns(conn) if col in row]
+    if previous is None:
+        conn.execute(
+            "INSERT INTO airline_safety ({}) VALUES ({});".format(', '.join(columns), ', '.join('?' for _ in columns)),
+            [row[col] for col in columns]
+        )
+    else:
+        conn.execute(
+            "UPDATE airline_safety SET {} WHERE airline = ?;".format(', '.join('{} = ?'.format(col) for col in columns)),
+            [row[col] for col in columns] + [row['airline']]
+        )
+
+    return previous
+
+# Deletes the airline's row. Returns the deleted row (None for an unknown airline)
+@instrumentation.timed_query
+def delete_airline(conn, airline):
+    previous = read_airline(conn, airline)
+    if previous is not None:
+        conn.execute("DELETE FROM airline_safety WHERE airline = ?;", (airline,))
+
+    return previous
+
+# Materialized tables (see materialize.py)
+@instrumentation.timed_query
+def read_rates(conn):
+    return pd.read_sql_query("SELECT * FROM airline_rates ORDER BY id;", conn, index_col='id').reset_index(drop=True)
+
+# Returns the airline's airline_rates row as a dict of column -> value (None for an unknown airline)
+@instrumentation.timed_query
+def read_rates_record(conn, airline):
+    cursor = conn.execute("SELECT * FROM airline_rates WHERE airline = ? ORDER BY id LIMIT 1;", (airline,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+
+    return {col[0]: value for col, value in zip(cursor.description, row) if col[0] != 'id'}
+
+@instrumentation.timed_query
+def read_period_aggregates(conn):
+    return pd.read_sql_query("SELECT * FROM period_aggregates WHERE airlines > 0 ORDER BY period;", conn)
+
+# Returns the airline's stored competitors, closest first (an empty list for an unknown airline)
+@instrumentation.timed_query
+def read_competitors(conn, airline, k):
+    return [comp for comp, in conn.execute(
+        "SELECT comp_airline FROM airline_competitors WHERE airline = ? ORDER BY rank LIMIT ?;", (airline, k)
+    )]
+
+# Returns how many competitors are stored per airline
+@instrumentation.timed_query
+def read_competitor_count(conn):
+    return conn.execute("SELECT value FROM materialized_meta WHERE name = 'competitors';").fetchone()[0]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Create the indexes the airline lookups use')
+    parser.add_argument('--db', default=DB_PATH, help='SQLite file with the airline_safety table')
+    args = parser.parse_args()
+
+    ensure_indexes(args.db)
+    print('Indexed airline_safety in {}'.format(args.db))
@@ -0,0 +1,49 @@
+import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import plotly
+
+
+# Bounded LRU cache of rendered figures keyed by (airline, dataset version).
+# Figures are stored already serialized to plain JSON types, so a hit never touches pandas or plotly objects
+class FigureCache:
+    def __init__(self, render, maxsize=256):
+        self.render = render
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._figures = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, airline, version):
+        key = (airline, version)
+        with self._lock:
+            if key in self._figures:
+                self._figures.move_to_end(key)
+                self.hits += 1
+                return self._figures[key]
+            self.misses += 1
+
+        figure = json.loads(json.dumps(self.render(airline), cls=plotly.utils.PlotlyJSONEncoder))
+        with self._lock:
+            self._figures[key] = figure
+            self._figures.move_to_end(key)
+            while len(self._figures) > self.maxsize:
+                self._figures.popitem(last=False)
+
+        return figure
+
+    # Renders the given airlines concurrently so the first requests for them are already hits
+    def prewarm(self, airlines, version, workers=4):
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(lambda airline: self.get(airline, version), airlines))
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._figures), 'maxsize': self.maxsize}
+
+    def clear(self):
+        with self._lock:
+            self._figures.clear()
@@ -0,0 +1,61 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+
+# gunicorn reads this file when started from the repository (gunicorn app:server) or with -c gunicorn.conf.py.
+# Before forking any worker the master writes a snapshot of every derived frame plus the built layout to shared
+# memory (/dev/shm where there is one) & points the workers at it. Workers memory-map the frames from the same
+# pages & send the prebuilt layout, so none of them reads the table or builds figures, & adding workers adds
+# neither startup time nor a copy of the frames. Set AIRLINE_SHARED=0 to have every worker build its own
+
+wsgi_app = 'app:server'
+bind = os.environ.get('GUNICORN_BIND', '127.0.0.1:8050')
+workers = int(os.environ.get('GUNICORN_WORKERS', 4))
+
+# Workers streaming the table (AIRLINE_CHUNKSIZE) build bounded frames of their own & have no snapshot to share
+SHARED = os.environ.get('AIRLINE_SHARED', '1') != '0' and int(os.environ.get('AIRLINE_CHUNKSIZE', 0)) <= 0
+SHARED_ROOT = os.environ.get('AIRLINE_SHARED_ROOT', '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir())
+SNAPSHOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'snapshot.py')
+
+# Builds the snapshot in a fresh interpreter so the master itself never holds the frames or imports the app. After a
+# HUP the master's environment points at the previous snapshot & the workers' metrics, so the builder gets neither:
+# it must not attach to the snapshot it's rebuilding nor leave metric files no worker exit ever cleans up
+def publish(server):
+    path = os.path.join(SHARED_ROOT, 'airline-{}'.format(os.getpid()))
+    server.log.info('Publishing the shared snapshot to %s', path)
+    env = {name: value for name, value in os.environ.items() if name not in ('AIRLINE_SNAPSHOT_DIR', 'PROMETHEUS_MULTIPROC_DIR')}
+    env['AIRLINE_SHARED'] = '0'
+    subprocess.run([sys.executable, SNAPSHOT, '--out', path, '--layout'], check=True, env=env)
+    os.environ['AIRLINE_SNAPSHOT_DIR'] = path
+    os.environ['AIRLINE_SHARED'] = '1'
+
+# Workers write their metrics to files in one directory that /metrics sums over (see instrumentation.py). It's
+# set before any worker imports prometheus_client, which picks its mode on import
+def metrics_dir():
+    return os.path.join(SHARED_ROOT, 'airline-metrics-{}'.format(os.getpid()))
+
+def on_starting(server):
+    if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+        shutil.rmtree(metrics_dir(), ignore_errors=True)
+        os.makedirs(metrics_dir())
+        os.environ['PROMETHEUS_MULTIPROC_DIR'] = metrics_dir()
+    if SHARED:
+        publish(server)
+
+# A HUP reloads the workers against a fresh snapshot, e.g. after the database changed
+def on_reload(server):
+    if SHARED:
+        publish(server)
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
+def on_exit(server):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR') == metrics_dir():
+        shutil.rmtree(metrics_dir(), ignore_errors=True)
+    if SHARED:
+        shutil.rmtree(os.path.join(SHARED_ROOT, 'airline-{}'.format(os.getpid())), ignore_errors=True)
@@ -0,0 +1,82 @@
+import gzip
+import hashlib
+import os
+import threading
+
+import brotli
+import flask
+
+
+# Brotli quality of the stored payloads. On the 10MB layout of 200k airlines 4 takes 0.25s & is within 5% of
+# the size 11 gets in 30s
+BROTLI_QUALITY = int(os.environ.get('HTTP_BROTLI_QUALITY', 4))
+GZIP_LEVEL = 9
+
+# Encodings in the order they're preferred when the client accepts several
+ENCODINGS = ['br', 'gzip']
+
+
+# A response body serialized once & stored in every encoding the dashboard serves, so a request costs neither
+# serialization nor compression. Each encoding gets its own strong ETag derived from a hash of the body
+class Payload:
+    def __init__(self, body, mimetype='application/json'):
+        self.mimetype = mimetype
+        self.digest = hashlib.sha256(body).hexdigest()[:32]
+        self.bodies = {'identity': body}
+        for encoding, encoded in [
+            ('br', brotli.compress(body, quality=BROTLI_QUALITY)),
+            ('gzip', gzip.compress(body, GZIP_LEVEL, mtime=0))
+        ]:
+            if len(encoded) < len(body):
+                self.bodies[encoding] = encoded
+
+    def etag(self, encoding):
+        return self.digest if encoding == 'identity' else '{}-{}'.format(self.digest, encoding)
+
+    # Picks the preferred stored encoding the request accepts
+    def encoding(self, request):
+        for encoding in ENCODINGS:
+            if encoding in self.bodies and request.accept_encodings.quality(encoding) > 0:
+                return encoding
+
+        return 'identity'
+
+    # Returns the response to request: 304 when the client already has any encoding of this body, the stored
+    # body otherwise
+    def response(self, request, cache_control):
+        encoding = self.encoding(request)
+        if any(request.if_none_match.contains_weak(self.etag(e)) for e in self.bodies):
+            response = flask.Response(status=304)
+        else:
+            response = flask.Response(self.bodies[encoding], mimetype=self.mimetype)
+            if encoding != 'identity':
+                response.headers['Content-Encoding'] = encoding
+        response.set_etag(self.etag(encoding))
+        response.headers['Cache-Control'] = cache_control
+        response.headers['Vary'] = 'Accept-Encoding'
+
+        return response
+
+    def stats(self):
+        return {encoding: len(body) for encoding, body in self.bodies.items()}
+
+
+# Holds the payload of one response, rebuilt only when its key (e.g. the dataset version it was built from) changes
+class PayloadCache:
+    def __init__(self):
+        self._key = None
+        self._payload = None
+        self._lock = threading.Lock()
+
+    def get(self, key, build):
+        with self._lock:
+            if self._payload is None or self._key != key:
+                self._payload = Payload(build())
+                self._key = key
+
+            return self._payload
+
+    def clear(self):
+        with self._lock:
+            self._key = None
+            self._payload = None
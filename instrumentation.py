@@ -0,0 +1,124 @@
+import functools
+import os
+import threading
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Histogram, generate_latest, multiprocess
+from prometheus_client.core import GaugeMetricFamily
+
+
+# Latency buckets from 0.5ms (an indexed lookup) to 30s (loading & deriving a large table)
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+CALLBACK_SECONDS = Histogram('airline_callback_seconds', 'Time spent in each Dash callback', ['callback'], buckets=BUCKETS)
+SQL_SECONDS = Histogram('airline_sql_seconds', 'Time spent in each SQLite query (db.py)', ['query'], buckets=BUCKETS)
+# Every query of one competitor lookup answered by SQLite together, the SQL counterpart of the in-memory index
+COMPETITOR_SQL_SECONDS = Histogram('airline_competitor_sql_seconds', 'Time spent finding an airline\'s competitors in SQLite', buckets=BUCKETS)
+STAGE_SECONDS = Histogram('airline_stage_seconds', 'Time spent in each data_processing pipeline stage', ['stage'], buckets=BUCKETS)
+
+
+####################
+# Timers
+####################
+# Returns a prometheus_client timer of a pipeline stage, usable as a decorator or a with block
+def stage(name):
+    return STAGE_SECONDS.labels(name).time()
+
+# Wraps func to observe how long every call takes in histogram (a labelled child). It costs about half of what the
+# prometheus_client timer does per call, which counts on the per-lookup queries
+def timed(func, histogram):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            histogram.observe(time.perf_counter() - start)
+
+    return wrapper
+
+# Times a db.py query function under its own name
+def timed_query(func):
+    return timed(func, SQL_SECONDS.labels(func.__name__))
+
+# Times a Dash callback function under its own name
+def timed_callback(func):
+    return timed(func, CALLBACK_SECONDS.labels(func.__name__))
+
+# Yields iterable's items, observing how long each one took to produce in histogram (a labelled child), e.g.
+# every chunk of a chunked read
+def timed_iter(iterable, histogram):
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        histogram.observe(time.perf_counter() - start)
+        yield item
+
+####################
+# Gauges
+####################
+# Cache sizes & frame memory are read when /metrics is scraped rather than kept up to date. The app registers
+# what to read: caches as name -> function returning its entries & frames as a function returning name -> frame
+class DashboardCollector:
+    def __init__(self):
+        self.caches = {}
+        self.frames = None
+        self._frame_bytes = {}
+        self._lock = threading.Lock()
+
+    def collect(self):
+        caches = GaugeMetricFamily('airline_cache_entries', 'Entries held by each cache', labels=['cache'])
+        for name, entries in self.caches.items():
+            caches.add_metric([name], entries())
+        yield caches
+
+        if self.frames is not None:
+            frame_bytes = GaugeMetricFamily('airline_frame_bytes', 'Bytes held by each derived frame, strings included', labels=['frame'])
+            for name, size in self.frame_memory(self.frames()).items():
+                frame_bytes.add_metric([name], size)
+            yield frame_bytes
+
+    # Measuring every string is slow on big frames & frames don't change once built, so each frame's size is kept
+    # for as long as that frame is the one held under its name
+    def frame_memory(self, frames):
+        with self._lock:
+            sizes = {}
+            for name, df in frames.items():
+                cached = self._frame_bytes.get(name)
+                if cached is None or cached[0] is not df:
+                    cached = (df, int(df.memory_usage(deep=True).sum()))
+                    self._frame_bytes[name] = cached
+                sizes[name] = cached[1]
+            for name in set(self._frame_bytes) - set(frames):
+                del self._frame_bytes[name]
+
+            return sizes
+
+collector = DashboardCollector()
+REGISTRY.register(collector)
+
+def register_cache(name, entries):
+    collector.caches[name] = entries
+
+def register_frames(frames):
+    collector.frames = frames
+
+####################
+# Exposition
+####################
+# Returns the (body, content type) of a scrape. Under a pre-forking server with PROMETHEUS_MULTIPROC_DIR set
+# (gunicorn.conf.py sets it) the histograms are summed over every worker, while the gauges are the answering
+# worker's own
+def exposition():
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(collector)
+    else:
+        registry = REGISTRY
+
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,214 @@
+import argparse
+import sqlite3
+import time
+
+import data_processing as dp
+import db
+
+
+COMPETITORS = 3
+
+RATES_TABLE = 'airline_rates'
+COMPETITORS_TABLE = 'airline_competitors'
+AGGREGATES_TABLE = 'period_aggregates'
+DIRTY_TABLE = 'airline_dirty'
+META_TABLE = 'materialized_meta'
+TRIGGERS = ['airline_safety_materialize_insert', 'airline_safety_materialize_update', 'airline_safety_materialize_delete']
+
+
+####################
+# Materialized Tables
+####################
+# The derived data is kept next to airline_safety in the same SQLite file:
+#   airline_rates       - get_data()'s frame, keyed by the airline_safety rowid it came from
+#   period_aggregates   - per period airline count & sums of every count & rate (means are sum / airlines)
+#   airline_competitors - every airline's closest competitors by rank
+# Triggers on airline_safety keep airline_rates & period_aggregates in step with every insert, update & delete
+# and record the touched airlines in airline_dirty. Competitor rankings of neighbouring airlines can change
+# too, so those are brought up to date by refresh(), which only recomputes the airlines around dirty ones.
+
+# Returns SQL expressions computing get_data()'s columns from the airline_safety row named row (e.g. NEW),
+# as (column, type, expression). The rates are REAL divisions of the same integers make_data divides
+def rate_expressions(raw_columns, row, periods=dp.PERIODS, metrics=dp.METRICS):
+    def ask(period):
+        return 'CAST({}.avail_seat_km_per_week AS INTEGER) * {} * {}'.format(row, dp.WEEKS_PER_YEAR, period.years)
+
+    expressions = [
+        (col, 'TEXT', '{}.airline'.format(row)) if col == 'airline' else (col, 'INTEGER', 'CAST({}.{} AS INTEGER)'.format(row, col))
+        for col in raw_columns
+    ]
+    expressions.append(('avail_seat_km', 'INTEGER', ask(periods[0])))
+    for period in periods:
+        for metric in metrics:
+            expressions.append((
+                dp.column_name(metric.rate, period),
+                'REAL',
+                'CAST(CAST({}.{} AS INTEGER) * {} AS REAL) / ({})'.format(row, dp.column_name(metric.count, period), dp.RATE_SCALE, ask(period))
+            ))
+
+    return expressions
+
+# Returns the statements adding (sign +) or removing (sign -) one airline_safety row's values to the period sums
+def aggregate_statements(raw_columns, row, sign, periods=dp.PERIODS, metrics=dp.METRICS):
+    expressions = dict((col, expression) for col, _, expression in rate_expressions(raw_columns, row, periods, metrics))
+    statements = []
+    for period in periods:
+        sums = ['airlines = airlines {} 1'.format(sign)]
+        for metric in metrics:
+            for value in (metric.count, metric.rate):
+                sums.append('{0} = {0} {1} {2}'.format(value, sign, expressions[dp.column_name(value, period)]))
+        statements.append("UPDATE {} SET {} WHERE period = '{}';".format(AGGREGATES_TABLE, ', '.join(sums), period.label))
+
+    return statements
+
+def schema(raw_columns, periods=dp.PERIODS, metrics=dp.METRICS):
+    rates = rate_expressions(raw_columns, 'airline_safety', periods, metrics)
+    sums = ['{} INTEGER'.format(metric.count) for metric in metrics] + ['{} REAL'.format(metric.rate) for metric in metrics]
+
+    def add(row):
+        return [
+            'INSERT INTO {} (id, {}) VALUES ({}.rowid, {});'.format(
+                RATES_TABLE, ', '.join(col for col, _, _ in rates),
+                row, ', '.join(expression for _, _, expression in rate_expressions(raw_columns, row, periods, metrics))
+            ),
+            *aggregate_statements(raw_columns, row, '+', periods, metrics),
+            'INSERT OR IGNORE INTO {} (airline) VALUES ({}.airline);'.format(DIRTY_TABLE, row)
+        ]
+
+    def remove(row):
+        return [
+            *aggregate_statements(raw_columns, row, '-', periods, metrics),
+            'DELETE FROM {} WHERE id = {}.rowid;'.format(RATES_TABLE, row),
+            'INSERT OR IGNORE INTO {} (airline) VALUES ({}.airline);'.format(DIRTY_TABLE, row)
+        ]
+
+    def trigger(name, event, statements):
+        return 'CREATE TRIGGER {} AFTER {} ON airline_safety BEGIN\n    {}\nEND;'.format(name, event, '\n    '.join(statements))
+
+    return [
+        'CREATE TABLE {} (id INTEGER PRIMARY KEY, {});'.format(RATES_TABLE, ', '.join('{} {}'.format(col, kind) for col, kind, _ in rates)),
+        'CREATE INDEX {0}_airline ON {0} (airline);'.format(RATES_TABLE),
+        'CREATE TABLE {} (period TEXT PRIMARY KEY, airlines INTEGER, {});'.format(AGGREGATES_TABLE, ', '.join(sums)),
+        'CREATE TABLE {} (airline TEXT, rank INTEGER, comp_airline TEXT, PRIMARY KEY (airline, rank));'.format(COMPETITORS_TABLE),
+        'CREATE INDEX {0}_comp_airline ON {0} (comp_airline);'.format(COMPETITORS_TABLE),
+        'CREATE TABLE {} (airline TEXT PRIMARY KEY);'.format(DIRTY_TABLE),
+        'CREATE TABLE {} (name TEXT PRIMARY KEY, value);'.format(META_TABLE),
+        trigger(TRIGGERS[0], 'INSERT', add('NEW')),
+        trigger(TRIGGERS[1], 'UPDATE', remove('OLD') + add('NEW')),
+        trigger(TRIGGERS[2], 'DELETE', remove('OLD'))
+    ]
+
+def drop(conn):
+    for name in TRIGGERS:
+        conn.execute('DROP TRIGGER IF EXISTS {};'.format(name))
+    for name in (RATES_TABLE, AGGREGATES_TABLE, COMPETITORS_TABLE, DIRTY_TABLE, META_TABLE):
+        conn.execute('DROP TABLE IF EXISTS {};'.format(name))
+
+####################
+# Build & Refresh
+####################
+def write_competitors(conn, airline, competitors):
+    conn.execute('DELETE FROM {} WHERE airline = ?;'.format(COMPETITORS_TABLE), (airline,))
+    conn.executemany(
+        'INSERT INTO {} (airline, rank, comp_airline) VALUES (?, ?, ?);'.format(COMPETITORS_TABLE),
+        [(airline, rank, comp) for rank, comp in enumerate(competitors, 1)]
+    )
+
+# (Re)creates every materialized table & trigger from scratch & fills them from airline_safety.
+# The period sums come from the same groupby the dashboard runs, so their means match it exactly
+def build(db_path=dp.DB_PATH, k=COMPETITORS, periods=dp.PERIODS, metrics=dp.METRICS):
+    dataset = dp.AirlineDataset(db_path, periods, metrics, materialized=False)
+    df = dataset.get_data()
+    df_long = dataset.get_long_data()
+    index = dataset.get_competitor_index()
+    dataset.pool.close()
+
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            raw_columns = [row[1] for row in conn.execute('PRAGMA table_info(airline_safety);')]
+            drop(conn)
+            for statement in schema(raw_columns, periods, metrics):
+                conn.execute(statement)
+
+            expressions = rate_expressions(raw_columns, 'airline_safety', periods, metrics)
+            conn.execute('INSERT INTO {} (id, {}) SELECT rowid, {} FROM airline_safety;'.format(
+                RATES_TABLE, ', '.join(col for col, _, _ in expressions), ', '.join(expression for _, _, expression in expressions)
+            ))
+
+            counts, rates = [metric.count for metric in metrics], [metric.rate for metric in metrics]
+            sums = df_long.groupby('period').agg({value: 'sum' for value in counts + rates})
+            airlines = df_long.groupby('period').size()
+            for period in periods:
+                if period.label in sums.index:
+                    row = sums.loc[period.label]
+                    values = [int(row[count]) for count in counts] + [float(row[rate]) for rate in rates]
+                else:
+                    values = [0] * len(counts + rates)
+                conn.execute(
+                    'INSERT INTO {} (period, airlines, {}) VALUES (?, ?, {});'.format(
+                        AGGREGATES_TABLE, ', '.join(counts + rates), ', '.join('?' * len(values))
+                    ),
+                    [period.label, int(airlines.get(period.label, 0))] + values
+                )
+
+            conn.executemany(
+                'INSERT INTO {} (airline, rank, comp_airline) VALUES (?, ?, ?);'.format(COMPETITORS_TABLE),
+                ((airline, rank, comp) for airline in df.airline for rank, comp in enumerate(index.get_comp_airline(airline, k), 1))
+            )
+            conn.execute('INSERT INTO {} (name, value) VALUES (?, ?);'.format(META_TABLE), ('competitors', k))
+            conn.execute('DELETE FROM {};'.format(DIRTY_TABLE))
+    finally:
+        conn.close()
+
+    return len(df)
+
+# Recomputes the competitor rankings the airlines written since the last build/refresh can have changed:
+# the dirty airlines themselves, the airlines that ranked them & the k airlines either side of their (new) ASK,
+# since an airline can only enter the top k of an airline fewer than k positions away. Returns the airlines recomputed
+def refresh(db_path=dp.DB_PATH, periods=dp.PERIODS):
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            k = conn.execute('SELECT value FROM {} WHERE name = ?;'.format(META_TABLE), ('competitors',)).fetchone()[0]
+            dirty = [airline for airline, in conn.execute('SELECT airline FROM {};'.format(DIRTY_TABLE))]
+
+            affected = set(dirty)
+            for airline in dirty:
+                affected.update(a for a, in conn.execute(
+                    'SELECT airline FROM {} WHERE comp_airline = ?;'.format(COMPETITORS_TABLE), (airline,)
+                ))
+                target = db.read_airline_ask(conn, airline)
+                if target is not None:
+                    rowid, ask = target
+                    for below in (True, False):
+                        affected.update(a for a, _ in db.read_ask_neighbours(conn, airline, ask, rowid, k, below))
+
+            for airline in affected:
+                write_competitors(conn, airline, dp.query_comp_airline(conn, airline, k, periods))
+            conn.executemany('DELETE FROM {} WHERE airline = ?;'.format(DIRTY_TABLE), [(airline,) for airline in dirty])
+    finally:
+        conn.close()
+
+    return affected
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Store the derived airline tables in the SQLite file & keep them up to date')
+    parser.add_argument('command', choices=['build', 'refresh', 'drop'],
+                        help='build: (re)create & fill every table & trigger, refresh: update competitor rankings after writes, drop: remove them')
+    parser.add_argument('--db', default=dp.DB_PATH, help='SQLite file with the airline_safety table')
+    parser.add_argument('--competitors', type=int, default=COMPETITORS, help='competitors kept per airline (build only)')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command == 'build':
+        print('Materialized {} airlines in {:.2f}s'.format(build(args.db, args.competitors), time.perf_counter() - start))
+    elif args.command == 'refresh':
+        print('Refreshed {} airlines in {:.2f}s'.format(len(refresh(args.db)), time.perf_counter() - start))
+    else:
+        conn = sqlite3.connect(args.db)
+        with conn:
+            drop(conn)
+        conn.close()
+        print('Dropped the materialized tables from {}'.format(args.db))
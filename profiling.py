@@ -0,0 +1,197 @@
+import cProfile
+import collections
+import functools
+import hmac
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+
+import flask
+
+
+# Profile a sample of requests & data_processing calls (PROFILE_SAMPLE_RATE of them) without being asked to
+PROFILE = bool(os.environ.get('PROFILE'))
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0.01))
+# A request with an X-Profile header holding this token is always profiled, e.g. to catch a slow callback on a
+# live worker. Unset, the header is ignored
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN')
+PROFILE_HEADER = 'X-Profile'
+# 'sample' records the stack every PROFILE_INTERVAL seconds into folded flame graph stacks (.folded, for
+# flamegraph.pl or speedscope); 'cprofile' traces every call into a pstats dump (.pstats), exact but slower
+PROFILE_MODE = os.environ.get('PROFILE_MODE', 'sample')
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL', 0.001))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'airline-profiles'))
+# The oldest dumps are deleted once the directory holds more than this
+PROFILE_MAX_BYTES = int(os.environ.get('PROFILE_MAX_BYTES', 100 * 1024 * 1024))
+
+# Only the outermost profiled call on a thread is profiled, calls within it are already in its profile
+_active = threading.local()
+_dir_lock = threading.Lock()
+
+
+####################
+# Profilers
+####################
+# Samples one thread's stack from a background thread, so it works on any thread (unlike a profiling signal) & the
+# profiled code runs untouched between samples. Samples are counted per stack, root first
+class StackSampler:
+    extension = 'folded'
+
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self._thread_id = threading.get_ident()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._sampler.start()
+
+    def stop(self):
+        self._stop.set()
+        self._sampler.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('{} ({}:{})'.format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.items():
+                f.write('{} {}\n'.format(stack, count))
+
+class CallProfiler:
+    extension = 'pstats'
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def dump(self, path):
+        self.profile.dump_stats(path)
+
+PROFILERS = {'sample': StackSampler, 'cprofile': CallProfiler}
+
+####################
+# Profiles
+####################
+# Returns whether to profile something: always when asked to (forced), otherwise a PROFILE_SAMPLE_RATE share of
+# calls while PROFILE is set. Never within a call that's already being profiled
+def should_profile(forced=False):
+    if getattr(_active, 'profiler', None) is not None:
+        return False
+
+    return forced or (PROFILE and random.random() < PROFILE_SAMPLE_RATE)
+
+# Starts profiling the calling thread, returns the profiler to pass to stop()
+def start(mode=PROFILE_MODE):
+    profiler = PROFILERS[mode]()
+    _active.profiler = profiler
+    profiler.start()
+
+    return profiler
+
+# Stops profiler & dumps it to PROFILE_DIR under name, keeping the directory under PROFILE_MAX_BYTES.
+# Returns the dump's file name
+def stop(profiler, name):
+    profiler.stop()
+    _active.profiler = None
+
+    file_name = '{}-{}-{}.{}'.format(int(time.time() * 1000), os.getpid(), re.sub(r'[^A-Za-z0-9_.-]+', '_', name).strip('_')[:100], profiler.extension)
+    with _dir_lock:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profiler.dump(os.path.join(PROFILE_DIR, file_name))
+        enforce_size_cap(PROFILE_DIR, PROFILE_MAX_BYTES)
+
+    return file_name
+
+# Deletes the oldest files in path until they take at most max_bytes. Other workers may be deleting too
+def enforce_size_cap(path, max_bytes):
+    files = []
+    for entry in os.scandir(path):
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        files.append((stat.st_mtime, stat.st_size, entry.path))
+    files.sort()
+
+    total = sum(size for _, size, _ in files)
+    for _, size, file in files:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(file)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+# Decorator profiling a sample of the function's calls (see should_profile) under its name
+def profiled(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not should_profile():
+            return func(*args, **kwargs)
+        profiler = start()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            stop(profiler, func.__name__)
+
+    return wrapper
+
+####################
+# Requests
+####################
+# Returns whether the request carries the admin token in its X-Profile header
+def requested(request):
+    token = request.headers.get(PROFILE_HEADER)
+
+    return bool(PROFILE_TOKEN) and token is not None and hmac.compare_digest(token, PROFILE_TOKEN)
+
+# Profiles a sample of a Flask server's requests plus every request carrying the admin token, each dumped under
+# its path (& the callback's output for Dash callbacks). Token requests get the dump's file name back in the
+# X-Profile header
+def register(server, callback_path):
+    @server.before_request
+    def start_request_profile():
+        forced = requested(flask.request)
+        if should_profile(forced):
+            flask.g.profiler = start()
+            flask.g.profile_forced = forced
+
+    @server.after_request
+    def stop_request_profile(response):
+        profiler = flask.g.pop('profiler', None)
+        if profiler is not None:
+            name = flask.request.path
+            if flask.request.path == callback_path:
+                name += '-' + str((flask.request.get_json(silent=True) or {}).get('output', ''))
+            file_name = stop(profiler, name)
+            if flask.g.pop('profile_forced', False):
+                response.headers[PROFILE_HEADER] = file_name
+
+        return response
+
+    # Should after_request not get to it (another handler raised), the profiler is still stopped & dumped here
+    @server.teardown_request
+    def discard_request_profile(exc):
+        profiler = flask.g.pop('profiler', None)
+        if profiler is not None:
+            stop(profiler, flask.request.path + '-error')
@@ -0,0 +1,129 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+
+# Features compared on a log scale, so that like the ASK competitors a carrier twice the size is equally far
+# whether it's big or small
+LOG_FEATURES = ['avail_seat_km']
+
+
+####################
+# Features
+####################
+# Returns the columns of a get_data() frame that describe an airline's safety profile: its ASK, the incident &
+# fatal accidents rates of every period & any extra numeric columns the table has beyond the registry's counts
+# & rates (known_columns)
+def feature_columns(df, known_columns, rate_columns):
+    extra = [
+        col for col in df.columns
+        if col not in known_columns and col != 'airline' and pd.api.types.is_numeric_dtype(df[col].dtype)
+    ]
+
+    return ['avail_seat_km'] + list(rate_columns) + extra
+
+# Returns the feature vectors (airlines x columns) as z-scores, so every feature weighs the same whatever its unit.
+# Values that aren't finite (e.g. rates of an airline without ASK) are put at the mean, & a constant feature is
+# left at zero
+def normalize_features(values, columns):
+    values = np.array(values, dtype=float)
+    for j, col in enumerate(columns):
+        if col in LOG_FEATURES:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                values[:, j] = np.log1p(values[:, j])
+    values[~np.isfinite(values)] = np.nan
+
+    with np.errstate(invalid='ignore'):
+        mean = np.nanmean(values, axis=0) if len(values) else np.zeros(len(columns))
+        std = np.nanstd(values, axis=0) if len(values) else np.ones(len(columns))
+    mean = np.nan_to_num(mean)
+    std = np.where(np.isfinite(std) & (std > 0), std, 1)
+
+    return np.nan_to_num((values - mean) / std)
+
+####################
+# Similarity Index
+####################
+# k-d tree over the airlines' normalized feature vectors. A lookup walks only the branches that can hold a closer
+# airline (about log n of them rather than every airline), & the k-NN table of every airline comes out of one
+# batched query
+class SimilarityIndex:
+    def __init__(self, airlines, features, columns):
+        self.airlines = np.asarray(airlines, dtype=object)
+        self.features = features
+        self.columns = list(columns)
+        self.tree = cKDTree(features)
+        self.position = {}
+        # The last row of a repeated name is the one looked up, like AirlineRecords
+        for i, airline in enumerate(self.airlines):
+            self.position[airline] = i
+
+    @classmethod
+    def from_values(cls, airlines, values, columns):
+        return cls(airlines, normalize_features(values, columns), columns)
+
+    # Returns the k airlines with the most similar profile, most similar first
+    def get_similar_airlines(self, airline, k=3):
+        i = self.position.get(airline)
+        if i is None or k <= 0:
+            return []
+        count = min(k + 1, len(self.airlines))
+        _, neighbours = self.tree.query(self.features[i], count)
+        neighbours = np.atleast_1d(neighbours)
+
+        return [self.airlines[j] for j in neighbours if j != i][:k]
+
+    # Returns the positions & distances of every airline's k most similar airlines (airlines x k), most similar
+    # first, from one query of the whole tree. Airlines with fewer than k others are padded with -1 & inf
+    def knn(self, k=3, workers=1):
+        n = len(self.airlines)
+        count = min(k + 1, n)
+        if count == 0:
+            return np.empty((0, k), dtype=int), np.empty((0, k))
+        distances, neighbours = self.tree.query(self.features, count, workers=workers)
+        distances, neighbours = distances.reshape(n, count), neighbours.reshape(n, count)
+
+        # Drop each airline from its own row: it's normally first, but an identical profile may come before it
+        others = neighbours != np.arange(n)[:, None]
+        keep = np.argsort(~others, axis=1, kind='stable')[:, :k]
+        positions = np.take_along_axis(neighbours, keep, axis=1)
+        distances = np.take_along_axis(distances, keep, axis=1)
+        missing = ~np.take_along_axis(others, keep, axis=1)
+        positions[missing], distances[missing] = -1, np.inf
+        if positions.shape[1] < k:
+            pad = k - positions.shape[1]
+            positions = np.pad(positions, ((0, 0), (0, pad)), constant_values=-1)
+            distances = np.pad(distances, ((0, 0), (0, pad)), constant_values=np.inf)
+
+        return positions, distances
+
+    # Returns the k-NN table of every airline, one row per (airline, rank) like the materialized competitors
+    def knn_table(self, k=3, workers=1):
+        positions, distances = self.knn(k, workers)
+        rows, ranks = np.nonzero(positions >= 0)
+
+        return pd.DataFrame({
+            'airline': self.airlines[rows],
+            'rank': ranks + 1,
+            'comp_airline': self.airlines[positions[rows, ranks]],
+            'distance': distances[rows, ranks]
+        })
+
+
+if __name__ == '__main__':
+    import data_processing as dp
+
+    parser = argparse.ArgumentParser(description='Write every airline\'s most similar airlines by safety profile')
+    parser.add_argument('--db', default=dp.DB_PATH, help='SQLite file with the airline_safety table')
+    parser.add_argument('--k', type=int, default=3, help='similar airlines per airline')
+    parser.add_argument('--workers', type=int, default=1, help='threads for the batched query (-1 for every CPU)')
+    parser.add_argument('--output', default='similar_airlines.csv', help='CSV file to write the table to')
+    args = parser.parse_args()
+
+    dataset = dp.AirlineDataset(args.db)
+    index = dataset.get_similarity_index()
+    table = index.knn_table(args.k, args.workers)
+    table.to_csv(args.output, index=False)
+    print('Wrote the {} most similar airlines of {} airlines by {} to {}'.format(args.k, len(index.airlines), ', '.join(index.columns), args.output))
@@ -0,0 +1,184 @@
+import argparse
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+import plotly
+
+import data_processing as dp
+from correlations import Correlations
+
+
+SNAPSHOT_DIR = os.environ.get('AIRLINE_SNAPSHOT_DIR', 'data/snapshot')
+MANIFEST = 'manifest.json'
+LAYOUT = 'layout.json'
+# Builds to try before giving up on a file that keeps changing underneath the snapshot
+BUILD_ATTEMPTS = 3
+
+
+####################
+# Snapshot Format
+####################
+# A snapshot is a directory with a manifest.json & one sub-directory per derived frame. The bootstrap correlations
+# are small but slow to resample, so they're kept in the manifest itself.
+# Neighbouring columns that share a dtype are stored together as one (columns x rows) .npy block,
+# which is the layout pandas keeps its blocks in, so numeric blocks are memory-mapped back without a copy. The
+# exception is a dtype split over runs that aren't neighbours (e.g. the compact counts, int8 & int16 in turn):
+# pandas merges them into one block when the frame is put together, which copies them into memory.
+# String columns are stored as fixed-width unicode blocks & turned back into object columns on load.
+# Categorical columns are stored one by one as their integer codes plus a block of their categories.
+
+# Groups the positions of neighbouring columns that share a dtype (categorical columns always on their own)
+def column_runs(df):
+    runs = []
+    for i, dtype in enumerate(df.dtypes):
+        if runs and runs[-1][0] == dtype and not isinstance(dtype, pd.CategoricalDtype):
+            runs[-1][1].append(i)
+        else:
+            runs.append((dtype, [i]))
+
+    return [columns for dtype, columns in runs]
+
+def write_frame(df, path):
+    os.makedirs(path)
+    blocks = []
+    for i, run in enumerate(column_runs(df)):
+        file = '{}.npy'.format(i)
+        block = {'file': file, 'columns': [df.columns[c] for c in run]}
+        if isinstance(df.dtypes.iloc[run[0]], pd.CategoricalDtype):
+            values = df.iloc[:, run[0]].array
+            block.update(kind='categorical', categories='{}.categories.npy'.format(i), ordered=bool(values.ordered))
+            np.save(os.path.join(path, block['categories']), values.categories.to_numpy().astype(str))
+            values = values.codes[None, :]
+        else:
+            values = df.iloc[:, run].to_numpy().T
+            block['kind'] = 'string' if values.dtype == object else 'numeric'
+            if block['kind'] == 'string':
+                values = values.astype(str)
+        np.save(os.path.join(path, file), np.ascontiguousarray(values))
+        blocks.append(block)
+
+    if isinstance(df.index, pd.RangeIndex):
+        index = {'start': df.index.start, 'stop': df.index.stop, 'step': df.index.step}
+    else:
+        index = {'file': 'index.npy'}
+        np.save(os.path.join(path, 'index.npy'), df.index.to_numpy())
+
+    return {'rows': len(df), 'blocks': blocks, 'index': index}
+
+def read_frame(path, meta):
+    parts = []
+    for block in meta['blocks']:
+        values = np.load(os.path.join(path, block['file']), mmap_mode='r')
+        if block['kind'] == 'categorical':
+            categories = np.load(os.path.join(path, block['categories'])).astype(object)
+            values = pd.Categorical.from_codes(np.asarray(values[0]), categories=categories, ordered=block['ordered'])
+            parts.append(pd.DataFrame({block['columns'][0]: values}, copy=False))
+            continue
+        if block['kind'] == 'string':
+            values = values.astype(object)
+        parts.append(pd.DataFrame(values.T, columns=block['columns'], copy=False))
+    df = pd.concat(parts, axis=1, copy=False)
+
+    index = meta['index']
+    if 'file' in index:
+        df.index = np.load(os.path.join(path, index['file']), mmap_mode='r')
+    else:
+        df.index = pd.RangeIndex(index['start'], index['stop'], index['step'])
+
+    return df
+
+####################
+# Write & Load
+####################
+# Runs the data_processing pipeline once & writes every derived frame to a snapshot at path, plus the dashboard
+# layout serialized by layout() when given. The snapshot is written next to path & swapped in at the end so
+# readers never see a partial one. Everything is built before it's stamped with the file's source: if the file
+# changed during the build it's built again, so a snapshot never pairs old frames with a newer source
+def write_snapshot(dataset, path=SNAPSHOT_DIR, layout=None):
+    for _ in range(BUILD_ATTEMPTS):
+        source = dataset.source()
+        frames = dataset.get_frames()
+        correlations = dataset.get_correlations()
+        layout_text = layout() if layout is not None else None
+        if dataset.source() == source:
+            break
+    else:
+        raise RuntimeError('{} kept changing while the snapshot was built'.format(dataset.db_path))
+
+    tmp_path = path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    manifest = {'source': source, 'dtypes': dataset.dtypes(), 'created': time.time(), 'frames': {}}
+    manifest['correlations'] = correlations.to_dict()
+    for name, df in frames.items():
+        manifest['frames'][name] = write_frame(df, os.path.join(tmp_path, name))
+    if layout_text is not None:
+        with open(os.path.join(tmp_path, LAYOUT), 'w') as f:
+            f.write(layout_text)
+        manifest['layout'] = LAYOUT
+    with open(os.path.join(tmp_path, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.rename(tmp_path, path)
+
+    return manifest
+
+# Returns the manifest of the snapshot at path (None without one)
+def read_manifest(path=SNAPSHOT_DIR):
+    try:
+        with open(os.path.join(path, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+# Returns whether a snapshot was built from the dataset's current SQLite file with the dataset's dtype settings
+def matches(manifest, dataset):
+    return manifest is not None and manifest['source'] == dataset.source() and manifest.get('dtypes') == dataset.dtypes()
+
+# Seeds the dataset with the snapshot at path if it matches the dataset. Returns whether the snapshot was used;
+# otherwise the dataset keeps computing frames on demand
+def load_snapshot(dataset, path=SNAPSHOT_DIR):
+    manifest = read_manifest(path)
+    if not matches(manifest, dataset):
+        return False
+
+    frames = {
+        name: read_frame(os.path.join(path, name), meta)
+        for name, meta in manifest['frames'].items()
+    }
+
+    correlations = Correlations.from_dict(manifest['correlations']) if 'correlations' in manifest else None
+
+    return dataset.seed(frames, manifest['source'], correlations)
+
+# Returns the layout's JSON as the Dash app serves it, built with the dataset as data_processing's shared one
+def layout_json(dataset):
+    # Importing app must not start building a layout of its own
+    os.environ.setdefault('LAYOUT_BUILD', 'request')
+    dp.dataset = dataset
+    import app
+
+    return plotly.io.json.to_json_plotly(app.build_layout())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Precompute every derived frame into a memory-mapped snapshot')
+    parser.add_argument('--db', default=dp.DB_PATH, help='SQLite file with the airline_safety table')
+    parser.add_argument('--out', default=SNAPSHOT_DIR, help='snapshot directory to write')
+    parser.add_argument('--layout', action='store_true', help='also write the dashboard layout, for workers to serve as is')
+    args = parser.parse_args()
+
+    # Same settings as the dashboard, so the snapshot matches its workers. A snapshot holds whole-table frames, which
+    # a streaming dashboard never builds
+    dataset = dp.AirlineDataset(args.db)
+    if dataset.streaming:
+        parser.exit(1, 'AIRLINE_CHUNKSIZE streams the table, whose frames aren\'t snapshotted\n')
+
+    start = time.perf_counter()
+    manifest = write_snapshot(dataset, args.out, (lambda: layout_json(dataset)) if args.layout else None)
+    print('Wrote {} frames to {} in {:.2f}s'.format(len(manifest['frames']), args.out, time.perf_counter() - start))
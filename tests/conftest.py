@@ -0,0 +1,18 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+# A copy of the shipped database that a test may write to
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'airline')
+    shutil.copy(os.path.join(ROOT, 'data', 'airline'), path)
+
+    return path
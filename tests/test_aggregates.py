@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+import data_processing as dp
+from aggregates import AggregateEngine, Comoments
+
+
+# A raw airline_safety row for an airline already in the shipped table, with new counts
+ROW = {
+    'airline': 'Aer Lingus', 'avail_seat_km_per_week': 320906734,
+    'incidents_85_99': 200, 'fatal_accidents_85_99': 0, 'fatalities_85_99': 0,
+    'incidents_00_14': 0, 'fatal_accidents_00_14': 0, 'fatalities_00_14': 0
+}
+
+
+def assert_same_aggregates(engine, expected):
+    assert engine.n == expected.n
+    for col in expected.columns:
+        assert engine.mean(col) == pytest.approx(expected.mean(col), rel=1e-12)
+    for x, y in expected.pairs:
+        assert engine.correlation(x, y) == pytest.approx(expected.correlation(x, y), rel=1e-9)
+
+def test_upsert_updates_period_frames(db_path):
+    dataset = dp.AirlineDataset(db_path, chunksize=0)
+    aggregates = dataset.get_aggregates()
+    dataset.upsert_airline(ROW)
+
+    assert dataset.get_aggregates() is aggregates
+    assert_same_aggregates(aggregates, dp.make_aggregates(dataset.get_data()))
+    period_mean = dataset.get_period_mean_data()
+    assert period_mean.incident_rate.tolist() == [aggregates.mean('incident_rate_85_99'), aggregates.mean('incident_rate_00_14')]
+
+def test_remove_airline(db_path):
+    dataset = dp.AirlineDataset(db_path, chunksize=0)
+    aggregates = dataset.get_aggregates()
+    dataset.remove_airline(ROW['airline'])
+
+    assert aggregates.n == 55
+    assert_same_aggregates(aggregates, dp.make_aggregates(dataset.get_data()))
+
+def test_streamed_engine_rejects_keyed_updates(db_path):
+    dataset = dp.AirlineDataset(db_path, chunksize=10)
+    aggregates = dataset.get_aggregates()
+
+    assert not aggregates.keyed
+    with pytest.raises(ValueError):
+        aggregates.upsert(ROW['airline'], dp.make_record(ROW))
+    with pytest.raises(ValueError):
+        aggregates.remove(ROW['airline'])
+    assert aggregates.n == 56
+
+def test_upsert_after_streaming_replaces_row(db_path):
+    dataset = dp.AirlineDataset(db_path, chunksize=10)
+    aggregates = dataset.get_aggregates()
+    dataset.upsert_airline(ROW)
+
+    assert dataset.get_aggregates() is aggregates
+    assert aggregates.n == 56
+    assert_same_aggregates(aggregates, dp.AirlineDataset(db_path, chunksize=0).get_aggregates())
+
+def test_comoments_correlation_needs_two_pairs():
+    comoments = Comoments()
+    comoments.add(1.0, 2.0)
+    assert np.isnan(comoments.correlation())
+    comoments.add(2.0, 4.0)
+    assert comoments.correlation() == pytest.approx(1.0)
+
+def test_replace_on_keyed_engine_raises():
+    engine = AggregateEngine(['x'])
+    with pytest.raises(ValueError):
+        engine.replace(None, {'x': 1.0})
+
+def test_incomplete_new_row_rolls_back(db_path):
+    dataset = dp.AirlineDataset(db_path, chunksize=0)
+    aggregates = dataset.get_aggregates()
+    with pytest.raises(KeyError):
+        dataset.upsert_airline({'airline': 'New Air', 'incidents_85_99': 5})
+
+    assert dataset.get_airline_record('New Air') is None
+    assert aggregates.n == 56
+
+def test_partial_row_keeps_other_values(db_path):
+    dataset = dp.AirlineDataset(db_path, chunksize=0)
+    before = dataset.get_airline_record(ROW['airline'])
+    aggregates = dataset.get_aggregates()
+    dataset.upsert_airline({'airline': ROW['airline'], 'incidents_85_99': 5})
+
+    after = dataset.get_airline_record(ROW['airline'])
+    assert after['incidents_85_99'] == 5
+    assert after['incidents_00_14'] == before['incidents_00_14']
+    assert_same_aggregates(aggregates, dp.make_aggregates(dataset.get_data()))
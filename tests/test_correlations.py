@@ -0,0 +1,22 @@
+import numpy as np
+
+import data_processing as dp
+from correlations import ComomentMatrix, correlation_matrix
+
+
+def test_comoment_matrix_matches_whole_table():
+    values = np.random.default_rng(0).random((1000, 4))
+    values[5, 2] = np.inf
+    comoments = ComomentMatrix(range(4))
+    for start in range(0, len(values), 64):
+        comoments.add(values[start:start + 64])
+
+    assert comoments.n == 999
+    assert np.allclose(comoments.matrix(), correlation_matrix(values[np.isfinite(values).all(axis=1)]))
+
+def test_streamed_correlations_match_loaded(db_path):
+    loaded = dp.AirlineDataset(db_path, chunksize=0).get_correlations()
+    streamed = dp.AirlineDataset(db_path, chunksize=10, display_rows=20).get_correlations()
+
+    assert streamed.rows == loaded.rows
+    assert np.allclose(streamed.matrix, loaded.matrix, equal_nan=True)
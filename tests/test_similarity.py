@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+
+import data_processing as dp
+from similarity import SimilarityIndex
+
+
+COLUMNS = ['avail_seat_km', 'incident_rate_85_99']
+
+def test_duplicate_airline_resolves_to_last_row():
+    df = pd.DataFrame({
+        'airline': ['A', 'B', 'A', 'C', 'D'],
+        'avail_seat_km': [1.0, 1.0, 1000.0, 1000.0, 10.0],
+        'incident_rate_85_99': [1.0, 1.0, 50.0, 50.0, 10.0]
+    })
+    index = SimilarityIndex.from_values(df.airline, df[COLUMNS].to_numpy(), COLUMNS)
+    records = dp.AirlineRecords(df)
+
+    assert index.position['A'] == records.position['A'] == 2
+    assert index.get_similar_airlines('A', 1) == ['C']
+
+def test_similar_airlines_match_brute_force():
+    rng = np.random.default_rng(0)
+    values = rng.random((200, len(COLUMNS)))
+    airlines = np.array(['airline {}'.format(i) for i in range(len(values))], dtype=object)
+    index = SimilarityIndex.from_values(airlines, values, COLUMNS)
+
+    distances = np.linalg.norm(index.features - index.features[7], axis=1)
+    distances[7] = np.inf
+    assert index.get_similar_airlines('airline 7', 5) == list(airlines[np.argsort(distances)[:5]])
@@ -0,0 +1,25 @@
+import data_processing as dp
+import snapshot
+
+
+def test_snapshot_rebuilds_frames_changed_during_build(db_path, tmp_path):
+    dataset = dp.AirlineDataset(db_path, chunksize=0)
+    get_frames = dataset.get_frames
+    builds = []
+
+    # Another process writes right after the first build read the table
+    def get_frames_then_write():
+        frames = get_frames()
+        if not builds:
+            dp.AirlineDataset(db_path, chunksize=0).upsert_airline({'airline': 'Aer Lingus', 'incidents_85_99': 200})
+        builds.append(frames)
+        return frames
+    dataset.get_frames = get_frames_then_write
+
+    manifest = snapshot.write_snapshot(dataset, str(tmp_path / 'snapshot'))
+
+    assert len(builds) == 2
+    assert manifest['source'] == dataset.source()
+    loaded = dp.AirlineDataset(db_path, chunksize=0)
+    assert snapshot.load_snapshot(loaded, str(tmp_path / 'snapshot'))
+    assert loaded.get_airline_record('Aer Lingus')['incidents_85_99'] == 200